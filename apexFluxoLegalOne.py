@@ -10,7 +10,9 @@ from requests import RequestException
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import app_metrics
 import bd.database as database
+from utils import prioridade_tarefas
 
 
 load_dotenv()
@@ -103,8 +105,10 @@ def make_api_request(url, params=None):
                 params=params or {},
                 timeout=REQUEST_TIMEOUT,
             )
+            app_metrics.LEGAL_ONE_REQUISICOES.inc(status=response.status_code)
 
             if response.status_code == 429:
+                app_metrics.LEGAL_ONE_RATE_LIMIT.inc()
                 espera = _calcular_espera_rate_limit(response)
                 last_error = f"429 Too Many Requests: {response.text[:300]}"
                 logging.warning(
@@ -135,6 +139,8 @@ def make_api_request(url, params=None):
             return response.json()
         except RequestException as exc:
             last_error = exc
+            if getattr(exc, "response", None) is None:
+                app_metrics.LEGAL_ONE_REQUISICOES.inc(status="erro_conexao")
             if tentativa >= REQUEST_RETRIES:
                 raise
 
@@ -272,7 +278,7 @@ def _processar_tipo_tarefa(config):
             if maior_task_id_novo is None or task_id > maior_task_id_novo:
                 maior_task_id_novo = task_id
 
-            task_result = _processar_tarefa(task, litigation_cache)
+            task_result = _processar_tarefa(task, litigation_cache, config)
             if task_result == "error":
                 ciclo_completo = False
                 continue
@@ -344,7 +350,7 @@ def _buscar_pagina_tarefas(type_id, sub_type_id, *, before_id=None):
     params = {
         "$filter": filtro,
         "$expand": "relationships($select=id,linkId,linkType)",
-        "$select": "id,finishedBy,relationships",
+        "$select": "id,finishedBy,creationDate,endDateTime,relationships",
         "$top": PAGE_SIZE,
         "$orderby": "id desc",
     }
@@ -354,7 +360,7 @@ def _buscar_pagina_tarefas(type_id, sub_type_id, *, before_id=None):
     return data.get("value", [])
 
 
-def _processar_tarefa(task, litigation_cache):
+def _processar_tarefa(task, litigation_cache, config):
     task_id = task.get("id")
     solicitante_id = task.get("finishedBy")
 
@@ -390,7 +396,8 @@ def _processar_tarefa(task, litigation_cache):
         )
         return "error"
 
-    insert_result = database.inserir_tarefa_na_fila(task_id, cnj, solicitante_id)
+    prioridade = _calcular_prioridade(task, cnj, config)
+    insert_result = database.inserir_tarefa_na_fila(task_id, cnj, solicitante_id, prioridade)
     if insert_result is None:
         logging.error(
             "❌ [APEX] Erro ao persistir tarefa %s na fila. Cursor será preservado.",
@@ -399,13 +406,31 @@ def _processar_tarefa(task, litigation_cache):
         return "error"
 
     if insert_result:
-        logging.info("➕ [APEX] Nova tarefa na fila: %s (CNJ: %s)", task_id, cnj)
+        logging.info(
+            "➕ [APEX] Nova tarefa na fila: %s (CNJ: %s, prioridade %s)",
+            task_id,
+            cnj,
+            prioridade,
+        )
         return "inserted"
 
     logging.info("↺ [APEX] Tarefa %s já existia na fila. Seguindo coleta.", task_id)
     return "duplicate"
 
 
+def _calcular_prioridade(task, cnj, config):
+    """Peso do tipo + idade no Legal One + prazo mais próximo (tarefa ou subsídios já coletados)."""
+    prazo = prioridade_tarefas.prazo_mais_proximo(
+        [task.get("endDateTime"), *database.buscar_prazos_subsidios_solicitados(cnj)]
+    )
+    return prioridade_tarefas.calcular_prioridade(
+        config["typeId"],
+        config["subTypeId"],
+        criada_em=task.get("creationDate"),
+        prazo=prazo,
+    )
+
+
 def _extrair_litigation_id(relationships):
     for relationship in relationships or []:
         if relationship.get("linkType") == "Litigation":
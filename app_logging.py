@@ -1,37 +1,429 @@
+import atexit
+import gzip
+import json
 import logging
+import logging.handlers
+import multiprocessing
 import os
+import queue
+import shutil
 import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
 
 
-def build_logging_handlers(log_path, *, service):
+def _env_int(name, default):
     try:
-        sys.stdout.reconfigure(encoding="utf-8", errors="replace")
-    except Exception:
-        pass
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
 
-    handlers = [
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(log_path, encoding="utf-8"),
-    ]
 
+def _env_float(name, default):
     try:
-        import logging_loki
-    except ImportError:
-        return handlers, False
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+class JsonLineFormatter(logging.Formatter):
+    """Um objeto JSON por linha, para ingestão estruturada dos arquivos."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "process": record.processName,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class CompressingRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """Arquivo de log com rotação por tamanho e por dia.
+
+    O segmento rotacionado é renomeado com timestamp e comprimido em gzip
+    num thread de fundo (o thread que loga só faz o rename). Depois de cada
+    compressão, segmentos antigos são apagados até respeitar a quantidade
+    máxima e o total em disco.
+    """
+
+    def __init__(
+        self,
+        filename,
+        *,
+        max_bytes=50 * 1024 * 1024,
+        rotate_daily=True,
+        backup_count=14,
+        max_total_bytes=500 * 1024 * 1024,
+        compress=True,
+        encoding="utf-8",
+    ):
+        super().__init__(filename, "a", encoding=encoding, delay=False)
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.backup_count = backup_count
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self._next_rollover_at = self._calcular_proxima_virada()
+        self._pendentes = queue.Queue()
+        self._compressor = threading.Thread(
+            target=self._comprimir_em_background,
+            name="log-gzip",
+            daemon=True,
+        )
+        self._compressor.start()
+        self._retomar_segmentos_pendentes()
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.rotate_daily and time.time() >= self._next_rollover_at:
+            return True
+        if self.max_bytes > 0:
+            self.stream.seek(0, 2)
+            if self.stream.tell() >= self.max_bytes:
+                return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        origem = Path(self.baseFilename)
+        if origem.exists() and origem.stat().st_size > 0:
+            destino = self._nome_segmento(origem)
+            try:
+                os.replace(origem, destino)
+                self._pendentes.put(destino)
+            except OSError as exc:
+                sys.stderr.write(f"⚠️ Falha ao rotacionar {origem}: {exc}\n")
+
+        self._next_rollover_at = self._calcular_proxima_virada()
+        self.stream = self._open()
+
+    def close(self):
+        self._pendentes.put(None)
+        super().close()
+
+    def _nome_segmento(self, origem):
+        carimbo = datetime.now().strftime("%Y%m%d-%H%M%S")
+        destino = origem.with_name(f"{origem.name}.{carimbo}")
+        sufixo = 1
+        while destino.exists() or Path(f"{destino}.gz").exists():
+            destino = origem.with_name(f"{origem.name}.{carimbo}-{sufixo}")
+            sufixo += 1
+        return destino
+
+    def _retomar_segmentos_pendentes(self):
+        # Segmentos que ficaram sem compactar porque o processo saiu antes
+        # do thread de fundo terminar.
+        base = Path(self.baseFilename)
+        for caminho in base.parent.glob(f"{base.name}.*"):
+            if caminho.name.endswith(".gz.tmp"):
+                caminho.unlink(missing_ok=True)
+            elif not caminho.name.endswith(".gz"):
+                self._pendentes.put(caminho)
+
+    def _calcular_proxima_virada(self):
+        amanha = datetime.now().date() + timedelta(days=1)
+        return datetime.combine(amanha, datetime.min.time()).timestamp()
+
+    def _comprimir_em_background(self):
+        while True:
+            segmento = self._pendentes.get()
+            if segmento is None:
+                return
+            try:
+                if self.compress:
+                    self._comprimir(segmento)
+                self._aplicar_retencao()
+            except Exception as exc:
+                sys.stderr.write(f"⚠️ Falha ao compactar {segmento}: {exc}\n")
+
+    @staticmethod
+    def _comprimir(segmento):
+        temporario = Path(f"{segmento}.gz.tmp")
+        with open(segmento, "rb") as origem, gzip.open(temporario, "wb", compresslevel=6) as destino:
+            shutil.copyfileobj(origem, destino, 1024 * 1024)
+        os.replace(temporario, f"{segmento}.gz")
+        os.remove(segmento)
+
+    def _aplicar_retencao(self):
+        base = Path(self.baseFilename)
+        segmentos = sorted(
+            (
+                caminho
+                for caminho in base.parent.glob(f"{base.name}.*")
+                if not caminho.name.endswith(".tmp")
+            ),
+            key=lambda caminho: caminho.stat().st_mtime,
+            reverse=True,
+        )
+
+        total = 0
+        for indice, caminho in enumerate(segmentos):
+            total += caminho.stat().st_size
+            excedeu_quantidade = self.backup_count > 0 and indice >= self.backup_count
+            excedeu_tamanho = self.max_total_bytes > 0 and total > self.max_total_bytes
+            if excedeu_quantidade or excedeu_tamanho:
+                try:
+                    caminho.unlink()
+                except OSError:
+                    pass
+
+
+def _caminho_por_processo(log_path):
+    # Workers do pool (spawn) reexecutam a configuração de logging do
+    # entry point; cada processo precisa do próprio arquivo, senão vários
+    # processos rotacionariam o mesmo arquivo ao mesmo tempo.
+    if multiprocessing.parent_process() is None:
+        return log_path
+    caminho = Path(log_path)
+    nome = multiprocessing.current_process().name.replace(os.sep, "_")
+    return str(caminho.with_name(f"{caminho.stem}.{nome}{caminho.suffix}"))
+
+
+def _build_file_handler(log_path, service):
+    handler = CompressingRotatingFileHandler(
+        _caminho_por_processo(log_path),
+        max_bytes=_env_int("LOG_FILE_MAX_MB", 50) * 1024 * 1024,
+        rotate_daily=_env_flag("LOG_FILE_ROTATE_DAILY", True),
+        backup_count=_env_int("LOG_FILE_BACKUP_COUNT", 14),
+        max_total_bytes=_env_int("LOG_FILE_MAX_TOTAL_MB", 500) * 1024 * 1024,
+        compress=_env_flag("LOG_FILE_COMPRESS", True),
+    )
+    if os.getenv("LOG_FORMAT", "text").strip().lower() == "json":
+        handler.setFormatter(JsonLineFormatter(service))
+    return handler
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (e conta) registros quando a fila enche.
+
+    O thread que loga nunca espera o Loki: se o listener ficar para trás, o
+    registro é descartado em vez de bloquear o loop de scraping.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _DrainingQueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Com a fila cheia, put_nowait falharia no shutdown; espera o
+        # listener abrir espaço para drenar o que já foi enfileirado.
+        self.queue.put(self._sentinel)
 
+
+class LokiBatchHandler(logging.Handler):
+    """Acumula registros e envia à API de push do Loki em lotes.
+
+    Só roda no thread do QueueListener e no thread de flush periódico; o
+    envio HTTP nunca acontece no thread que gerou o log. Lotes que falham
+    são descartados e contados, para o buffer não crescer sem limite com o
+    Loki fora do ar.
+    """
+
+    def __init__(self, url, tags, *, batch_size=200, flush_interval=2.0, timeout=5.0):
+        super().__init__()
+        import requests
+
+        self.url = url
+        self.tags = dict(tags)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.1, flush_interval)
+        self.timeout = timeout
+        self.dropped = 0
+        self._session = requests.Session()
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._push_lock = threading.Lock()
+        self._last_error_report = 0.0
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodicamente,
+            name="loki-flush",
+            daemon=True,
+        )
+        self._flusher.start()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        entry = (
+            record.levelname.lower(),
+            record.name,
+            str(int(record.created * 1_000_000_000)),
+            line,
+        )
+        with self._buffer_lock:
+            self._buffer.append(entry)
+            cheio = len(self._buffer) >= self.batch_size
+        if cheio:
+            self.flush()
+
+    def flush(self):
+        with self._buffer_lock:
+            lote, self._buffer = self._buffer, []
+        if not lote:
+            return
+
+        with self._push_lock:
+            try:
+                response = self._session.post(
+                    self.url,
+                    json=self._payload(lote),
+                    timeout=self.timeout,
+                )
+                if response.status_code >= 300:
+                    raise RuntimeError(f"status={response.status_code} body={response.text[:200]}")
+            except Exception as exc:
+                self.dropped += len(lote)
+                self._reportar_falha(exc, len(lote))
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        finally:
+            self._session.close()
+            super().close()
+
+    def _payload(self, lote):
+        streams = {}
+        for severity, logger_name, timestamp, line in lote:
+            streams.setdefault((severity, logger_name), []).append([timestamp, line])
+        return {
+            "streams": [
+                {
+                    "stream": {**self.tags, "severity": severity, "logger": logger_name},
+                    "values": values,
+                }
+                for (severity, logger_name), values in streams.items()
+            ]
+        }
+
+    def _flush_periodicamente(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _reportar_falha(self, exc, quantidade):
+        # Não usa logging aqui: o erro voltaria para este mesmo handler.
+        agora = time.monotonic()
+        if agora - self._last_error_report < 60:
+            return
+        self._last_error_report = agora
+        sys.stderr.write(
+            f"⚠️ Falha ao enviar {quantidade} log(s) ao Loki "
+            f"(total descartado: {self.dropped}): {exc}\n"
+        )
+
+
+_pipeline_lock = threading.Lock()
+_pipelines = []
+
+
+def loki_registros_descartados():
+    """Total de registros descartados (fila cheia + lotes que falharam)."""
+    with _pipeline_lock:
+        return sum(
+            queue_handler.dropped + loki_handler.dropped
+            for queue_handler, _, loki_handler in _pipelines
+        )
+
+
+def _encerrar_pipelines():
+    with _pipeline_lock:
+        pipelines = list(_pipelines)
+        _pipelines.clear()
+    for _, listener, loki_handler in pipelines:
+        try:
+            listener.stop()
+        finally:
+            loki_handler.close()
+
+
+def _build_loki_handler(service):
     loki_url = os.getenv("LOKI_URL", "http://localhost:3100/loki/api/v1/push").strip()
     if not loki_url:
-        return handlers, False
+        return None
 
-    handlers.append(
-        logging_loki.LokiHandler(
-            url=loki_url,
-            tags={
+    try:
+        loki_handler = LokiBatchHandler(
+            loki_url,
+            {
                 "application": os.getenv("LOKI_APPLICATION", "onesid-apex"),
                 "service": service,
                 "environment": os.getenv("APP_ENV", "local"),
             },
-            version="1",
+            batch_size=_env_int("LOKI_BATCH_SIZE", 200),
+            flush_interval=_env_float("LOKI_FLUSH_INTERVAL_SECONDS", 2.0),
+            timeout=_env_float("LOKI_PUSH_TIMEOUT_SECONDS", 5.0),
         )
-    )
+    except ImportError:
+        return None
+
+    log_queue = queue.Queue(maxsize=max(1, _env_int("LOKI_QUEUE_MAX_RECORDS", 10000)))
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = _DrainingQueueListener(log_queue, loki_handler)
+    listener.start()
+
+    with _pipeline_lock:
+        if not _pipelines:
+            # Registrado depois do logging: roda antes de logging.shutdown e
+            # drena a fila antes de o processo sair.
+            atexit.register(_encerrar_pipelines)
+        _pipelines.append((queue_handler, listener, loki_handler))
+    return queue_handler
+
+
+def build_logging_handlers(log_path, *, service):
+    try:
+        sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+    except Exception:
+        pass
+
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        _build_file_handler(log_path, service),
+    ]
+
+    loki_handler = _build_loki_handler(service)
+    if loki_handler is None:
+        return handlers, False
+
+    handlers.append(loki_handler)
     return handlers, True
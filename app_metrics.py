@@ -0,0 +1,402 @@
+import logging
+import os
+import threading
+import time
+
+
+DEFAULT_PORTS = {
+    "processador": 9101,
+    "monitor": 9102,
+    "coletor": 9103,
+    "broker": 9104,
+}
+# Workers de um pool expõem base + índice (1..9): faixa própria por robô,
+# fora das portas dos supervisores acima.
+DEFAULT_WORKER_PORT_BASES = {
+    "processador": 9110,
+    "monitor": 9120,
+    "coletor": 9130,
+    "broker": 9140,
+}
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'),
+        )
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Gauge com valor fixo (`set`) ou calculado na hora do scrape (`callback`).
+
+    O callback devolve um número ou um dict {tupla_de_labels: valor} e é
+    cacheado por `cache_seconds` para um scrape não virar carga no banco.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), *, callback=None, cache_seconds=15):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+        self.cache_seconds = cache_seconds
+        self._cached_at = 0.0
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _refresh(self):
+        if self.callback is None:
+            return
+        agora = time.monotonic()
+        if agora - self._cached_at < self.cache_seconds:
+            return
+        self._cached_at = agora
+        try:
+            result = self.callback()
+        except Exception as exc:
+            logging.debug("Callback da métrica %s falhou: %s", self.name, exc)
+            return
+        if result is None:
+            return
+        if not isinstance(result, dict):
+            result = {(): result}
+        with self._lock:
+            self._values = {
+                tuple(str(part) for part in (key if isinstance(key, tuple) else (key,))): value
+                for key, value in result.items()
+            }
+
+    def _samples(self):
+        self._refresh()
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), *, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def _samples(self):
+        with self._lock:
+            items = [
+                (key, list(series["counts"]), series["sum"], series["count"])
+                for key, series in self._series.items()
+            ]
+        lines = []
+        for key, counts, total, count in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), **kwargs):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, **kwargs))
+
+
+def histogram(name, documentation, labelnames=(), **kwargs):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, **kwargs))
+
+
+# --- Métricas compartilhadas pelos robôs ---
+
+TAREFAS_PROCESSADAS = counter(
+    "onesid_tarefas_processadas_total",
+    "Tarefas/processos concluídos pelo robô, por resultado.",
+    ("robo", "resultado"),
+)
+CICLO_DURACAO = histogram(
+    "onesid_ciclo_duracao_segundos",
+    "Duração dos ciclos agendados.",
+    ("robo",),
+    buckets=(5, 15, 30, 60, 120, 300, 600, 900, 1800, 3600),
+)
+ETAPA_DURACAO = histogram(
+    "onesid_etapa_duracao_segundos",
+    "Latência por etapa do pipeline do portal (rpa.timing).",
+    ("etapa", "sucesso"),
+)
+BROWSER_RESTARTS = counter(
+    "onesid_browser_restarts_total",
+    "Reinícios de browser pedidos pelos runners.",
+    ("robo", "motivo"),
+)
+TAREFAS_PRAZO_ESTOURADO = counter(
+    "onesid_tarefas_prazo_estourado_total",
+    "Tarefas abortadas pelo watchdog de prazo, por estágio da escalada.",
+    ("robo", "estagio"),
+)
+LEGAL_ONE_REQUISICOES = counter(
+    "onesid_legalone_requisicoes_total",
+    "Requisições HTTP à API do Legal One, por status.",
+    ("status",),
+)
+LEGAL_ONE_RATE_LIMIT = counter(
+    "onesid_legalone_429_total",
+    "Respostas 429 (rate limit) da API do Legal One.",
+)
+
+
+def _contar_tarefas_abertas():
+    from bd import database
+
+    return database.contar_tarefas_abertas()
+
+
+def _contar_notificacoes_pendentes():
+    from bd import database
+
+    return database.contar_notificacoes_twotask_por_status()
+
+
+def _contar_logs_descartados():
+    import app_logging
+
+    return app_logging.loki_registros_descartados()
+
+
+def _amostrar_chrome():
+    """Soma processos e RSS dos Chromes vivos lendo /proc (só Linux)."""
+    if not os.path.isdir("/proc"):
+        return None
+
+    processos = 0
+    rss_bytes = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as fp:
+                cmdline = fp.read()
+            if b"chrome" not in cmdline.split(b"\0", 1)[0].lower():
+                continue
+            with open(f"/proc/{entry}/statm", "r", encoding="ascii") as fp:
+                rss_pages = int(fp.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        processos += 1
+        rss_bytes += rss_pages * page_size
+    return {"processos": processos, "rss_bytes": rss_bytes}
+
+
+_chrome_cache = {"at": 0.0, "value": None}
+_chrome_lock = threading.Lock()
+
+
+def _chrome_stat(campo):
+    def callback():
+        with _chrome_lock:
+            agora = time.monotonic()
+            if agora - _chrome_cache["at"] >= 5:
+                _chrome_cache["value"] = _amostrar_chrome()
+                _chrome_cache["at"] = agora
+            valor = _chrome_cache["value"]
+        return valor[campo] if valor else None
+
+    return callback
+
+
+FILA_TAREFAS = gauge(
+    "onesid_fila_tarefas",
+    "Tarefas abertas em tarefas_legal_one, por status.",
+    ("status",),
+    callback=_contar_tarefas_abertas,
+)
+NOTIFICACOES_PENDENTES = gauge(
+    "onesid_notificacoes_pendentes",
+    "Notificações TwoTask ainda não enviadas, por status.",
+    ("status",),
+    callback=_contar_notificacoes_pendentes,
+)
+CHROME_PROCESSOS = gauge(
+    "onesid_chrome_processos",
+    "Processos Chrome/chromedriver vivos no container.",
+    callback=_chrome_stat("processos"),
+    cache_seconds=0,
+)
+CHROME_RSS = gauge(
+    "onesid_chrome_rss_bytes",
+    "RSS somado dos processos Chrome/chromedriver vivos no container.",
+    callback=_chrome_stat("rss_bytes"),
+    cache_seconds=0,
+)
+
+
+LOKI_DESCARTADOS = gauge(
+    "onesid_loki_registros_descartados",
+    "Registros de log descartados no envio ao Loki desde o início do processo.",
+    callback=_contar_logs_descartados,
+    cache_seconds=0,
+)
+
+
+def _observar_etapa(etapa, segundos, sucesso):
+    ETAPA_DURACAO.observe(segundos, etapa=etapa, sucesso="true" if sucesso else "false")
+
+
+def iniciar_servidor(service, *, port=None):
+    """Sobe `/metrics` numa thread daemon. Devolve a porta ou None se desabilitado."""
+    if not _env_flag("METRICS_ENABLED", True):
+        return None
+
+    if port is None:
+        port = int(os.getenv("METRICS_PORT") or DEFAULT_PORTS.get(service, 9100))
+    host = os.getenv("METRICS_HOST", "0.0.0.0")
+
+    try:
+        from flask import Flask, Response
+        from werkzeug.serving import make_server
+    except ImportError:
+        logging.warning("⚠️ Flask indisponível. Endpoint /metrics desabilitado.")
+        return None
+
+    try:
+        from rpa import timing
+
+        timing.registrar_observador(_observar_etapa)
+    except ImportError:
+        pass
+
+    app = Flask(f"onesid-metrics-{service}")
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    try:
+        server = make_server(host, port, app, threaded=True)
+    except OSError as exc:
+        logging.warning("⚠️ Não foi possível abrir /metrics em %s:%s: %s", host, port, exc)
+        return None
+
+    thread = threading.Thread(
+        target=server.serve_forever,
+        name=f"metrics-{service}",
+        daemon=True,
+    )
+    thread.start()
+    logging.info("📈 Métricas de %s expostas em http://%s:%s/metrics", service, host, port)
+    return port
@@ -1,9 +1,13 @@
 import os
 import logging
 import hashlib
+from datetime import date
 import psycopg2
+from psycopg2.extras import Json, execute_values
 from dotenv import load_dotenv
 
+from utils.subsidio_matching import IndiceSubsidios, chave_subsidio_exata
+
 load_dotenv()
 
 DB_HOST = os.getenv("DB_HOST", "localhost")
@@ -13,10 +17,49 @@ DB_PASS = os.getenv("DB_PASS", "postgres")
 DB_PORT = os.getenv("DB_PORT", "5432")
 SCHEMA_INIT_LOCK_ID = 6012026041501
 TASK_ERROR_RETRY_BACKOFF_MINUTES = int(os.getenv("RPA_TASK_ERROR_RETRY_BACKOFF_MINUTES", "120"))
+TASK_ERROR_RETRY_BACKOFF_MAX_MINUTES = int(
+    os.getenv("RPA_TASK_ERROR_RETRY_BACKOFF_MAX_MINUTES", "1440")
+)
+TASK_ERROR_RETRY_JITTER = float(os.getenv("RPA_TASK_ERROR_RETRY_JITTER", "0.25"))
+# Base do backoff por classe de erro (minutos); dobra a cada falha da tarefa.
+# Classes fora daqui usam RPA_TASK_ERROR_RETRY_BACKOFF_MINUTES.
+TASK_RETRY_BACKOFF_BASE_MINUTES = {
+    "transitorio": int(os.getenv("RPA_TASK_RETRY_BACKOFF_TRANSIENT_MINUTES", "10")),
+    "login": int(os.getenv("RPA_TASK_RETRY_BACKOFF_LOGIN_MINUTES", "30")),
+    "estrutural": int(os.getenv("RPA_TASK_RETRY_BACKOFF_STRUCTURAL_MINUTES", "240")),
+}
 TASK_MAX_ERROR_RETRIES = int(os.getenv("RPA_TASK_MAX_ERROR_RETRIES", "3"))
+# Envelhecimento da fila de tarefas: cada ponto de prioridade adianta a
+# tarefa este tanto de minutos em relação a quem entrou no mesmo instante.
+TASK_PRIORITY_MINUTES_PER_POINT = float(os.getenv("RPA_TASK_PRIORITY_MINUTES_PER_POINT", "2"))
 MONITOR_FAILURE_BACKOFF_MINUTES = int(
     os.getenv("RPA_MONITOR_FAILURE_BACKOFF_MINUTES", "120")
 )
+MONITOR_FAILURE_BACKOFF_MAX_MINUTES = int(
+    os.getenv("RPA_MONITOR_FAILURE_BACKOFF_MAX_MINUTES", "1440")
+)
+MONITOR_INITIAL_CHECK_MINUTES = int(os.getenv("RPA_MONITOR_INITIAL_CHECK_MINUTES", "30"))
+MONITOR_CLAIM_LEASE_MINUTES = int(os.getenv("RPA_MONITOR_CLAIM_LEASE_MINUTES", "30"))
+# Janela de frescor: processo coletado por qualquer robô há menos que isto
+# não é visitado de novo no portal (processador, monitor e reconciliação).
+COLETA_FRESCOR_MINUTES = int(os.getenv("RPA_SCRAPE_FRESHNESS_MINUTES", "30"))
+NOTIFICATION_RETRY_BACKOFF_SECONDS = int(os.getenv("API_NOTIFICACAO_RETRY_BACKOFF_SECONDS", "60"))
+NOTIFICATION_RETRY_BACKOFF_MAX_SECONDS = int(
+    os.getenv("API_NOTIFICACAO_RETRY_BACKOFF_MAX_SECONDS", "3600")
+)
+NOTIFICATION_CHANNEL = "twotask_notificacoes"
+# Processador -> monitor: processo recém-colocado em monitoramento
+MONITOR_CHANNEL = "monitor_processos"
+# Broker de browsers: coleta nova na fila / coleta finalizada
+COLETAS_FILA_CHANNEL = "coletas_portal_fila"
+COLETAS_RESULTADO_CHANNEL = "coletas_portal_resultado"
+# Arquivamento das filas: linhas terminais saem das tabelas quentes depois
+# da retenção, em lotes, para as tabelas *_arquivo (particionadas por mês).
+ARCHIVE_RETENTION_DAYS = int(os.getenv("RPA_ARCHIVE_RETENTION_DAYS", "7"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("RPA_ARCHIVE_BATCH_SIZE", "1000"))
+# Histórico de observabilidade (tempos_etapas, monitor_ciclos) é apagado,
+# não arquivado. 0 desliga.
+HISTORY_RETENTION_DAYS = int(os.getenv("RPA_HISTORY_RETENTION_DAYS", "30"))
 TASK_OPEN_STATUSES = ("PENDENTE", "ERRO")
 TASK_DUPLICATE_STATUS = "DUPLICADO"
 
@@ -86,6 +129,41 @@ def inicializar_banco():
             ON processos (data_atualizacao, id)
             WHERE em_monitoramento = TRUE;
         """)
+        # Agenda adaptativa do monitor (rpa.monitor_scheduler): cada processo
+        # tem sua próxima verificação e um histórico de mudanças.
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS monitoramento_proxima_verificacao TIMESTAMP;")
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS monitoramento_verificacoes INTEGER DEFAULT 0;")
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS monitoramento_mudancas INTEGER DEFAULT 0;")
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS monitoramento_ultima_mudanca TIMESTAMP;")
+        # Impressão digital da última lista coletada (calcular_fingerprint_subsidios)
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS subsidios_hash VARCHAR(64);")
+        # Momento da última coleta no portal (qualquer robô), para a janela de frescor
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS ultima_coleta_em TIMESTAMP;")
+        cur.execute(
+            """
+            UPDATE processos
+            SET monitoramento_proxima_verificacao = CASE
+                    WHEN COALESCE(monitoramento_falhas, 0) > 0 AND monitoramento_ultima_falha IS NOT NULL
+                        THEN monitoramento_ultima_falha + (%s * INTERVAL '1 minute')
+                    ELSE COALESCE(data_atualizacao, CURRENT_TIMESTAMP)
+                END
+            WHERE em_monitoramento = TRUE
+              AND monitoramento_proxima_verificacao IS NULL;
+            """,
+            (MONITOR_FAILURE_BACKOFF_MINUTES,),
+        )
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_processos_monitoramento_agenda
+            ON processos (monitoramento_proxima_verificacao, id)
+            WHERE em_monitoramento = TRUE;
+        """)
+        # Fila prioritária: primeira verificação de processos recém-marcados
+        cur.execute("ALTER TABLE processos ADD COLUMN IF NOT EXISTS monitoramento_prioritario BOOLEAN NOT NULL DEFAULT FALSE;")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_processos_monitoramento_prioritario
+            ON processos (id)
+            WHERE em_monitoramento = TRUE AND monitoramento_prioritario = TRUE;
+        """)
 
         # Tabela Subsídios
         cur.execute("""
@@ -128,6 +206,37 @@ def inicializar_banco():
         cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS tentativas INTEGER DEFAULT 0;")
         cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS ultimo_erro TEXT;")
         cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS ultima_tentativa TIMESTAMP;")
+        # Reserva (lease) de tarefas para workers paralelos do processador
+        cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS reservada_por VARCHAR(100);")
+        cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS reservada_ate TIMESTAMP;")
+        # Fila por prioridade: `prioridade` vem da ingestão (tipo, idade e prazo);
+        # `ordem_fila` = entrada na fila - prioridade x minutos por ponto. Ordenar
+        # por ela dá a prioridade com envelhecimento e usa índice.
+        cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS prioridade INTEGER NOT NULL DEFAULT 0;")
+        cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS ordem_fila TIMESTAMP DEFAULT CURRENT_TIMESTAMP;")
+        cur.execute("UPDATE tarefas_legal_one SET ordem_fila = data_criacao WHERE ordem_fila IS NULL;")
+        # Retry agendado por tarefa: NULL em ERRO = tentativas esgotadas.
+        cur.execute("ALTER TABLE tarefas_legal_one ADD COLUMN IF NOT EXISTS proxima_tentativa TIMESTAMP;")
+        cur.execute(
+            """
+            UPDATE tarefas_legal_one
+            SET proxima_tentativa = COALESCE(ultima_tentativa, CURRENT_TIMESTAMP) + (%s * INTERVAL '1 minute')
+            WHERE status = 'ERRO'
+              AND proxima_tentativa IS NULL
+              AND COALESCE(tentativas, 0) < %s;
+            """,
+            (TASK_ERROR_RETRY_BACKOFF_MINUTES, TASK_MAX_ERROR_RETRIES),
+        )
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tarefas_legal_one_proxima_tentativa
+            ON tarefas_legal_one (proxima_tentativa)
+            WHERE status = 'ERRO';
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tarefas_legal_one_ordem_fila
+            ON tarefas_legal_one (ordem_fila, id)
+            WHERE status IN ('PENDENTE', 'ERRO');
+        """)
 
         cur.execute("""
             WITH ranked AS (
@@ -192,6 +301,153 @@ def inicializar_banco():
             CREATE INDEX IF NOT EXISTS idx_twotask_notificacoes_status
             ON twotask_notificacoes (status, data_atualizacao);
         """)
+        # Outbox assíncrono: backoff por linha entre tentativas de envio
+        cur.execute("ALTER TABLE twotask_notificacoes ADD COLUMN IF NOT EXISTS proxima_tentativa TIMESTAMP;")
+        # Lote coalescido ao qual a linha foi atribuída: retries reenviam o
+        # mesmo conjunto com a mesma chave de idempotência.
+        cur.execute("ALTER TABLE twotask_notificacoes ADD COLUMN IF NOT EXISTS lote_envio VARCHAR(64);")
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_twotask_notificacoes_lote_envio
+            ON twotask_notificacoes (lote_envio)
+            WHERE lote_envio IS NOT NULL;
+        """)
+
+        # Tempos por etapa do pipeline do portal (rpa.timing)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tempos_etapas (
+                id BIGSERIAL PRIMARY KEY,
+                robo VARCHAR(30) NOT NULL,
+                referencia VARCHAR(50),
+                tarefa_id BIGINT,
+                etapa VARCHAR(80) NOT NULL,
+                duracao_ms INTEGER NOT NULL,
+                sucesso BOOLEAN DEFAULT TRUE,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tempos_etapas_etapa_data
+            ON tempos_etapas (etapa, criado_em);
+        """)
+
+        # Fila do broker de browsers (broker_rpa.py): processador e monitor
+        # pedem coletas; o broker executa nos browsers dele e devolve o
+        # resultado na própria linha, que o cliente apaga após ler.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS coletas_portal (
+                id BIGSERIAL PRIMARY KEY,
+                origem VARCHAR(30) NOT NULL,
+                cnj VARCHAR(50) NOT NULL,
+                parametros JSONB NOT NULL DEFAULT '{}'::jsonb,
+                status VARCHAR(20) NOT NULL DEFAULT 'PENDENTE',
+                reservada_por VARCHAR(100),
+                reservada_ate TIMESTAMP,
+                resultado JSONB,
+                erro_tipo VARCHAR(60),
+                erro TEXT,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_coletas_portal_fila
+            ON coletas_portal (id)
+            WHERE status IN ('PENDENTE', 'EXECUTANDO');
+        """)
+
+        # Progresso de cada ciclo do monitor sob o orçamento de tempo
+        # (rpa.monitor_budget); a última duração média semeia o próximo start.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS monitor_ciclos (
+                id BIGSERIAL PRIMARY KEY,
+                iniciado_em TIMESTAMP NOT NULL,
+                duracao_ms INTEGER NOT NULL,
+                orcamento_segundos INTEGER NOT NULL,
+                lote_alvo INTEGER NOT NULL,
+                reservados INTEGER NOT NULL,
+                processados INTEGER NOT NULL,
+                reconciliados INTEGER NOT NULL DEFAULT 0,
+                vencidos_restantes INTEGER,
+                duracao_media_ms INTEGER NOT NULL,
+                motivo_parada VARCHAR(30) NOT NULL,
+                criado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+        # Arquivo das filas (particionado por mês de arquivamento; as
+        # partições são criadas por `_garantir_particoes_arquivo`).
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tarefas_legal_one_arquivo (
+                id INTEGER NOT NULL,
+                tarefa_id BIGINT NOT NULL,
+                processo_cnj VARCHAR(50),
+                solicitante_id VARCHAR(50),
+                status VARCHAR(20),
+                tentativas INTEGER,
+                ultimo_erro TEXT,
+                prioridade INTEGER,
+                data_criacao TIMESTAMP,
+                data_conclusao TIMESTAMP,
+                ultima_tentativa TIMESTAMP,
+                arquivada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            ) PARTITION BY RANGE (arquivada_em);
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tarefas_legal_one_arquivo_tarefa_id
+            ON tarefas_legal_one_arquivo (tarefa_id);
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS twotask_notificacoes_arquivo (
+                id INTEGER NOT NULL,
+                dedupe_key VARCHAR(64) NOT NULL,
+                numero_processo VARCHAR(50),
+                id_responsavel BIGINT,
+                observacao TEXT,
+                status VARCHAR(20),
+                tentativas INTEGER,
+                ultimo_erro TEXT,
+                data_criacao TIMESTAMP,
+                data_envio TIMESTAMP,
+                data_atualizacao TIMESTAMP,
+                arquivada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            ) PARTITION BY RANGE (arquivada_em);
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_twotask_notificacoes_arquivo_dedupe_key
+            ON twotask_notificacoes_arquivo (dedupe_key);
+        """)
+        _garantir_particoes_arquivo(cur)
+
+        # Dead letter: tarefas que esgotaram RPA_TASK_MAX_ERROR_RETRIES.
+        # Saem da fila (liberando o índice de abertas do CNJ/solicitante) e
+        # voltam só por `reenfileirar_dead_letter`.
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS tarefas_legal_one_dead_letter (
+                tarefa_id BIGINT PRIMARY KEY,
+                processo_cnj VARCHAR(50),
+                solicitante_id VARCHAR(50),
+                tentativas INTEGER,
+                ultimo_erro TEXT,
+                prioridade INTEGER,
+                data_criacao TIMESTAMP,
+                ultima_tentativa TIMESTAMP,
+                movida_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+
+        # Cache compartilhado de sessões do OneLog (processador, monitor e
+        # browsers reiniciados reaproveitam cookies antes de pedir login novo)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS onelog_sessoes_cache (
+                chave VARCHAR(100) PRIMARY KEY,
+                cookies JSONB NOT NULL,
+                user_agent TEXT,
+                setor TEXT,
+                versao INTEGER DEFAULT 1,
+                expira_em TIMESTAMP NOT NULL,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
         
         conn.commit()
         logging.info("✅ Banco verificado (Schema Monitoramento + Data Limite OK).")
@@ -205,7 +461,7 @@ def inicializar_banco():
 
 # --- FUNÇÕES DE FILA ---
 
-def inserir_tarefa_na_fila(tarefa_id, cnj, solicitante_id):
+def inserir_tarefa_na_fila(tarefa_id, cnj, solicitante_id, prioridade=0):
     conn = get_connection()
     if not conn: return False
     cur = None
@@ -217,8 +473,11 @@ def inserir_tarefa_na_fila(tarefa_id, cnj, solicitante_id):
             (f"{cnj}|{solicitante_id_normalizado or ''}",),
         )
         cur.execute("""
-            INSERT INTO tarefas_legal_one (tarefa_id, processo_cnj, solicitante_id, status)
-            SELECT %s, %s, %s, 'PENDENTE'
+            INSERT INTO tarefas_legal_one (
+                tarefa_id, processo_cnj, solicitante_id, status, prioridade, ordem_fila
+            )
+            SELECT %s, %s, %s, 'PENDENTE', %s,
+                   CURRENT_TIMESTAMP - (%s * %s * INTERVAL '1 minute')
             WHERE NOT EXISTS (
                 SELECT 1
                 FROM tarefas_legal_one
@@ -227,7 +486,16 @@ def inserir_tarefa_na_fila(tarefa_id, cnj, solicitante_id):
                   AND status IN ('PENDENTE', 'ERRO')
             )
             ON CONFLICT (tarefa_id) DO NOTHING;
-        """, (tarefa_id, cnj, solicitante_id_normalizado, cnj, solicitante_id_normalizado))
+        """, (
+            tarefa_id,
+            cnj,
+            solicitante_id_normalizado,
+            prioridade,
+            prioridade,
+            TASK_PRIORITY_MINUTES_PER_POINT,
+            cnj,
+            solicitante_id_normalizado,
+        ))
         rows = cur.rowcount
         conn.commit()
         return True if rows > 0 else False
@@ -247,9 +515,17 @@ def tarefa_ja_na_fila(tarefa_id):
     cur = None
     try:
         cur = conn.cursor()
+        # Arquivadas e dead letter também contam: a tarefa já passou pela fila.
         cur.execute(
-            "SELECT 1 FROM tarefas_legal_one WHERE tarefa_id = %s LIMIT 1",
-            (tarefa_id,),
+            """
+            SELECT 1 FROM tarefas_legal_one WHERE tarefa_id = %s
+            UNION ALL
+            SELECT 1 FROM tarefas_legal_one_dead_letter WHERE tarefa_id = %s
+            UNION ALL
+            SELECT 1 FROM tarefas_legal_one_arquivo WHERE tarefa_id = %s
+            LIMIT 1
+            """,
+            (tarefa_id, tarefa_id, tarefa_id),
         )
         return cur.fetchone() is not None
     except Exception as e:
@@ -283,6 +559,31 @@ def tarefa_esta_aberta(tarefa_id):
         conn.close()
 
 
+def filtrar_tarefas_abertas(tarefa_ids):
+    """Retorna o subconjunto de `tarefa_ids` ainda aberto, numa consulta só."""
+    if not tarefa_ids:
+        return set()
+
+    conn = get_connection()
+    if not conn:
+        return set()
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT tarefa_id FROM tarefas_legal_one WHERE tarefa_id = ANY(%s) AND status = ANY(%s)",
+            (list(tarefa_ids), list(TASK_OPEN_STATUSES)),
+        )
+        return {row[0] for row in cur.fetchall()}
+    except Exception as e:
+        logging.error(f"Erro ao verificar status das tarefas {list(tarefa_ids)}: {e}")
+        return set()
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
 def buscar_tarefas_pendentes():
     conn = get_connection()
     if not conn: return []
@@ -292,19 +593,13 @@ def buscar_tarefas_pendentes():
         cur.execute("""
             SELECT tarefa_id, processo_cnj, solicitante_id 
             FROM tarefas_legal_one 
-            WHERE status = 'PENDENTE'
-               OR (
-                    status = 'ERRO'
-                    AND COALESCE(tentativas, 0) < %s
-                    AND (
-                        ultima_tentativa IS NULL
-                        OR ultima_tentativa <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
-                    )
+            WHERE (
+                    status = 'PENDENTE'
+                    OR (status = 'ERRO' AND proxima_tentativa <= CURRENT_TIMESTAMP)
                )
-            ORDER BY
-                CASE WHEN status = 'PENDENTE' THEN 0 ELSE 1 END,
-                data_criacao ASC
-        """, (TASK_MAX_ERROR_RETRIES, TASK_ERROR_RETRY_BACKOFF_MINUTES))
+              AND (reservada_ate IS NULL OR reservada_ate < CURRENT_TIMESTAMP)
+            ORDER BY ordem_fila ASC, id ASC
+        """)
         return [{"tarefa_id": r[0], "processo_cnj": r[1], "solicitante_id": r[2]} for r in cur.fetchall()]
     except Exception as e:
         logging.error(f"Erro ao buscar tarefas pendentes: {e}")
@@ -315,6 +610,116 @@ def buscar_tarefas_pendentes():
         conn.close()
 
 
+def contar_tarefas_abertas():
+    """Retorna {status: quantidade} das tarefas ainda abertas na fila."""
+    conn = get_connection()
+    if not conn:
+        return None
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT status, COUNT(*)
+            FROM tarefas_legal_one
+            WHERE status = ANY(%s)
+            GROUP BY status
+            """,
+            (list(TASK_OPEN_STATUSES),),
+        )
+        contagem = {status: 0 for status in TASK_OPEN_STATUSES}
+        contagem.update({row[0]: row[1] for row in cur.fetchall()})
+        return contagem
+    except Exception as e:
+        logging.error(f"Erro ao contar tarefas abertas: {e}")
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def reivindicar_tarefas_pendentes(worker_id, limite, lease_minutos=30):
+    """
+    Reserva até `limite` tarefas abertas para um worker do processador.
+
+    FOR UPDATE SKIP LOCKED + lease: workers concorrentes nunca pegam a mesma
+    tarefa, e a reserva de um worker que morreu expira sozinha. A ordem é a
+    de `ordem_fila` (prioridade com envelhecimento).
+    """
+    conn = get_connection()
+    if not conn:
+        return []
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            WITH candidatas AS (
+                SELECT id
+                FROM tarefas_legal_one
+                WHERE (
+                        status = 'PENDENTE'
+                        OR (status = 'ERRO' AND proxima_tentativa <= CURRENT_TIMESTAMP)
+                   )
+                  AND (reservada_ate IS NULL OR reservada_ate < CURRENT_TIMESTAMP)
+                ORDER BY ordem_fila ASC, id ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE tarefas_legal_one t
+            SET reservada_por = %s,
+                reservada_ate = CURRENT_TIMESTAMP + (%s * INTERVAL '1 minute')
+            FROM candidatas c
+            WHERE t.id = c.id
+            RETURNING
+                t.tarefa_id,
+                t.processo_cnj,
+                t.solicitante_id,
+                t.ordem_fila,
+                t.id
+            """,
+            (limite, worker_id, lease_minutos),
+        )
+        rows = sorted(cur.fetchall(), key=lambda r: (r[3], r[4]))
+        conn.commit()
+        return [{"tarefa_id": r[0], "processo_cnj": r[1], "solicitante_id": r[2]} for r in rows]
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao reservar tarefas para o worker {worker_id}: {e}")
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def liberar_reservas_tarefas(worker_id):
+    conn = get_connection()
+    if not conn:
+        return
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE tarefas_legal_one
+            SET reservada_por = NULL,
+                reservada_ate = NULL
+            WHERE reservada_por = %s
+            """,
+            (worker_id,),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao liberar reservas do worker {worker_id}: {e}")
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
 def obter_cursor_coleta(type_id, sub_type_id):
     conn = get_connection()
     if not conn:
@@ -380,30 +785,90 @@ def atualizar_cursor_coleta(type_id, sub_type_id, ultimo_task_id):
             cur.close()
         conn.close()
 
-def marcar_tarefa_concluida(tarefa_id, status_final='CONCLUIDO', erro=None):
+def marcar_tarefa_concluida(tarefa_id, status_final='CONCLUIDO', erro=None, *, classe_erro=None):
+    marcar_tarefas_concluidas([tarefa_id], status_final, erro, classe_erro=classe_erro)
+
+
+def marcar_tarefas_concluidas(tarefa_ids, status_final='CONCLUIDO', erro=None, *, classe_erro=None):
+    """Finaliza de uma vez as tarefas de um mesmo CNJ (uma coleta atende todas).
+
+    Em ERRO agenda `proxima_tentativa` com backoff exponencial e jitter, a
+    partir da base da `classe_erro` ("transitorio", "login", "estrutural");
+    esgotadas as tentativas, fica NULL e a tarefa não volta mais à fila.
+    """
+    if not tarefa_ids:
+        return
+
+    backoff_base = TASK_RETRY_BACKOFF_BASE_MINUTES.get(classe_erro, TASK_ERROR_RETRY_BACKOFF_MINUTES)
+
     conn = get_connection()
     if not conn: return
     cur = None
     try:
         cur = conn.cursor()
+        # `proxima_tentativa` é calculada uma vez por linha (random() no CTE)
+        # para que `ordem_fila` parta do mesmo instante.
         cur.execute("""
-            UPDATE tarefas_legal_one 
+            WITH alvo AS (
+                SELECT tarefa_id,
+                    CASE
+                        WHEN %s = 'ERRO' AND COALESCE(tentativas, 0) + 1 < %s
+                            THEN CURRENT_TIMESTAMP + (
+                                LEAST(
+                                    %s,
+                                    %s * POWER(2, LEAST(COALESCE(tentativas, 0), 10)) * (1 + %s * random())
+                                )
+                                * INTERVAL '1 minute'
+                            )
+                        ELSE NULL
+                    END AS proxima_tentativa
+                FROM tarefas_legal_one
+                WHERE tarefa_id = ANY(%s)
+                FOR UPDATE
+            )
+            UPDATE tarefas_legal_one t
             SET status = %s,
-                data_conclusao = CASE WHEN %s = 'CONCLUIDO' THEN CURRENT_TIMESTAMP ELSE data_conclusao END,
+                data_conclusao = CASE WHEN %s = 'CONCLUIDO' THEN CURRENT_TIMESTAMP ELSE t.data_conclusao END,
                 ultima_tentativa = CURRENT_TIMESTAMP,
                 tentativas = CASE
-                    WHEN %s = 'ERRO' THEN COALESCE(tentativas, 0) + 1
-                    ELSE COALESCE(tentativas, 0)
+                    WHEN %s = 'ERRO' THEN COALESCE(t.tentativas, 0) + 1
+                    ELSE COALESCE(t.tentativas, 0)
                 END,
                 ultimo_erro = CASE
                     WHEN %s = 'ERRO' THEN %s
                     ELSE NULL
-                END
-            WHERE tarefa_id = %s
-        """, (status_final, status_final, status_final, status_final, (erro or "")[:1000], tarefa_id))
+                END,
+                proxima_tentativa = alvo.proxima_tentativa,
+                -- Retry entra na fila quando vence, mantendo a vantagem da
+                -- prioridade: o envelhecimento conta a partir de proxima_tentativa.
+                ordem_fila = CASE
+                    WHEN %s = 'ERRO'
+                        THEN COALESCE(alvo.proxima_tentativa, CURRENT_TIMESTAMP)
+                            - (COALESCE(t.prioridade, 0) * %s * INTERVAL '1 minute')
+                    ELSE t.ordem_fila
+                END,
+                reservada_por = NULL,
+                reservada_ate = NULL
+            FROM alvo
+            WHERE t.tarefa_id = alvo.tarefa_id
+        """, (
+            status_final,
+            TASK_MAX_ERROR_RETRIES,
+            TASK_ERROR_RETRY_BACKOFF_MAX_MINUTES,
+            backoff_base,
+            TASK_ERROR_RETRY_JITTER,
+            list(tarefa_ids),
+            status_final,
+            status_final,
+            status_final,
+            status_final,
+            (erro or "")[:1000],
+            status_final,
+            TASK_PRIORITY_MINUTES_PER_POINT,
+        ))
         conn.commit()
     except Exception as e:
-        logging.error(f"Erro ao atualizar status da tarefa {tarefa_id}: {e}")
+        logging.error(f"Erro ao atualizar status das tarefas {list(tarefa_ids)}: {e}")
     finally:
         if cur:
             cur.close()
@@ -435,9 +900,13 @@ def salvar_processo(cnj, npj):
             cur.close()
         conn.close()
 
-def atualizar_status_monitoramento(processo_id, ativar=True):
+def atualizar_status_monitoramento(processo_id, ativar=True, *, prioritario=False):
     """
     Ativa ou desativa a flag de monitoramento do processo.
+
+    Com `prioritario=True`, um processo que ainda não estava em
+    monitoramento entra na fila prioritária: vence na hora, é reservado antes
+    dos demais e o monitor é acordado por NOTIFY no canal MONITOR_CHANNEL.
     """
     conn = get_connection()
     if not conn: return
@@ -447,19 +916,48 @@ def atualizar_status_monitoramento(processo_id, ativar=True):
         cur.execute(
             """
             UPDATE processos
-            SET em_monitoramento = %s,
+            SET em_monitoramento = %(ativar)s,
                 data_atualizacao = CURRENT_TIMESTAMP,
+                monitoramento_prioritario = %(ativar)s AND (
+                    monitoramento_prioritario
+                    OR (%(prioritario)s AND NOT COALESCE(em_monitoramento, FALSE))
+                ),
+                monitoramento_proxima_verificacao = CASE
+                    WHEN NOT %(ativar)s THEN NULL
+                    -- Já monitorado (ex.: o processador recoletou o CNJ): mantém
+                    -- a agenda calculada pelo MonitorScheduler.
+                    WHEN COALESCE(em_monitoramento, FALSE)
+                        THEN COALESCE(
+                            monitoramento_proxima_verificacao,
+                            CURRENT_TIMESTAMP + (%(atraso)s * INTERVAL '1 minute')
+                        )
+                    WHEN monitoramento_prioritario
+                      OR (%(prioritario)s AND NOT COALESCE(em_monitoramento, FALSE))
+                        THEN CURRENT_TIMESTAMP
+                    ELSE CURRENT_TIMESTAMP + (%(atraso)s * INTERVAL '1 minute')
+                END,
                 monitoramento_falhas = 0,
                 monitoramento_ultimo_erro = NULL,
                 monitoramento_ultima_falha = NULL,
-                monitoramento_sem_correspondencia = CASE WHEN %s THEN monitoramento_sem_correspondencia ELSE 0 END,
-                monitoramento_ultima_sem_correspondencia = CASE WHEN %s THEN monitoramento_ultima_sem_correspondencia ELSE NULL END
-            WHERE id = %s
+                monitoramento_sem_correspondencia = CASE WHEN %(ativar)s THEN monitoramento_sem_correspondencia ELSE 0 END,
+                monitoramento_ultima_sem_correspondencia = CASE WHEN %(ativar)s THEN monitoramento_ultima_sem_correspondencia ELSE NULL END
+            WHERE id = %(processo_id)s
+            RETURNING monitoramento_prioritario
             """,
-            (ativar, ativar, ativar, processo_id),
+            {
+                "ativar": ativar,
+                "prioritario": prioritario,
+                "atraso": MONITOR_INITIAL_CHECK_MINUTES,
+                "processo_id": processo_id,
+            },
         )
+        row = cur.fetchone()
+        if row and row[0]:
+            cur.execute("SELECT pg_notify(%s, %s)", (MONITOR_CHANNEL, str(processo_id)))
         conn.commit()
         status_str = "ATIVADO" if ativar else "DESATIVADO"
+        if row and row[0]:
+            status_str += " (fila prioritária)"
         logging.info(f"👀 Monitoramento {status_str} para processo ID {processo_id}.")
     except Exception as e:
         logging.error(f"❌ Erro atualizar monitoramento: {e}")
@@ -516,11 +1014,22 @@ def registrar_monitoramento_falha(processo_id, erro):
             SET data_atualizacao = CURRENT_TIMESTAMP,
                 monitoramento_falhas = COALESCE(monitoramento_falhas, 0) + 1,
                 monitoramento_ultimo_erro = %s,
-                monitoramento_ultima_falha = CURRENT_TIMESTAMP
+                monitoramento_ultima_falha = CURRENT_TIMESTAMP,
+                monitoramento_proxima_verificacao = CURRENT_TIMESTAMP + (
+                    LEAST(
+                        %s,
+                        %s * POWER(2, LEAST(COALESCE(monitoramento_falhas, 0), 10))
+                    ) * INTERVAL '1 minute'
+                )
             WHERE id = %s
             RETURNING monitoramento_falhas
             """,
-            ((erro or "Falha desconhecida no monitoramento")[:1000], processo_id),
+            (
+                (erro or "Falha desconhecida no monitoramento")[:1000],
+                MONITOR_FAILURE_BACKOFF_MAX_MINUTES,
+                MONITOR_FAILURE_BACKOFF_MINUTES,
+                processo_id,
+            ),
         )
         row = cur.fetchone()
         conn.commit()
@@ -538,6 +1047,67 @@ def registrar_monitoramento_falha(processo_id, erro):
         conn.close()
 
 
+def agendar_proxima_verificacao(processo_id, proxima_verificacao, *, houve_mudanca=False):
+    """Grava a próxima verificação do monitor e atualiza o histórico de mudanças."""
+    conn = get_connection()
+    if not conn:
+        return
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE processos
+            SET monitoramento_proxima_verificacao = %s,
+                monitoramento_verificacoes = COALESCE(monitoramento_verificacoes, 0) + 1,
+                monitoramento_mudancas = COALESCE(monitoramento_mudancas, 0) + CASE WHEN %s THEN 1 ELSE 0 END,
+                monitoramento_ultima_mudanca = CASE
+                    WHEN %s THEN CURRENT_TIMESTAMP
+                    ELSE monitoramento_ultima_mudanca
+                END
+            WHERE id = %s
+              AND em_monitoramento = TRUE
+            """,
+            (proxima_verificacao, houve_mudanca, houve_mudanca, processo_id),
+        )
+        conn.commit()
+    except Exception as e:
+        logging.error(f"Erro ao agendar próxima verificação do processo {processo_id}: {e}")
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def obter_historico_monitoramento(processo_id):
+    """Retorna (verificacoes, mudancas) acumuladas do processo."""
+    conn = get_connection()
+    if not conn:
+        return 0, 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COALESCE(monitoramento_verificacoes, 0), COALESCE(monitoramento_mudancas, 0)
+            FROM processos
+            WHERE id = %s
+            """,
+            (processo_id,),
+        )
+        row = cur.fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+    except Exception as e:
+        logging.error(f"Erro ao consultar histórico de monitoramento do processo {processo_id}: {e}")
+        return 0, 0
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
 def registrar_monitoramento_sem_correspondencia(processo_id, quantidade):
     conn = get_connection()
     if not conn:
@@ -639,6 +1209,7 @@ def salvar_lista_subsidios(
     lista_dados,
     *,
     preservar_solicitados_sem_correspondencia=False,
+    fingerprint=None,
 ):
     conn = get_connection()
     if not conn: return
@@ -665,12 +1236,12 @@ def salvar_lista_subsidios(
             for row in cur.fetchall()
         ]
 
-        usados = set()
+        indice_existentes = IndiceSubsidios(existentes, chave_subsidio_exata)
         preservados = set()
 
         for dado in lista_dados:
             normalizado = _normalizar_subsidio(dado)
-            existente = _buscar_subsidio_existente(existentes, normalizado, usados)
+            _, existente = indice_existentes.consumir_correspondente(normalizado)
 
             if existente:
                 cur.execute(
@@ -691,7 +1262,6 @@ def salvar_lista_subsidios(
                         existente["id"],
                     ),
                 )
-                usados.add(existente["id"])
                 preservados.add(existente["id"])
                 continue
 
@@ -727,16 +1297,20 @@ def salvar_lista_subsidios(
                 continue
             cur.execute("DELETE FROM subsidios WHERE id = %s", (existente["id"],))
 
+        # Sem fingerprint o hash é zerado: a base mudou por um caminho que não
+        # garante equivalência com uma coleta futura idêntica.
         cur.execute(
             """
             UPDATE processos
             SET data_atualizacao = CURRENT_TIMESTAMP,
+                ultima_coleta_em = CURRENT_TIMESTAMP,
                 monitoramento_falhas = 0,
                 monitoramento_ultimo_erro = NULL,
-                monitoramento_ultima_falha = NULL
+                monitoramento_ultima_falha = NULL,
+                subsidios_hash = %s
             WHERE id = %s
             """,
-            (processo_id,),
+            (fingerprint, processo_id),
         )
 
         conn.commit()
@@ -748,43 +1322,78 @@ def salvar_lista_subsidios(
         conn.close()
 
 
-def _normalizar_subsidio(dado):
-    return {
-        "tipo": (dado.get("tipo") or "").strip(),
-        "item": (dado.get("item") or "").strip(),
-        "estado": (dado.get("estado") or "").strip(),
-        "data_limite": (dado.get("data_limite") or "").strip(),
-    }
-
-
-def _buscar_subsidio_existente(existentes, subsidio, usados):
-    for existente in existentes:
-        if existente["id"] in usados:
-            continue
-        if (
-            existente["tipo"] == subsidio["tipo"]
-            and existente["item"] == subsidio["item"]
-            and existente["data_limite"] == subsidio["data_limite"]
-        ):
-            return existente
-
-    return None
-
+def calcular_fingerprint_subsidios(lista_dados):
+    """
+    Hash canônico de uma lista coletada: mesma lista, em qualquer ordem,
+    gera o mesmo valor.
+    """
+    linhas = sorted(
+        "\x1f".join(
+            (
+                normalizado["tipo"],
+                normalizado["item"],
+                normalizado["estado"],
+                normalizado["data_limite"],
+            )
+        )
+        for normalizado in map(_normalizar_subsidio, lista_dados or [])
+    )
+    return hashlib.sha256("\x1e".join(linhas).encode("utf-8")).hexdigest()
 
-def _normalizar_estado(estado):
-    return " ".join(str(estado or "").split()).upper()
 
-def recuperar_subsidios_anteriores(processo_id):
-    """Retorna lista de dicionários com os subsídios atuais do banco para comparação."""
+def registrar_verificacao_sem_mudanca(processo_id):
+    """Fast path do monitor: a coleta bateu com o hash salvo, só marca a verificação."""
     conn = get_connection()
-    if not conn: return []
-    lista = []
+    if not conn:
+        return
+
     cur = None
     try:
         cur = conn.cursor()
-        cur.execute("SELECT tipo, item, estado, data_limite FROM subsidios WHERE processo_id = %s", (processo_id,))
-        rows = cur.fetchall()
-        for r in rows:
+        cur.execute(
+            """
+            UPDATE processos
+            SET data_atualizacao = CURRENT_TIMESTAMP,
+                ultima_coleta_em = CURRENT_TIMESTAMP,
+                monitoramento_falhas = 0,
+                monitoramento_ultimo_erro = NULL,
+                monitoramento_ultima_falha = NULL
+            WHERE id = %s
+            """,
+            (processo_id,),
+        )
+        conn.commit()
+    except Exception as e:
+        logging.error(f"Erro ao registrar verificação sem mudança do processo {processo_id}: {e}")
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def _normalizar_subsidio(dado):
+    return {
+        "tipo": (dado.get("tipo") or "").strip(),
+        "item": (dado.get("item") or "").strip(),
+        "estado": (dado.get("estado") or "").strip(),
+        "data_limite": (dado.get("data_limite") or "").strip(),
+    }
+
+
+def _normalizar_estado(estado):
+    return " ".join(str(estado or "").split()).upper()
+
+def recuperar_subsidios_anteriores(processo_id):
+    """Retorna lista de dicionários com os subsídios atuais do banco para comparação."""
+    conn = get_connection()
+    if not conn: return []
+    lista = []
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT tipo, item, estado, data_limite FROM subsidios WHERE processo_id = %s", (processo_id,))
+        rows = cur.fetchall()
+        for r in rows:
             lista.append({
                 "tipo": r[0], 
                 "item": r[1], 
@@ -800,36 +1409,111 @@ def recuperar_subsidios_anteriores(processo_id):
     return lista
 
 
-def buscar_processos_em_monitoramento(limit=None):
+def buscar_prazos_subsidios_solicitados(cnj):
+    """`data_limite` dos subsídios ainda SOLICITADO do processo (texto, como veio do portal)."""
+    conn = get_connection()
+    if not conn:
+        return []
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT s.data_limite
+            FROM subsidios s
+            JOIN processos p ON p.id = s.processo_id
+            WHERE p.cnj = %s
+              AND UPPER(TRIM(s.estado)) = 'SOLICITADO'
+              AND COALESCE(s.data_limite, '') <> ''
+            """,
+            (cnj,),
+        )
+        return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        logging.error(f"Erro ao buscar prazos dos subsídios do CNJ {cnj}: {e}")
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def buscar_processos_em_monitoramento(limit=None, lease_minutos=None):
+    """
+    Reserva os processos monitorados cuja próxima verificação já venceu.
+    Os da fila prioritária (recém-marcados) vêm primeiro; o restante segue
+    a ordem de vencimento. Processos coletados por qualquer robô dentro da
+    janela de frescor ficam de fora (continuam vencidos para o próximo ciclo),
+    exceto os prioritários: o processador marca o processo logo depois de
+    coletá-lo, e a primeira verificação pedida pelo NOTIFY sai no ciclo
+    seguinte, sem esperar a janela.
+
+    A reserva empurra `monitoramento_proxima_verificacao` para o fim do
+    lease: outro monitor não pega o mesmo processo, e se este cair a
+    verificação volta a vencer sozinha. O resultado final do ciclo
+    (agendamento, falha ou desligamento) sobrescreve o lease.
+    """
     conn = get_connection()
     if not conn:
         return []
 
     limite_consulta = limit if limit and limit > 0 else None
+    lease = lease_minutos or MONITOR_CLAIM_LEASE_MINUTES
     cur = None
     try:
         cur = conn.cursor()
         cur.execute(
             """
-            SELECT id, cnj, npj
-            FROM processos
-            WHERE em_monitoramento = TRUE
-              AND (
-                    COALESCE(monitoramento_falhas, 0) = 0
-                    OR monitoramento_ultima_falha IS NULL
-                    OR monitoramento_ultima_falha <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
-              )
-            ORDER BY data_atualizacao ASC, COALESCE(monitoramento_falhas, 0) ASC, id ASC
-            LIMIT %s
+            WITH vencidos AS (
+                SELECT
+                    id,
+                    monitoramento_proxima_verificacao AS vencimento,
+                    monitoramento_prioritario AS prioritario
+                FROM processos
+                WHERE em_monitoramento = TRUE
+                  AND monitoramento_proxima_verificacao <= CURRENT_TIMESTAMP
+                  AND (
+                        monitoramento_prioritario
+                        OR ultima_coleta_em IS NULL
+                        OR ultima_coleta_em <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
+                  )
+                ORDER BY monitoramento_prioritario DESC, monitoramento_proxima_verificacao ASC, id ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE processos p
+            SET monitoramento_proxima_verificacao = CURRENT_TIMESTAMP + (%s * INTERVAL '1 minute'),
+                monitoramento_prioritario = FALSE
+            FROM vencidos v
+            WHERE p.id = v.id
+            RETURNING
+                p.id,
+                p.cnj,
+                p.npj,
+                v.vencimento,
+                p.subsidios_hash,
+                COALESCE(p.monitoramento_sem_correspondencia, 0),
+                v.prioritario
             """,
-            (MONITOR_FAILURE_BACKOFF_MINUTES, limite_consulta),
+            (COLETA_FRESCOR_MINUTES, limite_consulta, lease),
         )
+        rows = sorted(cur.fetchall(), key=lambda row: (not row[6], row[3], row[0]))
+        conn.commit()
         return [
-            {"processo_id": row[0], "cnj": row[1], "npj": row[2]}
-            for row in cur.fetchall()
+            {
+                "processo_id": row[0],
+                "cnj": row[1],
+                "npj": row[2],
+                "subsidios_hash": row[4],
+                "sem_correspondencia": row[5],
+                "prioritario": row[6],
+                "vencimento": row[3],
+            }
+            for row in rows
         ]
     except Exception as e:
         logging.error(f"Erro ao buscar processos em monitoramento: {e}")
+        conn.rollback()
         return []
     finally:
         if cur:
@@ -837,6 +1521,82 @@ def buscar_processos_em_monitoramento(limit=None):
         conn.close()
 
 
+def liberar_reservas_monitoramento(processos):
+    """Devolve processos reservados e não verificados ao estado anterior à reserva.
+
+    Restaura o vencimento original e a flag prioritária de cada um; só
+    mexe em quem ainda está sob o lease (nada gravou resultado depois).
+    """
+    processos = [processo for processo in processos if processo.get("vencimento") is not None]
+    if not processos:
+        return
+
+    conn = get_connection()
+    if not conn:
+        return
+    cur = None
+    try:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            UPDATE processos p
+            SET monitoramento_proxima_verificacao = v.vencimento,
+                monitoramento_prioritario = p.monitoramento_prioritario OR v.prioritario
+            FROM (VALUES %s) AS v(id, vencimento, prioritario)
+            WHERE p.id = v.id
+              AND p.em_monitoramento = TRUE
+              AND p.monitoramento_proxima_verificacao > CURRENT_TIMESTAMP
+            """,
+            [
+                (processo["processo_id"], processo["vencimento"], bool(processo.get("prioritario")))
+                for processo in processos
+            ],
+            template="(%s, %s::timestamp, %s::boolean)",
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao liberar reservas do monitoramento: {e}")
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def buscar_cnjs_coletados_recentemente(cnjs, minutos=None):
+    """Dos `cnjs`, os coletados no portal dentro da janela de frescor: {cnj: ultima_coleta_em}."""
+    minutos = COLETA_FRESCOR_MINUTES if minutos is None else minutos
+    cnjs = list({cnj for cnj in cnjs if cnj})
+    if not cnjs or minutos <= 0:
+        return {}
+
+    conn = get_connection()
+    if not conn:
+        return {}
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT cnj, ultima_coleta_em
+            FROM processos
+            WHERE cnj = ANY(%s)
+              AND ultima_coleta_em > CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
+            """,
+            (cnjs, minutos),
+        )
+        return {row[0]: row[1] for row in cur.fetchall()}
+    except Exception as e:
+        logging.error(f"Erro ao buscar coletas recentes: {e}")
+        return {}
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
 def buscar_processos_para_reconciliacao(*, limit=10, lookback_hours=168):
     conn = get_connection()
     if not conn:
@@ -857,10 +1617,14 @@ def buscar_processos_para_reconciliacao(*, limit=10, lookback_hours=168):
                     OR monitoramento_ultima_falha IS NULL
                     OR monitoramento_ultima_falha <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
               )
+              AND (
+                    ultima_coleta_em IS NULL
+                    OR ultima_coleta_em <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
+              )
             ORDER BY data_atualizacao DESC, id DESC
             LIMIT %s
             """,
-            (lookback_hours, MONITOR_FAILURE_BACKOFF_MINUTES, limit),
+            (lookback_hours, MONITOR_FAILURE_BACKOFF_MINUTES, COLETA_FRESCOR_MINUTES, limit),
         )
         return [
             {"processo_id": row[0], "cnj": row[1], "npj": row[2]}
@@ -906,14 +1670,74 @@ def buscar_todos_solicitantes_por_cnj(cnj):
     return lista_ids
 
 
-def registrar_notificacoes_twotask(lista_notificacoes):
+def buscar_solicitantes_por_cnjs(cnjs):
+    """
+    Versão em lote de `buscar_todos_solicitantes_por_cnj`: uma única consulta
+    para vários CNJs. Retorna {cnj: [solicitante_id, ...]}, com lista vazia
+    para CNJs sem solicitante. Retorna None se a consulta falhar, para o
+    chamador cair na busca individual.
+    """
+    cnjs = sorted({cnj for cnj in cnjs or [] if cnj})
+    if not cnjs:
+        return {}
+
+    conn = get_connection()
+    if not conn:
+        return None
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT DISTINCT processo_cnj, solicitante_id
+            FROM tarefas_legal_one
+            WHERE processo_cnj = ANY(%s)
+              AND solicitante_id IS NOT NULL
+              AND solicitante_id <> ''
+            ORDER BY processo_cnj, solicitante_id
+            """,
+            (cnjs,),
+        )
+        solicitantes = {cnj: [] for cnj in cnjs}
+        for cnj, solicitante_id in cur.fetchall():
+            solicitantes[cnj].append(solicitante_id)
+        return solicitantes
+    except Exception as e:
+        logging.error(f"Erro ao buscar solicitantes em lote: {e}")
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def registrar_notificacoes_twotask(lista_notificacoes, *, status="ENVIANDO"):
     """
     Registra notificações antes do POST para impedir envio duplicado em ciclos
     paralelos ou reexecuções próximas do monitor.
+
+    Com status='PENDENTE' as linhas ficam para o sender do outbox
+    (utils.twotask_outbox), acordado por NOTIFY no commit.
     """
     if not lista_notificacoes:
         return []
 
+    # Chave calculada uma vez por linha; repetidas dentro do próprio lote
+    # ficam de fora antes do INSERT.
+    candidatas = {}
+    for notificacao in lista_notificacoes:
+        normalizada = _normalizar_notificacao_twotask(notificacao)
+        if not normalizada:
+            continue
+        dedupe_key = _gerar_dedupe_key_notificacao(normalizada)
+        if dedupe_key in candidatas:
+            continue
+        normalizada["_dedupe_key"] = dedupe_key
+        candidatas[dedupe_key] = normalizada
+
+    if not candidatas:
+        return []
+
     conn = get_connection()
     if not conn:
         logging.error("❌ Não foi possível registrar notificações TwoTask para deduplicação.")
@@ -924,35 +1748,52 @@ def registrar_notificacoes_twotask(lista_notificacoes):
 
     try:
         cur = conn.cursor()
-        for notificacao in lista_notificacoes:
-            normalizada = _normalizar_notificacao_twotask(notificacao)
-            if not normalizada:
-                continue
-
-            dedupe_key = _gerar_dedupe_key_notificacao(normalizada)
-            cur.execute(
-                """
-                INSERT INTO twotask_notificacoes (
-                    dedupe_key,
-                    numero_processo,
-                    id_responsavel,
-                    observacao,
-                    status,
-                    data_atualizacao
-                )
-                VALUES (%s, %s, %s, %s, 'ENVIANDO', CURRENT_TIMESTAMP)
-                ON CONFLICT (dedupe_key) DO NOTHING
-                RETURNING id
-                """,
+        # Chaves já arquivadas foram enviadas (ou desistidas) antes: não voltam.
+        cur.execute(
+            "SELECT dedupe_key FROM twotask_notificacoes_arquivo WHERE dedupe_key = ANY(%s)",
+            (list(candidatas),),
+        )
+        for (dedupe_key,) in cur.fetchall():
+            candidatas.pop(dedupe_key, None)
+        if not candidatas:
+            return []
+
+        # Um único INSERT para o lote inteiro: o RETURNING traz só as linhas
+        # realmente inseridas, que formam a lista de envio.
+        inseridas = execute_values(
+            cur,
+            """
+            INSERT INTO twotask_notificacoes (
+                dedupe_key,
+                numero_processo,
+                id_responsavel,
+                observacao,
+                status,
+                data_atualizacao
+            )
+            VALUES %s
+            ON CONFLICT (dedupe_key) DO NOTHING
+            RETURNING dedupe_key, id
+            """,
+            [
                 (
                     dedupe_key,
                     normalizada["numero_processo"],
                     normalizada["id_responsavel"],
                     normalizada["observacao"],
-                ),
-            )
-            row = cur.fetchone()
-            if not row:
+                    status,
+                )
+                for dedupe_key, normalizada in candidatas.items()
+            ],
+            template="(%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)",
+            page_size=len(candidatas),
+            fetch=True,
+        )
+        ids_por_chave = dict(inseridas)
+
+        for dedupe_key, normalizada in candidatas.items():
+            notificacao_id = ids_por_chave.get(dedupe_key)
+            if notificacao_id is None:
                 logging.info(
                     "🧯 Notificação TwoTask duplicada bloqueada localmente: processo=%s responsável=%s",
                     normalizada["numero_processo"],
@@ -960,10 +1801,11 @@ def registrar_notificacoes_twotask(lista_notificacoes):
                 )
                 continue
 
-            normalizada["_dedupe_key"] = dedupe_key
-            normalizada["_notificacao_id"] = row[0]
+            normalizada["_notificacao_id"] = notificacao_id
             notificacoes_para_envio.append(normalizada)
 
+        if notificacoes_para_envio and status == "PENDENTE":
+            cur.execute("SELECT pg_notify(%s, %s)", (NOTIFICATION_CHANNEL, str(len(notificacoes_para_envio))))
         conn.commit()
         return notificacoes_para_envio
     except Exception as e:
@@ -994,14 +1836,55 @@ def marcar_notificacoes_twotask_erro(dedupe_keys, erro):
     )
 
 
-def buscar_lotes_notificacoes_twotask_para_reenvio(
-    limite_lotes=10,
+def contar_notificacoes_twotask_por_status():
+    """Retorna {status: quantidade} das notificações TwoTask ainda não enviadas."""
+    conn = get_connection()
+    if not conn:
+        return None
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT status, COUNT(*)
+            FROM twotask_notificacoes
+            WHERE status <> 'ENVIADO'
+            GROUP BY status
+            """
+        )
+        return {row[0]: row[1] for row in cur.fetchall()}
+    except Exception as e:
+        logging.error(f"Erro ao contar notificações TwoTask: {e}")
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def reivindicar_lote_notificacoes_twotask(
+    *,
+    tamanho_lote=50,
+    linger_segundos=10,
     max_tentativas=5,
     reenviar_enviando_apos_minutos=10,
+    forcar=False,
 ):
+    """
+    Reserva (status ENVIANDO) o próximo lote de notificações para um POST.
+
+    1. Retries primeiro: um lote já formado (`lote_envio`) cujo backoff
+       venceu, ou que ficou preso em ENVIANDO, volta inteiro — mesma
+       composição, mesma chave de idempotência.
+    2. Depois, linhas ainda sem lote (pendentes de qualquer processo/ciclo)
+       são coalescidas até `tamanho_lote`. O lote só sai cheio, ou quando a
+       linha mais antiga já esperou `linger_segundos`, ou com `forcar`.
+
+    Retorna a lista de notificações do lote (vazia se nada estiver pronto).
+    """
     conn = get_connection()
     if not conn:
-        logging.error("❌ Não foi possível buscar notificações TwoTask para reenvio.")
+        logging.error("❌ Não foi possível reservar notificações TwoTask para envio.")
         return []
 
     cur = None
@@ -1009,77 +1892,112 @@ def buscar_lotes_notificacoes_twotask_para_reenvio(
         cur = conn.cursor()
         cur.execute(
             """
-            WITH lotes AS (
-                SELECT data_criacao
+            WITH lote AS (
+                SELECT lote_envio
                 FROM twotask_notificacoes
-                WHERE (
-                        status = 'ERRO'
-                        AND COALESCE(tentativas, 0) < %s
-                        AND COALESCE(ultimo_erro, '') NOT LIKE 'AUTH_NON_RETRYABLE:%%'
-                    )
-                   OR (
-                        status = 'ENVIANDO'
-                        AND data_atualizacao <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
-                    )
-                GROUP BY data_criacao
-                ORDER BY MIN(data_atualizacao), data_criacao
-                LIMIT %s
+                WHERE lote_envio IS NOT NULL
+                  AND (
+                        (
+                            status = 'ERRO'
+                            AND COALESCE(tentativas, 0) < %s
+                            AND COALESCE(ultimo_erro, '') NOT LIKE 'AUTH_NON_RETRYABLE:%%'
+                            AND COALESCE(proxima_tentativa, data_atualizacao) <= CURRENT_TIMESTAMP
+                        )
+                        OR (
+                            status = 'ENVIANDO'
+                            AND data_atualizacao <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
+                        )
+                  )
+                ORDER BY data_atualizacao, id
+                LIMIT 1
             ),
             selecionadas AS (
                 SELECT t.id
                 FROM twotask_notificacoes t
-                INNER JOIN lotes l ON l.data_criacao = t.data_criacao
-                WHERE (
-                        t.status = 'ERRO'
-                        AND COALESCE(t.tentativas, 0) < %s
-                        AND COALESCE(t.ultimo_erro, '') NOT LIKE 'AUTH_NON_RETRYABLE:%%'
-                    )
-                   OR (
-                        t.status = 'ENVIANDO'
-                        AND t.data_atualizacao <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
-                    )
-                ORDER BY t.data_criacao, t.id
-                FOR UPDATE SKIP LOCKED
+                INNER JOIN lote l ON l.lote_envio = t.lote_envio
+                WHERE t.status IN ('ERRO', 'ENVIANDO')
+                FOR UPDATE OF t SKIP LOCKED
             )
             UPDATE twotask_notificacoes t
             SET status = 'ENVIANDO',
                 data_atualizacao = CURRENT_TIMESTAMP
             FROM selecionadas s
             WHERE t.id = s.id
-            RETURNING
-                t.dedupe_key,
-                t.numero_processo,
-                t.id_responsavel,
-                t.observacao,
-                t.data_criacao,
-                t.status,
-                COALESCE(t.tentativas, 0)
+            RETURNING t.id, t.dedupe_key, t.numero_processo, t.id_responsavel, t.observacao, t.lote_envio
             """,
-            (
-                max_tentativas,
-                reenviar_enviando_apos_minutos,
-                limite_lotes,
-                max_tentativas,
-                reenviar_enviando_apos_minutos,
-            ),
+            (max_tentativas, reenviar_enviando_apos_minutos),
         )
         rows = cur.fetchall()
+
+        if not rows:
+            cur.execute(
+                """
+                SELECT
+                    id,
+                    dedupe_key,
+                    numero_processo,
+                    id_responsavel,
+                    observacao,
+                    EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - data_criacao))
+                FROM twotask_notificacoes
+                WHERE lote_envio IS NULL
+                  AND (
+                        status = 'PENDENTE'
+                        OR (
+                            status = 'ERRO'
+                            AND COALESCE(tentativas, 0) < %s
+                            AND COALESCE(ultimo_erro, '') NOT LIKE 'AUTH_NON_RETRYABLE:%%'
+                            AND COALESCE(proxima_tentativa, data_atualizacao) <= CURRENT_TIMESTAMP
+                        )
+                        OR (
+                            status = 'ENVIANDO'
+                            AND data_atualizacao <= CURRENT_TIMESTAMP - (%s * INTERVAL '1 minute')
+                        )
+                  )
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+                """,
+                (max_tentativas, reenviar_enviando_apos_minutos, tamanho_lote),
+            )
+            candidatas = cur.fetchall()
+            pronto = candidatas and (
+                forcar
+                or len(candidatas) >= tamanho_lote
+                or max(float(row[5] or 0) for row in candidatas) >= linger_segundos
+            )
+            if not pronto:
+                conn.rollback()
+                return []
+
+            lote_envio = gerar_chave_lote_twotask(row[1] for row in candidatas)
+            cur.execute(
+                """
+                UPDATE twotask_notificacoes
+                SET status = 'ENVIANDO',
+                    lote_envio = %s,
+                    data_atualizacao = CURRENT_TIMESTAMP
+                WHERE id = ANY(%s)
+                """,
+                (lote_envio, [row[0] for row in candidatas]),
+            )
+            rows = [row[:5] + (lote_envio,) for row in candidatas]
+
         conn.commit()
         return [
             {
-                "_dedupe_key": row[0],
-                "numero_processo": row[1],
-                "id_responsavel": row[2],
-                "observacao": row[3],
-                "_batch_ref": row[4].isoformat() if row[4] else "",
-                "status": row[5],
-                "tentativas": row[6],
+                "_notificacao_id": row[0],
+                "_dedupe_key": row[1],
+                "numero_processo": row[2],
+                "id_responsavel": row[3],
+                "observacao": row[4],
+                "_batch_ref": row[5],
             }
-            for row in rows
+            for row in sorted(rows, key=lambda row: row[0])
         ]
     except Exception as e:
         conn.rollback()
-        logging.error("❌ Erro ao buscar notificações TwoTask para reenvio: %s", e)
+        logging.error("❌ Erro ao reservar lote de notificações TwoTask: %s", e)
         return []
     finally:
         if cur:
@@ -1087,6 +2005,11 @@ def buscar_lotes_notificacoes_twotask_para_reenvio(
         conn.close()
 
 
+def gerar_chave_lote_twotask(dedupe_keys):
+    material = "|".join(sorted(dedupe_keys))
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
 def _atualizar_status_notificacoes_twotask(
     dedupe_keys,
     *,
@@ -1112,10 +2035,27 @@ def _atualizar_status_notificacoes_twotask(
                 tentativas = COALESCE(tentativas, 0) + 1,
                 ultimo_erro = %s,
                 data_envio = CASE WHEN %s THEN CURRENT_TIMESTAMP ELSE data_envio END,
-                data_atualizacao = CURRENT_TIMESTAMP
+                data_atualizacao = CURRENT_TIMESTAMP,
+                proxima_tentativa = CASE
+                    WHEN %s = 'ERRO' THEN CURRENT_TIMESTAMP + (
+                        LEAST(
+                            %s,
+                            %s * POWER(2, LEAST(COALESCE(tentativas, 0), 16))
+                        ) * INTERVAL '1 second'
+                    )
+                    ELSE NULL
+                END
             WHERE dedupe_key = ANY(%s)
             """,
-            (status, ultimo_erro, marcar_envio, list(dedupe_keys)),
+            (
+                status,
+                ultimo_erro,
+                marcar_envio,
+                status,
+                NOTIFICATION_RETRY_BACKOFF_MAX_SECONDS,
+                NOTIFICATION_RETRY_BACKOFF_SECONDS,
+                list(dedupe_keys),
+            ),
         )
         conn.commit()
     except Exception as e:
@@ -1127,6 +2067,22 @@ def _atualizar_status_notificacoes_twotask(
         conn.close()
 
 
+def abrir_conexao_escuta(canal=NOTIFICATION_CHANNEL):
+    """Conexão dedicada em autocommit com LISTEN no canal; None se indisponível."""
+    conn = get_connection()
+    if not conn:
+        return None
+    try:
+        conn.set_session(autocommit=True)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {canal};")
+        return conn
+    except Exception as e:
+        logging.error(f"Erro ao escutar o canal {canal}: {e}")
+        conn.close()
+        return None
+
+
 def _normalizar_notificacao_twotask(notificacao):
     numero_processo = (notificacao.get("numero_processo") or "").strip()
     observacao = " ".join((notificacao.get("observacao") or "").split())
@@ -1156,3 +2112,835 @@ def _gerar_dedupe_key_notificacao(notificacao):
         ]
     )
     return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+# --- TEMPOS POR ETAPA ---
+
+def registrar_tempos_etapas(robo, referencia, tarefa_id, spans):
+    """Grava os spans `(etapa, segundos, sucesso)` de uma tarefa num único INSERT."""
+    if not spans:
+        return
+
+    conn = get_connection()
+    if not conn:
+        return
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO tempos_etapas (robo, referencia, tarefa_id, etapa, duracao_ms, sucesso)
+            VALUES %s
+            """,
+            [
+                (robo, referencia, tarefa_id, etapa, int(segundos * 1000), sucesso)
+                for etapa, segundos, sucesso in spans
+            ],
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao gravar tempos por etapa de %s: %s", referencia, e)
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+# --- BROKER DE COLETAS DO PORTAL ---
+
+def submeter_coletas_portal(origem, coletas):
+    """
+    Enfileira coletas `[{"cnj": ..., **parametros}]` para o broker.
+    Retorna os ids na mesma ordem (lista vazia em caso de erro).
+    """
+    if not coletas:
+        return []
+
+    conn = get_connection()
+    if not conn:
+        logging.error("❌ Não foi possível enfileirar coletas no broker.")
+        return []
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        linhas = execute_values(
+            cur,
+            """
+            INSERT INTO coletas_portal (origem, cnj, parametros)
+            VALUES %s
+            RETURNING id
+            """,
+            [
+                (
+                    origem,
+                    coleta["cnj"],
+                    Json({chave: valor for chave, valor in coleta.items() if chave != "cnj"}),
+                )
+                for coleta in coletas
+            ],
+            page_size=len(coletas),
+            fetch=True,
+        )
+        cur.execute("SELECT pg_notify(%s, %s)", (COLETAS_FILA_CHANNEL, str(len(linhas))))
+        conn.commit()
+        return [row[0] for row in linhas]
+    except Exception as e:
+        conn.rollback()
+        logging.error("❌ Erro ao enfileirar coletas no broker: %s", e)
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def reivindicar_coletas_portal(worker_id, limite, lease_minutos=10):
+    """Reserva coletas pendentes (ou com lease vencido) para um worker do broker."""
+    conn = get_connection()
+    if not conn:
+        return []
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            WITH candidatas AS (
+                SELECT id
+                FROM coletas_portal
+                WHERE status = 'PENDENTE'
+                   OR (status = 'EXECUTANDO' AND reservada_ate < CURRENT_TIMESTAMP)
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            UPDATE coletas_portal c
+            SET status = 'EXECUTANDO',
+                reservada_por = %s,
+                reservada_ate = CURRENT_TIMESTAMP + (%s * INTERVAL '1 minute'),
+                atualizado_em = CURRENT_TIMESTAMP
+            FROM candidatas s
+            WHERE c.id = s.id
+            RETURNING c.id, c.origem, c.cnj, c.parametros
+            """,
+            (limite, worker_id, lease_minutos),
+        )
+        rows = sorted(cur.fetchall())
+        conn.commit()
+        return [
+            {
+                "coleta_id": row[0],
+                "origem": row[1],
+                "processo_cnj": row[2],
+                "parametros": row[3] or {},
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao reservar coletas do broker: %s", e)
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def finalizar_coleta_portal(coleta_id, worker_id, *, resultado=None, erro_tipo=None, erro=None):
+    """Grava o resultado (ou erro) da coleta e avisa o cliente que está esperando."""
+    conn = get_connection()
+    if not conn:
+        return
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE coletas_portal
+            SET status = %s,
+                resultado = %s,
+                erro_tipo = %s,
+                erro = %s,
+                reservada_ate = NULL,
+                atualizado_em = CURRENT_TIMESTAMP
+            WHERE id = %s
+              AND status = 'EXECUTANDO'
+              AND reservada_por = %s
+            """,
+            (
+                "ERRO" if erro_tipo else "CONCLUIDA",
+                None if erro_tipo else Json(resultado),
+                erro_tipo,
+                (erro or "")[:2000] if erro_tipo else None,
+                coleta_id,
+                worker_id,
+            ),
+        )
+        if cur.rowcount:
+            cur.execute("SELECT pg_notify(%s, %s)", (COLETAS_RESULTADO_CHANNEL, str(coleta_id)))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao finalizar coleta %s do broker: %s", coleta_id, e)
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def liberar_coletas_portal(worker_id):
+    """Devolve à fila as coletas ainda em execução por um worker do broker."""
+    conn = get_connection()
+    if not conn:
+        return
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            UPDATE coletas_portal
+            SET status = 'PENDENTE',
+                reservada_por = NULL,
+                reservada_ate = NULL,
+                atualizado_em = CURRENT_TIMESTAMP
+            WHERE status = 'EXECUTANDO'
+              AND reservada_por = %s
+            """,
+            (worker_id,),
+        )
+        if cur.rowcount:
+            cur.execute("SELECT pg_notify(%s, %s)", (COLETAS_FILA_CHANNEL, str(cur.rowcount)))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao liberar coletas do worker {worker_id}: {e}")
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def retirar_coletas_portal_finalizadas(ids):
+    """Lê e apaga as coletas já finalizadas entre `ids`. Retorna {id: linha}."""
+    if not ids:
+        return {}
+
+    conn = get_connection()
+    if not conn:
+        return {}
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            DELETE FROM coletas_portal
+            WHERE id = ANY(%s)
+              AND status IN ('CONCLUIDA', 'ERRO')
+            RETURNING id, status, resultado, erro_tipo, erro
+            """,
+            (list(ids),),
+        )
+        rows = cur.fetchall()
+        conn.commit()
+        return {
+            row[0]: {
+                "status": row[1],
+                "resultado": row[2],
+                "erro_tipo": row[3],
+                "erro": row[4],
+            }
+            for row in rows
+        }
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao buscar resultados de coletas do broker: %s", e)
+        return {}
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def cancelar_coletas_portal(ids):
+    """Remove coletas que o cliente desistiu de esperar; o broker ignora o resultado tardio."""
+    if not ids:
+        return
+
+    conn = get_connection()
+    if not conn:
+        return
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM coletas_portal WHERE id = ANY(%s)", (list(ids),))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao cancelar coletas do broker: %s", e)
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+# --- CICLOS DO MONITOR ---
+
+def registrar_ciclo_monitor(
+    *,
+    iniciado_em,
+    duracao_segundos,
+    orcamento_segundos,
+    lote_alvo,
+    reservados,
+    processados,
+    reconciliados,
+    vencidos_restantes,
+    duracao_media_segundos,
+    motivo_parada,
+):
+    conn = get_connection()
+    if not conn:
+        return
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO monitor_ciclos (
+                iniciado_em,
+                duracao_ms,
+                orcamento_segundos,
+                lote_alvo,
+                reservados,
+                processados,
+                reconciliados,
+                vencidos_restantes,
+                duracao_media_ms,
+                motivo_parada
+            )
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            (
+                iniciado_em,
+                int(duracao_segundos * 1000),
+                int(orcamento_segundos),
+                lote_alvo,
+                reservados,
+                processados,
+                reconciliados,
+                vencidos_restantes,
+                int(duracao_media_segundos * 1000),
+                motivo_parada,
+            ),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao registrar ciclo do monitor: %s", e)
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def obter_duracao_media_monitor():
+    """Última duração média por processo registrada (segundos), ou None."""
+    conn = get_connection()
+    if not conn:
+        return None
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT duracao_media_ms
+            FROM monitor_ciclos
+            WHERE processados > 0
+            ORDER BY id DESC
+            LIMIT 1
+            """
+        )
+        row = cur.fetchone()
+        return row[0] / 1000 if row and row[0] else None
+    except Exception as e:
+        logging.error("Erro ao buscar duração média do monitor: %s", e)
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def contar_processos_monitoramento_vencidos():
+    conn = get_connection()
+    if not conn:
+        return None
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT COUNT(*)
+            FROM processos
+            WHERE em_monitoramento = TRUE
+              AND monitoramento_proxima_verificacao <= CURRENT_TIMESTAMP
+            """
+        )
+        return cur.fetchone()[0]
+    except Exception as e:
+        logging.error("Erro ao contar processos vencidos do monitor: %s", e)
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+# --- CACHE DE SESSÕES ONELOG ---
+
+def obter_sessao_onelog_cache(chave):
+    """Retorna a sessão OneLog ainda válida gravada por qualquer robô, ou None."""
+    conn = get_connection()
+    if not conn:
+        return None
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT cookies, user_agent, setor, versao, expira_em
+            FROM onelog_sessoes_cache
+            WHERE chave = %s
+              AND expira_em > CURRENT_TIMESTAMP
+            """,
+            (chave,),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        return {
+            "cookies": row[0] or [],
+            "user_agent": row[1],
+            "setor": row[2],
+            "versao": row[3],
+            "expira_em": row[4],
+        }
+    except Exception as e:
+        logging.error("Erro ao consultar cache de sessão OneLog: %s", e)
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def salvar_sessao_onelog_cache(chave, cookies, user_agent, setor, expira_em):
+    conn = get_connection()
+    if not conn:
+        return None
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO onelog_sessoes_cache (
+                chave, cookies, user_agent, setor, versao, expira_em, atualizado_em
+            )
+            VALUES (%s, %s, %s, %s, 1, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (chave) DO UPDATE
+            SET cookies = EXCLUDED.cookies,
+                user_agent = EXCLUDED.user_agent,
+                setor = EXCLUDED.setor,
+                versao = onelog_sessoes_cache.versao + 1,
+                expira_em = EXCLUDED.expira_em,
+                atualizado_em = CURRENT_TIMESTAMP
+            RETURNING versao
+            """,
+            (chave, Json(cookies or []), user_agent, setor, expira_em),
+        )
+        versao = cur.fetchone()[0]
+        conn.commit()
+        return versao
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao salvar cache de sessão OneLog: %s", e)
+        return None
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def invalidar_sessao_onelog_cache(chave, versao=None):
+    """
+    Remove a sessão em cache. Com `versao`, só remove se ninguém gravou uma
+    sessão mais nova desde a leitura, para não descartar o login de outro robô.
+    """
+    conn = get_connection()
+    if not conn:
+        return
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            DELETE FROM onelog_sessoes_cache
+            WHERE chave = %s
+              AND (%s IS NULL OR versao = %s)
+            """,
+            (chave, versao, versao),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logging.error("Erro ao invalidar cache de sessão OneLog: %s", e)
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+# --- ARQUIVAMENTO E DEAD LETTER ---
+
+def _garantir_particoes_arquivo(cur, referencia=None):
+    """Cria as partições mensais (mês anterior, atual e seguinte) das tabelas de arquivo."""
+    referencia = referencia or date.today()
+    for deslocamento in (-1, 0, 1):
+        mes_absoluto = referencia.year * 12 + referencia.month - 1 + deslocamento
+        inicio = date(mes_absoluto // 12, mes_absoluto % 12 + 1, 1)
+        fim = date((mes_absoluto + 1) // 12, (mes_absoluto + 1) % 12 + 1, 1)
+        for tabela in ("tarefas_legal_one_arquivo", "twotask_notificacoes_arquivo"):
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {tabela}_{inicio:%Y%m}
+                PARTITION OF {tabela}
+                FOR VALUES FROM (%s) TO (%s)
+                """,
+                (inicio, fim),
+            )
+
+
+def arquivar_tarefas_finalizadas(*, retencao_dias=None, tamanho_lote=None):
+    """Move um lote de tarefas CONCLUIDO/DUPLICADO além da retenção para o arquivo.
+
+    Retorna quantas linhas saíram da fila (0 = nada mais a arquivar).
+    """
+    retencao_dias = ARCHIVE_RETENTION_DAYS if retencao_dias is None else retencao_dias
+    tamanho_lote = tamanho_lote or ARCHIVE_BATCH_SIZE
+
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        _garantir_particoes_arquivo(cur)
+        cur.execute(
+            """
+            WITH movidas AS (
+                DELETE FROM tarefas_legal_one
+                WHERE id IN (
+                    SELECT id
+                    FROM tarefas_legal_one
+                    WHERE status IN ('CONCLUIDO', 'DUPLICADO')
+                      AND COALESCE(data_conclusao, ultima_tentativa, data_criacao)
+                          < CURRENT_TIMESTAMP - (%s * INTERVAL '1 day')
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, tarefa_id, processo_cnj, solicitante_id, status, tentativas,
+                          ultimo_erro, prioridade, data_criacao, data_conclusao, ultima_tentativa
+            )
+            INSERT INTO tarefas_legal_one_arquivo (
+                id, tarefa_id, processo_cnj, solicitante_id, status, tentativas,
+                ultimo_erro, prioridade, data_criacao, data_conclusao, ultima_tentativa
+            )
+            SELECT * FROM movidas
+            """,
+            (retencao_dias, tamanho_lote),
+        )
+        movidas = cur.rowcount
+        conn.commit()
+        return movidas
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao arquivar tarefas finalizadas: {e}")
+        return 0
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def arquivar_notificacoes_twotask_finalizadas(*, max_tentativas, retencao_dias=None, tamanho_lote=None):
+    """Move um lote de notificações ENVIADO ou com ERRO definitivo para o arquivo.
+
+    ERRO definitivo: `max_tentativas` esgotadas ou falha de autenticação não
+    repetível. Retorna quantas linhas saíram da tabela.
+    """
+    retencao_dias = ARCHIVE_RETENTION_DAYS if retencao_dias is None else retencao_dias
+    tamanho_lote = tamanho_lote or ARCHIVE_BATCH_SIZE
+
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        _garantir_particoes_arquivo(cur)
+        cur.execute(
+            """
+            WITH movidas AS (
+                DELETE FROM twotask_notificacoes
+                WHERE id IN (
+                    SELECT id
+                    FROM twotask_notificacoes
+                    WHERE (
+                            status = 'ENVIADO'
+                            OR (
+                                status = 'ERRO'
+                                AND (
+                                    COALESCE(tentativas, 0) >= %s
+                                    OR COALESCE(ultimo_erro, '') LIKE 'AUTH_NON_RETRYABLE:%%'
+                                )
+                            )
+                       )
+                      AND data_atualizacao < CURRENT_TIMESTAMP - (%s * INTERVAL '1 day')
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, dedupe_key, numero_processo, id_responsavel, observacao, status,
+                          tentativas, ultimo_erro, data_criacao, data_envio, data_atualizacao
+            )
+            INSERT INTO twotask_notificacoes_arquivo (
+                id, dedupe_key, numero_processo, id_responsavel, observacao, status,
+                tentativas, ultimo_erro, data_criacao, data_envio, data_atualizacao
+            )
+            SELECT * FROM movidas
+            """,
+            (max_tentativas, retencao_dias, tamanho_lote),
+        )
+        movidas = cur.rowcount
+        conn.commit()
+        return movidas
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao arquivar notificações TwoTask: {e}")
+        return 0
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def mover_tarefas_esgotadas_para_dead_letter(*, tamanho_lote=None):
+    """Tira da fila um lote de tarefas em ERRO sem próxima tentativa. Retorna quantas."""
+    tamanho_lote = tamanho_lote or ARCHIVE_BATCH_SIZE
+
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            WITH movidas AS (
+                DELETE FROM tarefas_legal_one
+                WHERE id IN (
+                    SELECT id
+                    FROM tarefas_legal_one
+                    WHERE status = 'ERRO'
+                      AND proxima_tentativa IS NULL
+                      AND (reservada_ate IS NULL OR reservada_ate < CURRENT_TIMESTAMP)
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING tarefa_id, processo_cnj, solicitante_id, tentativas, ultimo_erro,
+                          prioridade, data_criacao, ultima_tentativa
+            )
+            INSERT INTO tarefas_legal_one_dead_letter (
+                tarefa_id, processo_cnj, solicitante_id, tentativas, ultimo_erro,
+                prioridade, data_criacao, ultima_tentativa
+            )
+            SELECT * FROM movidas
+            ON CONFLICT (tarefa_id) DO UPDATE
+            SET tentativas = EXCLUDED.tentativas,
+                ultimo_erro = EXCLUDED.ultimo_erro,
+                ultima_tentativa = EXCLUDED.ultima_tentativa,
+                movida_em = CURRENT_TIMESTAMP
+            """,
+            (tamanho_lote,),
+        )
+        movidas = cur.rowcount
+        conn.commit()
+        return movidas
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao mover tarefas esgotadas para o dead letter: {e}")
+        return 0
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def listar_dead_letter(limit=100):
+    conn = get_connection()
+    if not conn:
+        return []
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT tarefa_id, processo_cnj, solicitante_id, tentativas, ultimo_erro, movida_em
+            FROM tarefas_legal_one_dead_letter
+            ORDER BY movida_em DESC, tarefa_id DESC
+            LIMIT %s
+            """,
+            (limit,),
+        )
+        return [
+            {
+                "tarefa_id": row[0],
+                "processo_cnj": row[1],
+                "solicitante_id": row[2],
+                "tentativas": row[3],
+                "ultimo_erro": row[4],
+                "movida_em": row[5],
+            }
+            for row in cur.fetchall()
+        ]
+    except Exception as e:
+        logging.error(f"Erro ao listar o dead letter: {e}")
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+def reenfileirar_dead_letter(tarefa_ids=None):
+    """Devolve tarefas do dead letter à fila como PENDENTE, com as tentativas zeradas.
+
+    Sem `tarefa_ids`, devolve todas. Tarefas cujo CNJ/solicitante já tem
+    outra tarefa aberta continuam no dead letter. Retorna os ids reenfileirados.
+    """
+    conn = get_connection()
+    if not conn:
+        return []
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            WITH escolhidas AS (
+                SELECT *
+                FROM tarefas_legal_one_dead_letter
+                WHERE %s IS NULL OR tarefa_id = ANY(%s)
+                FOR UPDATE
+            ),
+            inseridas AS (
+                INSERT INTO tarefas_legal_one (
+                    tarefa_id, processo_cnj, solicitante_id, status, tentativas,
+                    prioridade, data_criacao, ordem_fila
+                )
+                SELECT
+                    tarefa_id, processo_cnj, solicitante_id, 'PENDENTE', 0,
+                    COALESCE(prioridade, 0), data_criacao,
+                    CURRENT_TIMESTAMP - (COALESCE(prioridade, 0) * %s * INTERVAL '1 minute')
+                FROM escolhidas
+                ON CONFLICT DO NOTHING
+                RETURNING tarefa_id
+            )
+            DELETE FROM tarefas_legal_one_dead_letter d
+            USING inseridas i
+            WHERE d.tarefa_id = i.tarefa_id
+            RETURNING d.tarefa_id
+            """,
+            (
+                None if tarefa_ids is None else True,
+                list(tarefa_ids or []),
+                TASK_PRIORITY_MINUTES_PER_POINT,
+            ),
+        )
+        reenfileiradas = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return reenfileiradas
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao reenfileirar tarefas do dead letter: {e}")
+        return []
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
+
+
+# Tabelas de histórico -> coluna de data usada na retenção.
+_TABELAS_HISTORICO = {
+    "tempos_etapas": "criado_em",
+    "monitor_ciclos": "criado_em",
+}
+
+
+def apagar_historico_antigo(tabela, *, retencao_dias=None, tamanho_lote=None):
+    """Apaga um lote de linhas de `tabela` além da retenção. Retorna quantas."""
+    coluna = _TABELAS_HISTORICO[tabela]
+    retencao_dias = HISTORY_RETENTION_DAYS if retencao_dias is None else retencao_dias
+    tamanho_lote = tamanho_lote or ARCHIVE_BATCH_SIZE
+    if retencao_dias <= 0:
+        return 0
+
+    conn = get_connection()
+    if not conn:
+        return 0
+
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"""
+            DELETE FROM {tabela}
+            WHERE id IN (
+                SELECT id
+                FROM {tabela}
+                WHERE {coluna} < CURRENT_TIMESTAMP - (%s * INTERVAL '1 day')
+                ORDER BY id
+                LIMIT %s
+            )
+            """,
+            (retencao_dias, tamanho_lote),
+        )
+        apagadas = cur.rowcount
+        conn.commit()
+        return apagadas
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao apagar histórico antigo de {tabela}: {e}")
+        return 0
+    finally:
+        if cur:
+            cur.close()
+        conn.close()
@@ -0,0 +1,42 @@
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from app_logging import build_logging_handlers
+from rpa.portal_broker import BrokerRPARunner
+from rpa.worker_pool import ProcessadorWorkerPool
+
+
+os.makedirs("logs", exist_ok=True)
+loki_handlers, loki_enabled = build_logging_handlers(
+    "logs/broker.log",
+    service="broker",
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - [BROKER] %(message)s",
+    handlers=loki_handlers,
+)
+
+load_dotenv()
+
+if not loki_enabled:
+    logging.warning("Envio ao Loki desabilitado (LOKI_URL vazio). Logs seguirão apenas para stdout/arquivo.")
+
+
+def criar_pool():
+    workers = int(os.getenv("RPA_BROKER_WORKERS", "2"))
+    return ProcessadorWorkerPool(
+        workers=workers,
+        chrome_budget=int(os.getenv("RPA_BROKER_CHROME_BUDGET") or workers),
+        runner_cls=BrokerRPARunner,
+        service="broker",
+        idle_seconds=int(os.getenv("RPA_BROKER_IDLE_SECONDS", "30")),
+    )
+
+
+if __name__ == "__main__":
+    print("\n--- 🧰 BROKER DE BROWSERS DO PORTAL ---")
+    criar_pool().run_forever()
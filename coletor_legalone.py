@@ -4,6 +4,7 @@ import sys
 import os
 from dotenv import load_dotenv
 
+import app_metrics
 from app_logging import build_logging_handlers
 
 # Garante que a pasta de logs existe
@@ -23,7 +24,7 @@ logging.basicConfig(
 load_dotenv()
 
 if not loki_enabled:
-    logging.warning("logging_loki não instalado. Logs seguirão apenas para stdout/arquivo.")
+    logging.warning("Envio ao Loki desabilitado (LOKI_URL vazio). Logs seguirão apenas para stdout/arquivo.")
 
 # Ajuste de Path para garantir importações
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
@@ -37,6 +38,7 @@ except ImportError as e:
 
 def job_coleta():
     logging.info("🚀 Iniciando ciclo de coleta no Legal One...")
+    inicio = time.monotonic()
     try:
         # Inicializa banco se precisar
         database.inicializar_banco()
@@ -46,6 +48,8 @@ def job_coleta():
         
     except Exception as e:
         logging.error(f"❌ Erro durante a coleta: {e}")
+    finally:
+        app_metrics.CICLO_DURACAO.observe(time.monotonic() - inicio, robo="coletor")
     
     logging.info("💤 Coleta finalizada. Aguardando próximo ciclo.")
 
@@ -53,6 +57,7 @@ if __name__ == "__main__":
     import schedule
 
     print("\n--- 📡 ROBÔ COLETOR LEGAL ONE (20 em 20 min) ---")
+    app_metrics.iniciar_servidor("coletor")
     
     # Executa imediatamente na partida
     job_coleta()
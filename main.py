@@ -8,8 +8,10 @@ import undetected_chromedriver as uc
 from dotenv import load_dotenv
 from selenium.common.exceptions import WebDriverException
 
+import app_metrics
 from app_logging import build_logging_handlers
 from rpa import AuthService, BrowserFactory, PortalClient, PortalRPARunner, ProcessoService
+from rpa.broker_client import PortalBrokerClient
 from rpa.exceptions import RPAError
 
 
@@ -28,10 +30,15 @@ logging.basicConfig(
 load_dotenv()
 
 if not loki_enabled:
-    logging.warning("logging_loki não instalado. Logs seguirão apenas para stdout/arquivo.")
+    logging.warning("Envio ao Loki desabilitado (LOKI_URL vazio). Logs seguirão apenas para stdout/arquivo.")
+
+BROKER_ENABLED = os.getenv("RPA_BROKER_ENABLED", "false").strip().lower() in {"1", "true", "yes", "on"}
 
 BROWSER_FACTORY = BrowserFactory()
-DEFAULT_RUNNER = PortalRPARunner(browser_factory=BROWSER_FACTORY)
+DEFAULT_RUNNER = PortalRPARunner(
+    browser_factory=BROWSER_FACTORY,
+    broker=PortalBrokerClient("processador") if BROKER_ENABLED else None,
+)
 atexit.register(DEFAULT_RUNNER.close)
 
 
@@ -111,10 +118,23 @@ def job_processar_portal():
     DEFAULT_RUNNER.run_cycle()
 
 
+def executar_pool_de_workers():
+    from rpa.worker_pool import ProcessadorWorkerPool
+
+    print("\n--- 🤖 ROBÔ PROCESSADOR PORTAL (pool de workers) ---")
+    ProcessadorWorkerPool().run_forever()
+
+
 if __name__ == "__main__":
     import schedule
 
+    # Com broker os browsers ficam no broker_rpa.py; o pool local não se aplica.
+    if int(os.getenv("RPA_WORKERS", "1")) > 1 and not BROKER_ENABLED:
+        executar_pool_de_workers()
+        sys.exit(0)
+
     print("\n--- 🤖 ROBÔ PROCESSADOR PORTAL (5 em 5 min) ---")
+    app_metrics.iniciar_servidor("processador")
 
     job_processar_portal()
     schedule.every(5).minutes.do(job_processar_portal)
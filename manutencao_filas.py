@@ -0,0 +1,138 @@
+"""Manutenção das filas: arquivamento por retenção, dead letter e limpeza do histórico.
+
+Uso:
+    python manutencao_filas.py arquivar            # uma rodada
+    python manutencao_filas.py arquivar --loop     # a cada RPA_ARCHIVE_INTERVAL_MINUTES
+    python manutencao_filas.py dead-letter listar
+    python manutencao_filas.py dead-letter reenfileirar 123 456
+    python manutencao_filas.py dead-letter reenfileirar --todos
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+import bd.database as database
+from app_logging import build_logging_handlers
+
+
+os.makedirs("logs", exist_ok=True)
+loki_handlers, loki_enabled = build_logging_handlers(
+    "logs/manutencao.log",
+    service="manutencao",
+)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - [MANUTENCAO] %(message)s",
+    handlers=loki_handlers,
+)
+
+load_dotenv()
+
+
+def _drenar(descricao, mover_lote):
+    """Chama `mover_lote` até ele devolver 0 (cada chamada é uma transação curta)."""
+    total = 0
+    while True:
+        movidas = mover_lote()
+        if not movidas:
+            break
+        total += movidas
+    if total:
+        logging.info("🗄️ %s: %s linha(s).", descricao, total)
+    return total
+
+
+def job_arquivar():
+    logging.info("🧹 Iniciando manutenção das filas.")
+    _drenar("Tarefas esgotadas movidas para o dead letter", database.mover_tarefas_esgotadas_para_dead_letter)
+    _drenar("Tarefas finalizadas arquivadas", database.arquivar_tarefas_finalizadas)
+    _drenar(
+        "Notificações TwoTask arquivadas",
+        lambda: database.arquivar_notificacoes_twotask_finalizadas(
+            max_tentativas=int(os.getenv("API_NOTIFICACAO_MAX_TENTATIVAS", "5")),
+        ),
+    )
+    for tabela in ("tempos_etapas", "monitor_ciclos"):
+        _drenar(f"Histórico antigo apagado de {tabela}", lambda tabela=tabela: database.apagar_historico_antigo(tabela))
+    logging.info("✅ Manutenção das filas concluída.")
+
+
+def listar_dead_letter(limite):
+    tarefas = database.listar_dead_letter(limite)
+    if not tarefas:
+        print("📭 Dead letter vazio.")
+        return
+    for tarefa in tarefas:
+        print(
+            f"{tarefa['tarefa_id']:>12}  {tarefa['processo_cnj'] or '-':<25}  "
+            f"tentativas={tarefa['tentativas'] or 0}  movida_em={tarefa['movida_em']:%d/%m/%Y %H:%M}  "
+            f"{(tarefa['ultimo_erro'] or '')[:80]}"
+        )
+
+
+def reenfileirar_dead_letter(tarefa_ids, todos):
+    if not tarefa_ids and not todos:
+        sys.exit("Informe os ids das tarefas ou --todos.")
+    reenfileiradas = database.reenfileirar_dead_letter(None if todos else tarefa_ids)
+    logging.info("♻️ %s tarefa(s) devolvida(s) à fila: %s", len(reenfileiradas), reenfileiradas)
+    if not todos:
+        ficaram = sorted(set(tarefa_ids) - set(reenfileiradas))
+        if ficaram:
+            logging.warning(
+                "⚠️ Continuam no dead letter (inexistentes ou com outra tarefa aberta do mesmo CNJ/solicitante): %s",
+                ficaram,
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    arquivar = comandos.add_parser("arquivar", help="arquiva linhas terminais e esvazia as tarefas esgotadas")
+    arquivar.add_argument("--loop", action="store_true", help="repete a cada RPA_ARCHIVE_INTERVAL_MINUTES")
+
+    dead_letter = comandos.add_parser("dead-letter", help="consulta ou reenfileira o dead letter")
+    acoes = dead_letter.add_subparsers(dest="acao", required=True)
+    listar = acoes.add_parser("listar")
+    listar.add_argument("--limite", type=int, default=100)
+    reenfileirar = acoes.add_parser("reenfileirar")
+    reenfileirar.add_argument("tarefa_ids", type=int, nargs="*")
+    reenfileirar.add_argument("--todos", action="store_true")
+
+    args = parser.parse_args(argv)
+
+    if args.comando == "dead-letter":
+        if args.acao == "listar":
+            listar_dead_letter(args.limite)
+        else:
+            reenfileirar_dead_letter(args.tarefa_ids, args.todos)
+        return
+
+    # Uma vez por processo: o DDL e a deduplicação de partida não entram no
+    # ciclo (cada arquivamento já garante as próprias partições).
+    database.inicializar_banco()
+    job_arquivar()
+    if not args.loop:
+        return
+
+    import schedule
+
+    if not loki_enabled:
+        logging.warning("Envio ao Loki desabilitado (LOKI_URL vazio). Logs seguirão apenas para stdout/arquivo.")
+
+    intervalo = int(os.getenv("RPA_ARCHIVE_INTERVAL_MINUTES", "60"))
+    print(f"\n--- 🧹 MANUTENÇÃO DAS FILAS ({intervalo} em {intervalo} min) ---")
+    schedule.every(intervalo).minutes.do(job_arquivar)
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 import atexit
 import logging
 import os
+import select
 import time
 
 from dotenv import load_dotenv
 
+import app_metrics
 from app_logging import build_logging_handlers
+from bd import database
 from rpa import BrowserFactory, MonitorRPARunner
+from rpa.broker_client import PortalBrokerClient
 from utils import twotask_api as twotask
+from utils.twotask_outbox import TwoTaskOutboxSender
 
 
 os.makedirs("logs", exist_ok=True)
@@ -25,14 +30,37 @@ logging.basicConfig(
 load_dotenv()
 
 if not loki_enabled:
-    logging.warning("logging_loki não instalado. Logs seguirão apenas para stdout/arquivo.")
+    logging.warning("Envio ao Loki desabilitado (LOKI_URL vazio). Logs seguirão apenas para stdout/arquivo.")
 
 
+OUTBOX_SENDER = None
+if os.getenv("API_NOTIFICACAO_ASYNC", "true").strip().lower() in {"1", "true", "yes", "on"}:
+    OUTBOX_SENDER = TwoTaskOutboxSender(twotask.post_to_api)
+
 MONITOR_RUNNER = MonitorRPARunner(
     browser_factory=BrowserFactory(),
     notifier=twotask.post_to_api,
+    outbox_sender=OUTBOX_SENDER,
+    broker=(
+        PortalBrokerClient("monitor")
+        if os.getenv("RPA_BROKER_ENABLED", "false").strip().lower() in {"1", "true", "yes", "on"}
+        else None
+    ),
 )
 atexit.register(MONITOR_RUNNER.close)
+if OUTBOX_SENDER is not None:
+    atexit.register(OUTBOX_SENDER.stop)
+
+
+# Processo recém-marcado pelo processador (NOTIFY em MONITOR_CHANNEL)
+# antecipa o ciclo, respeitando este intervalo mínimo desde o último.
+PUSH_MIN_INTERVAL_SECONDS = float(os.getenv("RPA_MONITOR_PUSH_MIN_INTERVAL_SECONDS", "30"))
+PUSH_RECONNECT_SECONDS = 60
+
+_conn_escuta = None
+_proxima_conexao_escuta = 0.0
+_ultimo_ciclo_inicio = 0.0
+_ultimo_ciclo_fim = 0.0
 
 
 def verificar_processos_em_monitoramento():
@@ -40,19 +68,72 @@ def verificar_processos_em_monitoramento():
 
 
 def job():
+    global _ultimo_ciclo_inicio, _ultimo_ciclo_fim
     logging.info("⏰ Iniciando ciclo agendado de monitoramento.")
-    verificar_processos_em_monitoramento()
+    _ultimo_ciclo_inicio = time.monotonic()
+    try:
+        verificar_processos_em_monitoramento()
+    finally:
+        _ultimo_ciclo_fim = time.monotonic()
     logging.info("💤 Ciclo finalizado. Aguardando próximo agendamento.")
 
 
+def aguardar_processos_novos(timeout):
+    """Espera até `timeout` segundos por NOTIFY de processo recém-monitorado."""
+    global _conn_escuta, _proxima_conexao_escuta
+
+    if _conn_escuta is None and time.monotonic() >= _proxima_conexao_escuta:
+        _conn_escuta = database.abrir_conexao_escuta(database.MONITOR_CHANNEL)
+        if _conn_escuta is None:
+            _proxima_conexao_escuta = time.monotonic() + PUSH_RECONNECT_SECONDS
+
+    if _conn_escuta is None:
+        time.sleep(timeout)
+        return False
+
+    try:
+        prontos, _, _ = select.select([_conn_escuta], [], [], timeout)
+        if not prontos:
+            return False
+        _conn_escuta.poll()
+        if not _conn_escuta.notifies:
+            return False
+        _conn_escuta.notifies.clear()
+        return True
+    except Exception as exc:
+        logging.warning("⚠️ Conexão de escuta do monitor caiu. Seguindo só com o agendamento: %s", exc)
+        try:
+            _conn_escuta.close()
+        except Exception:
+            pass
+        _conn_escuta = None
+        _proxima_conexao_escuta = time.monotonic() + PUSH_RECONNECT_SECONDS
+        return False
+
+
 if __name__ == "__main__":
     import schedule
 
     print("\n--- 🕵️ ROBÔ DE MONITORAMENTO EM EXECUÇÃO (LOOP) ---")
+    app_metrics.iniciar_servidor("monitor")
+    if OUTBOX_SENDER is not None:
+        database.inicializar_banco()
+        OUTBOX_SENDER.start()
 
     schedule.every(5).minutes.do(job)
     job()
 
+    notificado_em = None
     while True:
         schedule.run_pending()
-        time.sleep(1)
+        if aguardar_processos_novos(1) and notificado_em is None:
+            notificado_em = time.monotonic()
+        if notificado_em is None:
+            continue
+        if _ultimo_ciclo_inicio >= notificado_em:
+            # Um ciclo agendado já começou depois do aviso e pegou a fila prioritária.
+            notificado_em = None
+        elif time.monotonic() - _ultimo_ciclo_fim >= PUSH_MIN_INTERVAL_SECONDS:
+            notificado_em = None
+            logging.info("📬 Processo novo em monitoramento: antecipando o ciclo.")
+            job()
@@ -9,6 +9,7 @@ from .exceptions import (
     PortalTimeoutError,
     RPAError,
     SessionExpiredError,
+    TaskDeadlineExceededError,
     TemporaryPortalError,
 )
 from .portal_client import PortalClient
@@ -31,5 +32,6 @@ __all__ = [
     "ProcessoService",
     "RPAError",
     "SessionExpiredError",
+    "TaskDeadlineExceededError",
     "TemporaryPortalError",
 ]
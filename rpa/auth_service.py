@@ -2,6 +2,7 @@ import logging
 import os
 import time
 from contextlib import contextmanager
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
 from selenium.common.exceptions import TimeoutException, WebDriverException
@@ -10,7 +11,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 from .exceptions import LoginError, OneLogUnavailableError, PortalTimeoutError
-from . import onelog_client
+from . import onelog_client, timing
 
 
 class AuthService:
@@ -42,6 +43,47 @@ class AuthService:
         self.login_stage_attempts = int(os.getenv("RPA_LOGIN_STAGE_ATTEMPTS", "3"))
         self.login_lock_enabled = self._env_flag("RPA_LOGIN_LOCK_ENABLED", True)
         self.login_lock_id = int(os.getenv("RPA_LOGIN_LOCK_ID", "6012026042001"))
+        self.session_cache_enabled = self._env_flag("ONELOG_SESSION_CACHE_ENABLED", True)
+        self.session_cache_ttl_minutes = int(os.getenv("ONELOG_SESSION_CACHE_TTL_MINUTES", "30"))
+        self.session_cache_probe_timeout = int(
+            os.getenv("ONELOG_SESSION_CACHE_PROBE_TIMEOUT", "20")
+        )
+        # Versão do cache que este browser já injetou. Se precisarmos logar de
+        # novo e o cache ainda estiver nessa versão, ela é a sessão que caiu.
+        self._cached_session_version = None
+        # User-agent aplicado via CDP (sessão do OneLog); acompanha os cookies
+        # quando a sessão é levada para um browser novo.
+        self._user_agent = None
+
+    def exportar_sessao(self):
+        """Cookies (todos os domínios) e user-agent deste browser, para `restaurar_sessao`."""
+        try:
+            cookies = self.driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies") or []
+        except WebDriverException as exc:
+            logging.warning("⚠️ Não foi possível exportar a sessão do browser: %s", exc)
+            return None
+        return {
+            "cookies": cookies,
+            "user_agent": self._user_agent,
+            "versao_cache": self._cached_session_version,
+        }
+
+    def restaurar_sessao(self, sessao):
+        """Injeta num browser novo a sessão exportada do anterior, evitando um login.
+
+        A validação fica para o `ensure_authenticated` seguinte (probe normal).
+        """
+        if not sessao or not sessao.get("cookies"):
+            return False
+        try:
+            if sessao.get("user_agent"):
+                self._set_user_agent(sessao["user_agent"])
+            self._inject_cookies(sessao["cookies"], origem="browser anterior")
+        except (LoginError, WebDriverException) as exc:
+            logging.warning("⚠️ Não foi possível restaurar a sessão no browser novo: %s", exc)
+            return False
+        self._cached_session_version = sessao.get("versao_cache")
+        return True
 
     def ensure_authenticated(self, force_login=False):
         if not self._credentials_configured():
@@ -62,9 +104,13 @@ class AuthService:
         logging.info("🔐 Autenticação necessária. Iniciando login no portal.")
         return self.login()
 
+    @timing.cronometrado("auth.login_onelog")
     def login_with_onelog(self):
         with self._login_lock():
             try:
+                if self._login_with_cached_session():
+                    return True
+
                 session_data = onelog_client.get_session()
                 cookies = session_data.get("cookies") or []
                 user_agent = session_data.get("user_agent")
@@ -76,6 +122,7 @@ class AuthService:
                 self.driver.get(self.PORTAL_HOME_URL)
                 self.wait_for_document_ready(timeout=self.login_timeout)
                 self._wait_until_authenticated(timeout=self.login_timeout)
+                self._store_cached_session(cookies, user_agent)
                 onelog_client.renew_session()
                 logging.info("✅ Login via OneLog confirmado em %s", self.safe_current_url())
                 return True
@@ -90,6 +137,7 @@ class AuthService:
                     expected="sessão autenticada por cookies do OneLog",
                 ) from exc
 
+    @timing.cronometrado("auth.login_sso")
     def login(self):
         usuario = os.getenv("BB_USUARIO")
         senha = os.getenv("BB_SENHA")
@@ -125,6 +173,97 @@ class AuthService:
                     expected="URL autenticada e ausência dos campos de login",
                 ) from exc
 
+    @timing.cronometrado("auth.login_cache")
+    def _login_with_cached_session(self):
+        """Tenta autenticar com a sessão OneLog mais recente de qualquer robô.
+
+        Roda dentro do lock global de login: quem esperou o lock enquanto
+        outro robô logava encontra aqui os cookies recém-gravados e não
+        enfileira um novo login no OneLog.
+        """
+        if not self.session_cache_enabled:
+            return False
+
+        from bd import database
+
+        cache_key = onelog_client.session_cache_key()
+        cached = database.obter_sessao_onelog_cache(cache_key)
+        if not cached or not cached.get("cookies"):
+            return False
+
+        if cached["versao"] == self._cached_session_version:
+            logging.info(
+                "🗑️ Sessão OneLog em cache (versão %s) é a que expirou neste browser. Descartando.",
+                cached["versao"],
+            )
+            database.invalidar_sessao_onelog_cache(cache_key, cached["versao"])
+            return False
+
+        logging.info(
+            "♻️ Reaproveitando sessão OneLog em cache (versão %s, expira em %s).",
+            cached["versao"],
+            cached["expira_em"],
+        )
+        self._cached_session_version = cached["versao"]
+        try:
+            if cached.get("user_agent"):
+                self._set_user_agent(cached["user_agent"])
+            self._inject_cookies(cached["cookies"])
+            self.driver.get(self.PORTAL_HOME_URL)
+            self.wait_for_document_ready(timeout=self.session_cache_probe_timeout)
+            self._wait_until_authenticated(timeout=self.session_cache_probe_timeout)
+        except (LoginError, PortalTimeoutError, TimeoutException, WebDriverException) as exc:
+            logging.warning(
+                "⚠️ Sessão OneLog em cache não autenticou (%s). Solicitando sessão nova.",
+                exc,
+            )
+            database.invalidar_sessao_onelog_cache(cache_key, cached["versao"])
+            self._clear_browser_cookies()
+            return False
+
+        onelog_client.adopt_sector(cached.get("setor"))
+        onelog_client.renew_session()
+        logging.info("✅ Login via cache de sessão OneLog confirmado em %s", self.safe_current_url())
+        return True
+
+    def _store_cached_session(self, cookies, user_agent):
+        if not self.session_cache_enabled:
+            return
+
+        from bd import database
+
+        versao = database.salvar_sessao_onelog_cache(
+            onelog_client.session_cache_key(),
+            cookies,
+            user_agent,
+            onelog_client.current_sector(),
+            self._session_cache_expiry(cookies),
+        )
+        if versao is not None:
+            self._cached_session_version = versao
+            logging.info("💾 Sessão OneLog gravada no cache compartilhado (versão %s).", versao)
+
+    def _session_cache_expiry(self, cookies):
+        expira_em = datetime.now() + timedelta(minutes=self.session_cache_ttl_minutes)
+        for cookie in cookies or []:
+            expires = cookie.get("expires") or cookie.get("expiry") or cookie.get("expirationDate")
+            try:
+                expires = float(expires)
+            except (TypeError, ValueError):
+                continue
+            # Cookies de sessão chegam com expires <= 0; só limitam o cache os
+            # que têm validade absoluta no futuro.
+            if expires <= time.time():
+                continue
+            expira_em = min(expira_em, datetime.fromtimestamp(expires))
+        return expira_em
+
+    def _clear_browser_cookies(self):
+        try:
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        except WebDriverException as exc:
+            logging.warning("⚠️ Não foi possível limpar cookies do browser: %s", exc)
+
     def is_session_active(self, probe=False):
         if self._looks_authenticated():
             return True
@@ -133,14 +272,15 @@ class AuthService:
             return False
 
         logging.info("🔎 Validando sessão ativa no portal.")
-        self.driver.get(self.PORTAL_HOME_URL)
-        self.wait_for_document_ready(timeout=min(self.timeout, 20))
-        if self.is_access_error_page():
-            logging.warning(
-                "⚠️ Portal respondeu com página de erro de acesso durante a validação da sessão."
-            )
-            return False
-        return self._looks_authenticated()
+        with timing.span("auth.probe_sessao"):
+            self.driver.get(self.PORTAL_HOME_URL)
+            self.wait_for_document_ready(timeout=min(self.timeout, 20))
+            if self.is_access_error_page():
+                logging.warning(
+                    "⚠️ Portal respondeu com página de erro de acesso durante a validação da sessão."
+                )
+                return False
+            return self._looks_authenticated()
 
     def is_login_page(self):
         current_url = self.safe_current_url().lower()
@@ -377,10 +517,11 @@ class AuthService:
                 "Network.setUserAgentOverride",
                 {"userAgent": user_agent},
             )
+            self._user_agent = user_agent
         except WebDriverException as exc:
             logging.warning("⚠️ Não foi possível aplicar user-agent do OneLog: %s", exc)
 
-    def _inject_cookies(self, cookies):
+    def _inject_cookies(self, cookies, *, origem="OneLog"):
         if not cookies:
             raise LoginError(
                 "OneLog não retornou cookies",
@@ -403,7 +544,7 @@ class AuthService:
 
         self.driver.execute_cdp_cmd("Network.enable", {})
         self.driver.execute_cdp_cmd("Network.setCookies", {"cookies": cdp_cookies})
-        logging.info("🍪 %s cookies injetados a partir do OneLog.", len(cdp_cookies))
+        logging.info("🍪 %s cookies injetados a partir do %s.", len(cdp_cookies), origem)
 
     @staticmethod
     def _format_cookie_for_cdp(cookie):
@@ -0,0 +1,106 @@
+import logging
+import os
+import select
+import time
+
+from bd import database
+
+from . import exceptions
+from .exceptions import PortalTimeoutError, TemporaryPortalError
+
+
+class PortalBrokerClient:
+    """Cliente do broker de browsers (`broker_rpa.py`).
+
+    Em vez de abrir Chrome e fazer login próprios, o processador e o monitor
+    enfileiram coletas em `coletas_portal` e esperam o resultado, que o
+    broker grava na mesma linha (aviso por NOTIFY, com polling de reserva).
+
+    Cada coleta abre o processo (NPJ direto e/ou consulta rápida pelo CNJ) e
+    lê a lista de subsídios. O broker já faz os retries e a recuperação de
+    browser; erros voltam com a mesma classe de `rpa.exceptions`.
+    """
+
+    def __init__(self, origem, *, timeout=None, intervalo_poll=None):
+        self.origem = origem
+        # Inclui o tempo na fila: com o broker ocupado a coleta espera vaga.
+        self.timeout = timeout or float(os.getenv("RPA_BROKER_TIMEOUT_SECONDS", "900"))
+        self.intervalo_poll = intervalo_poll or float(os.getenv("RPA_BROKER_POLL_SECONDS", "2"))
+        self._conn_escuta = None
+
+    def coletar(self, cnj, **parametros):
+        """Coleta um processo e retorna `{"npj", "dados", "status"}`."""
+        for _, linha in self.coletar_varios([{"cnj": cnj, **parametros}]):
+            return self.desembrulhar(linha)
+        raise TemporaryPortalError(f"Broker não devolveu a coleta do CNJ {cnj}")
+
+    def coletar_varios(self, coletas):
+        """Enfileira todas as coletas e gera `(indice, linha)` conforme terminam.
+
+        `linha` é o registro bruto; use `desembrulhar` para obter o resultado
+        ou a exceção. Coletas não devolvidas no timeout são canceladas.
+        """
+        ids = database.submeter_coletas_portal(self.origem, coletas)
+        if not ids:
+            raise TemporaryPortalError(
+                "Broker de browsers indisponível",
+                expected="coletas aceitas na fila coletas_portal",
+            )
+
+        indice_por_id = {coleta_id: indice for indice, coleta_id in enumerate(ids)}
+        pendentes = set(ids)
+        limite = time.monotonic() + self.timeout
+        try:
+            while pendentes:
+                for coleta_id, linha in database.retirar_coletas_portal_finalizadas(pendentes).items():
+                    pendentes.discard(coleta_id)
+                    yield indice_por_id[coleta_id], linha
+
+                if not pendentes:
+                    return
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise PortalTimeoutError(
+                        f"Broker não devolveu {len(pendentes)} coleta(s) em {self.timeout:.0f}s",
+                        expected="resultado do broker de browsers",
+                    )
+                self._aguardar_resultado(min(restante, self.intervalo_poll))
+        finally:
+            if pendentes:
+                database.cancelar_coletas_portal(pendentes)
+
+    @staticmethod
+    def desembrulhar(linha):
+        if linha["status"] == "CONCLUIDA":
+            return linha["resultado"] or {}
+
+        classe = getattr(exceptions, linha.get("erro_tipo") or "", None)
+        if not (isinstance(classe, type) and issubclass(classe, exceptions.RPAError)):
+            classe = TemporaryPortalError
+        raise classe(f"[broker] {linha.get('erro') or 'falha sem mensagem'}")
+
+    def close(self):
+        if self._conn_escuta is None:
+            return
+        try:
+            self._conn_escuta.close()
+        except Exception:
+            pass
+        self._conn_escuta = None
+
+    def _aguardar_resultado(self, timeout):
+        if self._conn_escuta is None:
+            self._conn_escuta = database.abrir_conexao_escuta(database.COLETAS_RESULTADO_CHANNEL)
+        if self._conn_escuta is None:
+            time.sleep(timeout)
+            return
+
+        try:
+            prontos, _, _ = select.select([self._conn_escuta], [], [], timeout)
+            if prontos:
+                self._conn_escuta.poll()
+                self._conn_escuta.notifies.clear()
+        except Exception as exc:
+            logging.warning("⚠️ Conexão de escuta do broker caiu. Seguindo por polling: %s", exc)
+            self.close()
@@ -8,6 +8,7 @@ from pathlib import Path
 
 import undetected_chromedriver as uc
 
+from .chrome_reaper import CEIFADOR
 from .exceptions import BrowserInitializationError
 
 
@@ -19,9 +20,16 @@ def _env_flag(name, default=False):
 
 
 class BrowserFactory:
-    def __init__(self):
+    DEFAULT_TEMP_PROFILE_PREFIX = "onesid-rpa-chrome-"
+
+    def __init__(self, *, temp_profile_prefix=None, profile_subdir=None):
         self.version_main = self._resolve_version_main()
         self.profile_dir = os.getenv("RPA_CHROME_PROFILE_DIR")
+        # Chromes do mesmo host não podem dividir um --user-data-dir: o lock
+        # do perfil derruba os seguintes (pool de workers usa um subdiretório
+        # por worker).
+        if self.profile_dir and profile_subdir:
+            self.profile_dir = str(Path(self.profile_dir) / profile_subdir)
         self.headless = _env_flag("RPA_HEADLESS", False)
         self.no_sandbox = _env_flag("RPA_CHROME_NO_SANDBOX", False)
         self.disable_gpu = _env_flag("RPA_CHROME_DISABLE_GPU", False)
@@ -31,7 +39,9 @@ class BrowserFactory:
             self.cache_dir = Path(appdata) / "undetected_chromedriver"
         else:
             self.cache_dir = Path.home() / ".local" / "share" / "undetected_chromedriver"
-        self.temp_profile_prefix = "onesid-rpa-chrome-"
+        # Workers do mesmo host usam prefixos próprios: a limpeza de perfis
+        # órfãos de um worker não pode apagar o perfil em uso por outro.
+        self.temp_profile_prefix = temp_profile_prefix or self.DEFAULT_TEMP_PROFILE_PREFIX
         self._cleanup_stale_temp_profiles()
 
     def build_options(self):
@@ -58,6 +68,9 @@ class BrowserFactory:
     def create_browser(self):
         options = self.build_options()
         profile_path, persistent_profile = self._resolve_profile_path()
+        if persistent_profile and not CEIFADOR.aguardar_perfil(profile_path):
+            # O Chrome anterior ainda segura o perfil: mata pelo padrão.
+            self._kill_chrome_tree(profile_path)
         try:
             return self._start_chrome(
                 options,
@@ -140,10 +153,43 @@ class BrowserFactory:
             # ANTES de neutralizarmos o finalizador do driver.
             self._close_command_executor(driver)
             self._kill_driver_service(driver)
-            self._kill_chrome_tree(profile_path)
+            browser_pgid = self._browser_pgid(driver)
+            processos = (
+                getattr(driver, "browser_process", None),
+                getattr(getattr(driver, "service", None), "process", None),
+            )
+            if browser_pgid is None:
+                self._kill_chrome_tree(profile_path)
             self._neutralize_driver_finalizer(driver)
-            if profile_path:
-                self._cleanup_profile_dir(Path(profile_path), persistent_profile)
+            # SIGTERM no grupo agora; SIGKILL, recolha dos processos e remoção
+            # do perfil temporário ficam com o ceifador, fora do caminho da tarefa.
+            CEIFADOR.encerrar(
+                pgid=browser_pgid,
+                processos=processos,
+                perfil=profile_path,
+                apagar_perfil=not persistent_profile,
+            )
+
+    @staticmethod
+    def _browser_pgid(driver):
+        """PGID da árvore do Chrome, quando ele foi lançado em sessão própria.
+
+        O uc.Chrome vendorizado sobe o browser com `start_new_session`, então
+        o PID do browser é também o id do grupo de todos os seus filhos.
+        Sem o Popen (Windows, `debugger_address`), não há grupo confiável.
+        """
+        if os.name != "posix" or getattr(driver, "browser_process", None) is None:
+            return None
+        return getattr(driver, "browser_pid", None)
+
+    def abortar_comandos(self, driver):
+        """Faz falhar a chamada pendente ao chromedriver (e as próximas).
+
+        Usado pelo watchdog de prazo a partir de outro thread; o Chrome fica
+        de pé até `close_browser`, chamado por quem for descartar o driver.
+        """
+        self._close_command_executor(driver)
+        self._kill_driver_service(driver)
 
     def _start_chrome(self, options, *, user_data_dir, persistent_profile):
         logging.info("🌐 Inicializando Chrome com major version %s.", self.version_main)
@@ -274,9 +320,13 @@ class BrowserFactory:
 
         Cada driver usa um --user-data-dir exclusivo, então o padrão só
         alcança a árvore do browser deste driver. SIGTERM primeiro; se algo
-        sobreviver, SIGKILL. Sem isso, um quit() falho ou um uc.Chrome que
-        morreu no meio da inicialização deixa Chromes órfãos acumulando até
-        esgotar RAM/PIDs do container.
+        sobreviver à carência, SIGKILL. Sem isso, um quit() falho ou um
+        uc.Chrome que morreu no meio da inicialização deixa Chromes órfãos
+        acumulando até esgotar RAM/PIDs do container.
+
+        Caminho de exceção: sem PGID conhecido (falha no meio do uc.Chrome,
+        worker que caiu, Windows). O encerramento normal é por grupo, no
+        `CEIFADOR`.
         """
         if not profile_path:
             return
@@ -288,12 +338,16 @@ class BrowserFactory:
                 check=False,
                 capture_output=True,
             )
-            time.sleep(2)
-            survivors = subprocess.run(
-                ["pgrep", "-f", pattern],
-                check=False,
-                capture_output=True,
-            )
+            limite = time.monotonic() + CEIFADOR.carencia_segundos
+            while True:
+                survivors = subprocess.run(
+                    ["pgrep", "-f", pattern],
+                    check=False,
+                    capture_output=True,
+                )
+                if survivors.returncode != 0 or time.monotonic() >= limite:
+                    break
+                time.sleep(0.2)
             if survivors.returncode == 0:
                 logging.warning(
                     "🔪 Chrome do perfil %s sobreviveu ao SIGTERM. Aplicando SIGKILL.",
@@ -384,21 +438,9 @@ class BrowserFactory:
         if persistent_profile or not profile_path:
             return
 
-        path = Path(profile_path)
-        if not path.exists():
-            return
-
-        time.sleep(0.5)
-        for _ in range(10):
-            try:
-                shutil.rmtree(path, ignore_errors=False)
-                return
-            except FileNotFoundError:
-                return
-            except (OSError, PermissionError):
-                time.sleep(0.5)
-
-        logging.debug("Não foi possível remover o perfil temporário do Chrome agora: %s", path)
+        # A remoção (com novas tentativas enquanto o Chrome solta os
+        # arquivos) roda no thread do ceifador.
+        CEIFADOR.encerrar(perfil=profile_path, apagar_perfil=True)
 
     def _cleanup_stale_temp_profiles(self):
         temp_root = Path(tempfile.gettempdir())
@@ -0,0 +1,108 @@
+import logging
+import os
+
+from selenium.common.exceptions import WebDriverException
+
+
+class PoliticaReciclagem:
+    """Decide quando reciclar o Chrome preventivamente, entre uma tarefa e outra.
+
+    O Chrome degrada em sessões longas (memória crescendo, renderers
+    vazados) e antes só era trocado depois de um erro. Avaliada no início de
+    cada tarefa por `PortalRPARunner.ensure_browser`:
+
+    - a cada tarefa, o número de tarefas já feitas neste browser;
+    - a cada RPA_BROWSER_RECYCLE_SAMPLE_EVERY tarefas, uma amostra da árvore
+      do browser (RSS somado e número de processos, lidos de /proc pelo
+      `--user-data-dir` exclusivo do driver) e das métricas CDP
+      `Performance.getMetrics` da aba (heap JS e nós de DOM).
+
+    Qualquer limite com valor 0 fica desligado.
+    """
+
+    MB = 1024 * 1024
+
+    def __init__(self):
+        self.max_tarefas = int(os.getenv("RPA_BROWSER_RECYCLE_MAX_TASKS", "200"))
+        self.amostrar_a_cada = max(1, int(os.getenv("RPA_BROWSER_RECYCLE_SAMPLE_EVERY", "5")))
+        self.max_rss_mb = int(os.getenv("RPA_BROWSER_RECYCLE_MAX_RSS_MB", "1500"))
+        self.max_processos = int(os.getenv("RPA_BROWSER_RECYCLE_MAX_PROCESSES", "40"))
+        self.max_heap_js_mb = int(os.getenv("RPA_BROWSER_RECYCLE_MAX_JS_HEAP_MB", "512"))
+        self.max_nos_dom = int(os.getenv("RPA_BROWSER_RECYCLE_MAX_DOM_NODES", "150000"))
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Chamado a cada browser novo."""
+        self.tarefas = 0
+
+    def avaliar(self, driver):
+        """Conta o início de uma tarefa e retorna o motivo para reciclar (ou None)."""
+        self.tarefas += 1
+        if self.max_tarefas and self.tarefas > self.max_tarefas:
+            return f"{self.max_tarefas} tarefas no mesmo browser"
+
+        if self.tarefas % self.amostrar_a_cada:
+            return None
+
+        amostra = self.amostrar(driver)
+        logging.debug("📏 Amostra do browser após %s tarefas: %s", self.tarefas, amostra)
+        return self._motivo(amostra)
+
+    def amostrar(self, driver):
+        amostra = self._amostrar_arvore(getattr(driver, "_rpa_user_data_dir", None))
+        amostra.update(self._amostrar_cdp(driver))
+        return amostra
+
+    def _motivo(self, amostra):
+        limites = (
+            ("rss_mb", self.max_rss_mb, "RSS da árvore do Chrome {:.0f} MB"),
+            ("processos", self.max_processos, "{} processos na árvore do Chrome"),
+            ("heap_js_mb", self.max_heap_js_mb, "heap JS da aba {:.0f} MB"),
+            ("nos_dom", self.max_nos_dom, "{:.0f} nós de DOM na aba"),
+        )
+        for campo, limite, mensagem in limites:
+            valor = amostra.get(campo)
+            if limite and valor is not None and valor > limite:
+                return mensagem.format(valor)
+        return None
+
+    @classmethod
+    def _amostrar_arvore(cls, profile_path):
+        if not profile_path or not os.path.isdir("/proc"):
+            return {}
+
+        marcador = f"--user-data-dir={profile_path}".encode()
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        processos = 0
+        rss_bytes = 0
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/cmdline", "rb") as fp:
+                    if marcador not in fp.read():
+                        continue
+                with open(f"/proc/{entry}/statm", "r", encoding="ascii") as fp:
+                    rss_pages = int(fp.read().split()[1])
+            except (OSError, ValueError, IndexError):
+                continue
+            processos += 1
+            rss_bytes += rss_pages * page_size
+        return {"processos": processos, "rss_mb": rss_bytes / cls.MB}
+
+    @classmethod
+    def _amostrar_cdp(cls, driver):
+        try:
+            driver.execute_cdp_cmd("Performance.enable", {})
+            metricas = driver.execute_cdp_cmd("Performance.getMetrics", {}).get("metrics") or []
+        except WebDriverException as exc:
+            logging.debug("Métricas CDP indisponíveis: %s", exc)
+            return {}
+
+        valores = {metrica.get("name"): metrica.get("value") for metrica in metricas}
+        amostra = {}
+        if valores.get("JSHeapUsedSize") is not None:
+            amostra["heap_js_mb"] = valores["JSHeapUsedSize"] / cls.MB
+        if valores.get("Nodes") is not None:
+            amostra["nos_dom"] = valores["Nodes"]
+        return amostra
@@ -0,0 +1,157 @@
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+from pathlib import Path
+
+
+class CeifadorChrome:
+    """Encerramento assíncrono de árvores do Chrome.
+
+    O Chrome sobe em sessão/grupo de processos próprio (PGID = PID do
+    browser). `encerrar` manda SIGTERM ao grupo e devolve na hora; um thread
+    de fundo aplica SIGKILL a quem passar da carência, recolhe os filhos
+    diretos (`Popen.poll`/`waitpid`, sem zumbis) e só então apaga o perfil
+    temporário. O runner não paga mais `sleep`s nem varreduras de `ps` a
+    cada restart.
+    """
+
+    INTERVALO = 0.1
+    TENTATIVAS_REMOCAO_PERFIL = 20
+
+    def __init__(self, *, carencia_segundos=None):
+        self.carencia_segundos = (
+            carencia_segundos
+            if carencia_segundos is not None
+            else float(os.getenv("RPA_CHROME_KILL_GRACE_SECONDS", "2"))
+        )
+        self._cond = threading.Condition()
+        self._pendentes = []
+        self._thread = None
+
+    def encerrar(self, *, pgid=None, processos=(), perfil=None, apagar_perfil=False):
+        """Agenda o encerramento do grupo `pgid` e a remoção do `perfil`."""
+        if pgid is not None:
+            self._sinalizar(pgid, signal.SIGTERM)
+
+        with self._cond:
+            self._pendentes.append(
+                {
+                    "pgid": pgid,
+                    "processos": [processo for processo in processos if processo is not None],
+                    "perfil": str(perfil) if perfil else None,
+                    "apagar_perfil": apagar_perfil and bool(perfil),
+                    "kill_em": time.monotonic() + self.carencia_segundos,
+                    "tentativas_remocao": 0,
+                }
+            )
+            self._garantir_thread()
+            self._cond.notify()
+
+    def aguardar_perfil(self, perfil, timeout=None):
+        """Espera terminar o encerramento pendente que usa `perfil` (perfil persistente)."""
+        perfil = str(perfil)
+        limite = time.monotonic() + (timeout if timeout is not None else self.carencia_segundos + 5)
+        with self._cond:
+            while any(item["perfil"] == perfil for item in self._pendentes):
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def _garantir_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._executar, name="chrome-reaper", daemon=True)
+        self._thread.start()
+
+    def _executar(self):
+        while True:
+            with self._cond:
+                while not self._pendentes:
+                    self._cond.wait()
+                pendentes = list(self._pendentes)
+
+            concluidos = [item for item in pendentes if self._avancar(item)]
+
+            with self._cond:
+                for item in concluidos:
+                    self._pendentes.remove(item)
+                if concluidos:
+                    self._cond.notify_all()
+            time.sleep(self.INTERVALO)
+
+    def _avancar(self, item):
+        """Um passo do encerramento; True quando não resta nada a fazer."""
+        item["processos"] = [processo for processo in item["processos"] if not self._recolhido(processo)]
+
+        pgid = item["pgid"]
+        if pgid is not None and self._grupo_vivo(pgid):
+            if time.monotonic() >= item["kill_em"]:
+                logging.warning("🔪 Grupo do Chrome %s sobreviveu ao SIGTERM. Aplicando SIGKILL.", pgid)
+                self._sinalizar(pgid, signal.SIGKILL)
+                item["kill_em"] = float("inf")
+            return False
+
+        if item["processos"]:
+            return False
+
+        if item["apagar_perfil"] and not self._remover_perfil(item):
+            return False
+        return True
+
+    def _remover_perfil(self, item):
+        path = Path(item["perfil"])
+        try:
+            shutil.rmtree(path)
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError:
+            item["tentativas_remocao"] += 1
+            if item["tentativas_remocao"] >= self.TENTATIVAS_REMOCAO_PERFIL:
+                logging.debug("Não foi possível remover o perfil temporário do Chrome agora: %s", path)
+                return True
+            return False
+
+    @staticmethod
+    def _recolhido(processo):
+        """Recolhe um filho direto (Popen ou PID) sem bloquear; True se já terminou."""
+        poll = getattr(processo, "poll", None)
+        if callable(poll):
+            try:
+                return poll() is not None
+            except Exception:
+                return True
+        try:
+            pid, _ = os.waitpid(processo, os.WNOHANG)
+        except ChildProcessError:
+            return True
+        except OSError:
+            return True
+        return pid != 0
+
+    @staticmethod
+    def _grupo_vivo(pgid):
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _sinalizar(pgid, sinal):
+        try:
+            os.killpg(pgid, sinal)
+        except ProcessLookupError:
+            pass
+        except OSError as exc:
+            logging.debug("Falha ao sinalizar o grupo do Chrome %s: %s", pgid, exc)
+
+
+CEIFADOR = CeifadorChrome()
@@ -53,3 +53,13 @@ class PortalAccessError(PortalNavigationError):
 
 class TemporaryPortalError(RPAError):
     pass
+
+
+class TaskDeadlineExceededError(RPAError):
+    """Tarefa abortada pelo watchdog (`rpa.watchdog`) por estourar o prazo de relógio.
+
+    Não é repetida dentro do mesmo ciclo: o browser foi descartado e a
+    tarefa volta pela fila, com o backoff de falha transitória.
+    """
+
+    pass
@@ -0,0 +1,56 @@
+import os
+import time
+
+
+class OrcamentoCiclo:
+    """Orçamento de tempo de um ciclo do monitor.
+
+    O ciclo reserva processos em pequenos lotes e só pede mais enquanto a
+    projeção (processos x duração média) couber no tempo que resta, deixando
+    uma reserva para reconciliação e envio das notificações. A duração média
+    por processo é uma média móvel exponencial (EWMA) alimentada a cada
+    processo verificado, e dela sai o tamanho alvo do lote do ciclo seguinte.
+    """
+
+    def __init__(self, *, limite_lote, duracao_media_inicial=None):
+        self.orcamento = float(os.getenv("RPA_MONITOR_CYCLE_BUDGET_SECONDS", "270"))
+        self.reserva = float(os.getenv("RPA_MONITOR_CYCLE_RESERVE_SECONDS", "45"))
+        self.alfa = float(os.getenv("RPA_MONITOR_DURATION_EWMA_ALPHA", "0.3"))
+        self.lote_reserva = max(1, int(os.getenv("RPA_MONITOR_CLAIM_CHUNK", "5")))
+        self.limite_lote = max(1, limite_lote)
+        self.duracao_media = duracao_media_inicial or float(
+            os.getenv("RPA_MONITOR_PROCESS_ESTIMATE_SECONDS", "20")
+        )
+        self.iniciar()
+
+    def iniciar(self):
+        self._inicio = time.monotonic()
+        self.lote_alvo = self.tamanho_lote()
+        self.reservados = 0
+        self.processados = 0
+
+    def decorrido(self):
+        return time.monotonic() - self._inicio
+
+    def restante(self):
+        return self.orcamento - self.decorrido()
+
+    def registrar_duracao(self, segundos):
+        self.processados += 1
+        self.duracao_media = self.alfa * segundos + (1 - self.alfa) * self.duracao_media
+
+    def tamanho_lote(self):
+        """Quantos processos cabem num ciclo inteiro com a média atual."""
+        cabem = int((self.orcamento - self.reserva) / max(self.duracao_media, 0.1))
+        return max(1, min(self.limite_lote, cabem))
+
+    def quantos_cabem(self, *, com_reserva=True):
+        disponivel = self.restante() - (self.reserva if com_reserva else 0)
+        return max(0, int(disponivel / max(self.duracao_media, 0.1)))
+
+    def proxima_reserva(self):
+        """Tamanho da próxima reserva de processos; 0 encerra a coleta do ciclo."""
+        # O primeiro processo do ciclo sempre sai, para a média não travar
+        # num valor alto e o monitor parar de andar.
+        cabem = self.quantos_cabem() if self.reservados else max(1, self.quantos_cabem())
+        return max(0, min(self.lote_reserva, cabem, self.lote_alvo - self.reservados))
@@ -1,10 +1,16 @@
 import logging
 import os
+import time
+from collections import Counter
+from datetime import datetime
 
 from selenium.common.exceptions import WebDriverException
 
+import app_metrics
 from bd import database
+from utils import subsidio_matching, twotask_outbox
 
+from . import timing
 from .exceptions import (
     LoginError,
     OneLogUnavailableError,
@@ -12,25 +18,41 @@ from .exceptions import (
     PortalNavigationError,
     PortalTimeoutError,
     SessionExpiredError,
+    TaskDeadlineExceededError,
     TemporaryPortalError,
 )
+from .monitor_budget import OrcamentoCiclo
+from .monitor_scheduler import MonitorScheduler
 from .rpa_runner import PortalRPARunner
 
 
 class MonitorRPARunner(PortalRPARunner):
+    ROBO = "monitor"
     ESTADOS_RETORNO_FINAL = {"CONCLUIDO", "CONCLUÍDO", "EXCLUIDO", "EXCLUÍDO"}
 
-    def __init__(self, browser_factory=None, *, max_process_attempts=3, notifier=None):
-        super().__init__(browser_factory=browser_factory, max_task_attempts=max_process_attempts)
+    def __init__(
+        self,
+        browser_factory=None,
+        *,
+        max_process_attempts=3,
+        notifier=None,
+        outbox_sender=None,
+        broker=None,
+    ):
+        super().__init__(
+            browser_factory=browser_factory,
+            max_task_attempts=max_process_attempts,
+            broker=broker,
+        )
         self.notifier = notifier
+        # Com sender do outbox o monitor só registra as notificações; envio,
+        # retries e backoff acontecem no thread do sender.
+        self.outbox_sender = outbox_sender
         self.reconcile_enabled = self._env_flag("RPA_MONITOR_RECONCILE_ENABLED", True)
         self.reconcile_limit = int(os.getenv("RPA_MONITOR_RECONCILE_LIMIT", "10"))
         self.reconcile_lookback_hours = int(
             os.getenv("RPA_MONITOR_RECONCILE_LOOKBACK_HOURS", "168")
         )
-        self.notification_retry_batch_limit = int(
-            os.getenv("API_NOTIFICACAO_RETRY_LIMIT", "10")
-        )
         self.notification_max_attempts = int(
             os.getenv("API_NOTIFICACAO_MAX_TENTATIVAS", "5")
         )
@@ -46,14 +68,28 @@ class MonitorRPARunner(PortalRPARunner):
         self.clean_retry_missing_match_threshold = int(
             os.getenv("RPA_MONITOR_CLEAN_RETRY_MISSING_MATCH_THRESHOLD", "2")
         )
-
-    def run_cycle(self):
+        self.scheduler = MonitorScheduler()
+        # Criado no primeiro ciclo (semeado com a média gravada no banco) e
+        # mantido entre ciclos para a EWMA continuar aprendendo.
+        self.orcamento = None
+        # Solicitantes dos CNJs reservados no ciclo atual (uma consulta por ciclo)
+        self._solicitantes_por_cnj = {}
+
+    def _executar_ciclo(self):
         logging.info("🔍 Buscando processos marcados para monitoramento.")
         database.inicializar_banco()
 
-        processos_monitorados = database.buscar_processos_em_monitoramento(
-            limit=self.monitor_batch_limit,
-        )
+        if self.orcamento is None:
+            self.orcamento = OrcamentoCiclo(
+                limite_lote=self.monitor_batch_limit,
+                duracao_media_inicial=database.obter_duracao_media_monitor(),
+            )
+        orcamento = self.orcamento
+        orcamento.iniciar()
+        iniciado_em = datetime.now()
+        self._solicitantes_por_cnj = {}
+
+        processos_monitorados, motivo_parada = self._reservar_processos(orcamento)
         candidatos_reconciliacao = self._buscar_candidatos_reconciliacao(
             exclude_process_ids={processo["processo_id"] for processo in processos_monitorados}
         )
@@ -74,53 +110,143 @@ class MonitorRPARunner(PortalRPARunner):
         if not processos_monitorados:
             logging.info("✅ Nenhum processo em monitoramento no momento.")
         else:
-            logging.info("📋 Encontrados %s processos para verificar.", len(processos_monitorados))
+            logging.info(
+                "📋 Orçamento do ciclo: %.0fs, lote alvo %s (média %.1fs/processo).",
+                orcamento.orcamento,
+                orcamento.lote_alvo,
+                orcamento.duracao_media,
+            )
 
-        onelog_indisponivel = False
-        for processo in processos_monitorados:
-            try:
-                notificacoes = self._processar_processo(processo)
-            except OneLogUnavailableError as exc:
-                logging.warning(
-                    "⛔ OneLog indisponível/em backoff. Interrompendo o ciclo do "
-                    "monitor; processos restantes ficam para o próximo: %s",
-                    exc,
-                )
-                onelog_indisponivel = True
+        processados = set()
+        while processos_monitorados:
+            logging.info("📋 Reservados %s processos para verificar.", len(processos_monitorados))
+            for indice, processo in enumerate(processos_monitorados):
+                inicio = time.monotonic()
+                try:
+                    notificacoes = self._processar_processo(processo)
+                except OneLogUnavailableError as exc:
+                    logging.warning(
+                        "⛔ OneLog indisponível/em backoff. Interrompendo o ciclo do "
+                        "monitor; processos restantes ficam para o próximo: %s",
+                        exc,
+                    )
+                    # Sem isso os não verificados ficariam presos no lease e
+                    # perderiam a prioridade tirada pela reserva.
+                    database.liberar_reservas_monitoramento(processos_monitorados[indice:])
+                    motivo_parada = "onelog_indisponivel"
+                    break
+                orcamento.registrar_duracao(time.monotonic() - inicio)
+                processados.add(processo["processo_id"])
+                if notificacoes and self.notifier:
+                    self._enviar_notificacoes(notificacoes)
+
+            if motivo_parada == "onelog_indisponivel":
                 break
-            if notificacoes and self.notifier:
-                self._enviar_notificacoes(notificacoes)
-
-        if not onelog_indisponivel:
+            processos_monitorados, motivo_parada = self._reservar_processos(orcamento)
+
+        reconciliados = 0
+        if motivo_parada != "onelog_indisponivel":
+            # Reconciliação usa a reserva do orçamento: só o que ainda cabe.
+            candidatos_reconciliacao = [
+                processo
+                for processo in candidatos_reconciliacao
+                if processo["processo_id"] not in processados
+            ][: orcamento.quantos_cabem(com_reserva=False)]
+            reconciliados = len(candidatos_reconciliacao)
             self._reconciliar_falsos_negativos(candidatos_reconciliacao)
 
         if self.notifier:
             self._reenviar_notificacoes_pendentes()
 
+        if orcamento.reservados:
+            self._registrar_progresso_ciclo(
+                orcamento,
+                iniciado_em=iniciado_em,
+                reconciliados=reconciliados,
+                motivo_parada=motivo_parada,
+            )
+
+        timing.log_resumo_ciclo(self.ROBO)
         logging.info("🏁 Ciclo de monitoramento finalizado.")
 
+    def _reservar_processos(self, orcamento):
+        """Reserva o próximo lote que cabe no orçamento. Retorna (processos, motivo_parada)."""
+        quantidade = orcamento.proxima_reserva()
+        if quantidade <= 0:
+            if orcamento.reservados >= orcamento.lote_alvo:
+                return [], "lote_completo"
+            return [], "orcamento"
+
+        processos = database.buscar_processos_em_monitoramento(limit=quantidade)
+        if not processos:
+            return [], "fila_vazia"
+
+        orcamento.reservados += len(processos)
+        self._solicitantes_por_cnj.update(
+            database.buscar_solicitantes_por_cnjs(processo["cnj"] for processo in processos)
+            or {}
+        )
+        return processos, None
+
+    def _registrar_progresso_ciclo(self, orcamento, *, iniciado_em, reconciliados, motivo_parada):
+        vencidos_restantes = database.contar_processos_monitoramento_vencidos()
+        logging.info(
+            "⏱️ Ciclo do monitor: %s/%s processos em %.0fs (orçamento %.0fs), parada: %s, "
+            "vencidos restantes: %s.",
+            orcamento.processados,
+            orcamento.reservados,
+            orcamento.decorrido(),
+            orcamento.orcamento,
+            motivo_parada,
+            "N/D" if vencidos_restantes is None else vencidos_restantes,
+        )
+        database.registrar_ciclo_monitor(
+            iniciado_em=iniciado_em,
+            duracao_segundos=orcamento.decorrido(),
+            orcamento_segundos=orcamento.orcamento,
+            lote_alvo=orcamento.lote_alvo,
+            reservados=orcamento.reservados,
+            processados=orcamento.processados,
+            reconciliados=reconciliados,
+            vencidos_restantes=vencidos_restantes,
+            duracao_media_segundos=orcamento.duracao_media,
+            motivo_parada=motivo_parada,
+        )
+
     def _processar_processo(self, processo):
         cnj = processo["cnj"]
         npj = processo.get("npj")
         logging.info("⚙️ Verificando processo: %s (NPJ: %s)", cnj, npj or "N/D")
 
-        try:
-            return self._processar_processo_com_retry(processo)
-        except OneLogUnavailableError:
-            raise
-        except Exception as exc:
-            logging.error("❌ Falha definitiva ao monitorar %s: %s", cnj, exc)
-            return []
+        with timing.tarefa(self.ROBO, cnj):
+            try:
+                with self.prazo_tarefa(cnj):
+                    notificacoes = self._processar_processo_com_retry(processo)
+            except OneLogUnavailableError:
+                raise
+            except Exception as exc:
+                logging.error("❌ Falha definitiva ao monitorar %s: %s", cnj, exc)
+                app_metrics.TAREFAS_PROCESSADAS.inc(robo=self.ROBO, resultado="erro")
+                return []
+        app_metrics.TAREFAS_PROCESSADAS.inc(robo=self.ROBO, resultado="verificado")
+        return notificacoes
 
     def _processar_processo_com_retry(self, processo):
+        if self.broker is not None:
+            # Retries e recuperação de browser acontecem no broker.
+            return self._processar_processo_uma_vez(processo)
+
         cnj = processo["cnj"]
         last_error = None
 
         for tentativa in range(1, self.max_task_attempts + 1):
             try:
-                self.ensure_browser()
+                self.watchdog.verificar()
+                self.ensure_browser(inicio_tarefa=tentativa == 1)
                 self.auth_service.ensure_authenticated()
                 return self._processar_processo_uma_vez(processo)
+            except TaskDeadlineExceededError:
+                raise
             except OneLogUnavailableError as exc:
                 last_error = exc
                 logging.warning("⛔ OneLog indisponível no monitor para %s: %s", cnj, exc)
@@ -211,8 +337,7 @@ class MonitorRPARunner(PortalRPARunner):
         cnj = processo["cnj"]
         npj_atual = processo.get("npj")
 
-        subsidios_antigos = database.recuperar_subsidios_anteriores(processo_id)
-        npj_confirmado = self._reabrir_processo_monitorado(processo)
+        npj_confirmado, dados_novos, status_coleta = self._abrir_e_coletar(processo)
 
         if npj_confirmado and npj_confirmado != npj_atual:
             processo_id = database.salvar_processo(cnj, npj_confirmado) or processo_id
@@ -220,7 +345,6 @@ class MonitorRPARunner(PortalRPARunner):
             npj_atual = npj_confirmado
             logging.info("🧭 NPJ do monitor atualizado para %s no processo %s.", npj_confirmado, cnj)
 
-        dados_novos, status_coleta = self._coletar_subsidios_monitorados()
         if status_coleta == "indisponivel":
             dados_novos, status_coleta, processo_id = self._tentar_coleta_por_npj_base(
                 processo,
@@ -235,7 +359,7 @@ class MonitorRPARunner(PortalRPARunner):
                 npj_atual,
                 cnj,
             )
-            npj_fallback = self._reabrir_processo_monitorado(
+            npj_fallback, dados_novos, status_coleta = self._abrir_e_coletar(
                 processo,
                 preferir_fallback=True,
             )
@@ -248,7 +372,6 @@ class MonitorRPARunner(PortalRPARunner):
                     cnj,
                 )
 
-            dados_novos, status_coleta = self._coletar_subsidios_monitorados()
             if status_coleta == "indisponivel":
                 dados_novos, status_coleta, processo_id = self._tentar_coleta_por_npj_base(
                     processo,
@@ -263,6 +386,21 @@ class MonitorRPARunner(PortalRPARunner):
             database.registrar_monitoramento_falha(processo_id, erro)
             return []
 
+        fingerprint = database.calcular_fingerprint_subsidios(dados_novos) if dados_novos else None
+        if self._coleta_inalterada(processo, fingerprint):
+            logging.info("♻️ Processo %s sem alterações desde a última coleta.", cnj)
+            database.registrar_verificacao_sem_mudanca(processo_id)
+            self._agendar_proxima_verificacao(
+                processo_id,
+                cnj,
+                dados_novos,
+                houve_mudanca=False,
+            )
+            return []
+
+        with timing.span("db.recuperar_subsidios"):
+            subsidios_antigos = database.recuperar_subsidios_anteriores(processo_id)
+
         if status_coleta == "vazio":
             if self._tem_solicitado_sem_retorno(subsidios_antigos, dados_novos):
                 logging.warning(
@@ -334,8 +472,14 @@ class MonitorRPARunner(PortalRPARunner):
                 subsidios_antigos,
                 dados_novos,
             )
+            fingerprint = database.calcular_fingerprint_subsidios(dados_novos)
 
-        notificacoes = self._montar_notificacoes(cnj, subsidios_antigos, dados_novos)
+        notificacoes = self._montar_notificacoes(
+            cnj,
+            subsidios_antigos,
+            dados_novos,
+            solicitantes_por_cnj=self._solicitantes_por_cnj,
+        )
         solicitados_sem_retorno = self._solicitados_sem_retorno(
             subsidios_antigos,
             dados_novos,
@@ -344,11 +488,13 @@ class MonitorRPARunner(PortalRPARunner):
             subsidios_antigos,
             dados_novos,
         )
-        database.salvar_lista_subsidios(
-            processo_id,
-            dados_para_salvar,
-            preservar_solicitados_sem_correspondencia=True,
-        )
+        with timing.span("db.salvar_subsidios"):
+            database.salvar_lista_subsidios(
+                processo_id,
+                dados_para_salvar,
+                preservar_solicitados_sem_correspondencia=True,
+                fingerprint=fingerprint,
+            )
 
         if sem_correspondencia_exata:
             database.registrar_monitoramento_sem_correspondencia(
@@ -373,27 +519,71 @@ class MonitorRPARunner(PortalRPARunner):
         elif not tem_pendencia:
             logging.info("🎉 Processo %s sem pendências. Desligando monitoramento.", cnj)
             database.atualizar_status_monitoramento(processo_id, False)
+            return notificacoes
 
+        self._agendar_proxima_verificacao(
+            processo_id,
+            cnj,
+            dados_para_salvar,
+            houve_mudanca=self._houve_mudanca(subsidios_antigos, dados_para_salvar),
+        )
         return notificacoes
 
+    @staticmethod
+    def _coleta_inalterada(processo, fingerprint):
+        # Com ausência de correspondência pendente o fluxo completo precisa
+        # rodar (recoleta com sessão limpa, contadores), mesmo com hash igual.
+        return bool(
+            fingerprint
+            and processo.get("subsidios_hash") == fingerprint
+            and not processo.get("sem_correspondencia")
+        )
+
+    def _agendar_proxima_verificacao(self, processo_id, cnj, subsidios, *, houve_mudanca):
+        verificacoes, mudancas = database.obter_historico_monitoramento(processo_id)
+        if houve_mudanca:
+            mudancas += 1
+        proxima = self.scheduler.proxima_verificacao(
+            subsidios,
+            verificacoes=verificacoes + 1,
+            mudancas=mudancas,
+        )
+        database.agendar_proxima_verificacao(
+            processo_id,
+            proxima,
+            houve_mudanca=houve_mudanca,
+        )
+        logging.info(
+            "🗓️ Próxima verificação de %s agendada para %s%s.",
+            cnj,
+            proxima.strftime("%d/%m/%Y %H:%M"),
+            " (houve mudança)" if houve_mudanca else "",
+        )
+
+    @classmethod
+    def _houve_mudanca(cls, subsidios_antigos, dados_novos):
+        def chave(item):
+            return (
+                (item.get("tipo") or "").strip(),
+                (item.get("item") or "").strip(),
+                cls._normalizar_status(item.get("estado")),
+                (item.get("data_limite") or "").strip(),
+            )
+
+        return Counter(map(chave, subsidios_antigos)) != Counter(map(chave, dados_novos))
+
     @classmethod
     def _preservar_solicitados_com_estado_intermediario(cls, subsidios_antigos, dados_novos):
-        correspondencias_usadas = set()
         indices_intermediarios = set()
 
-        for antigo in subsidios_antigos:
-            if cls._normalizar_status(antigo.get("estado")) != "SOLICITADO":
-                continue
-
-            indice_correspondente, correspondente_novo = cls._buscar_correspondente_novo(
-                antigo,
-                dados_novos,
-                correspondencias_usadas,
-            )
+        for _, indice_correspondente, correspondente_novo in subsidio_matching.parear(
+            subsidios_antigos,
+            dados_novos,
+            filtro=cls._eh_solicitado,
+        ):
             if correspondente_novo is None:
                 continue
 
-            correspondencias_usadas.add(indice_correspondente)
             estado_novo = cls._normalizar_status(correspondente_novo.get("estado"))
             if estado_novo == "SOLICITADO" or cls._estado_retorno_final(estado_novo):
                 continue
@@ -441,9 +631,10 @@ class MonitorRPARunner(PortalRPARunner):
             cnj,
         )
 
-        self.restart_browser("recoleta por ausência repetida de correspondência exata")
-        self.auth_service.ensure_authenticated()
-        npj_confirmado = self._reabrir_processo_monitorado(processo)
+        npj_confirmado, dados_novos, status_coleta = self._abrir_e_coletar(
+            processo,
+            sessao_limpa=True,
+        )
 
         if npj_confirmado and npj_confirmado != processo.get("npj"):
             processo_id = database.salvar_processo(cnj, npj_confirmado) or processo_id
@@ -454,7 +645,6 @@ class MonitorRPARunner(PortalRPARunner):
                 cnj,
             )
 
-        dados_novos, status_coleta = self._coletar_subsidios_monitorados()
         if status_coleta == "indisponivel":
             dados_novos, status_coleta, processo_id = self._tentar_coleta_por_npj_base(
                 processo,
@@ -465,6 +655,41 @@ class MonitorRPARunner(PortalRPARunner):
 
         return dados_novos, status_coleta, processo_id
 
+    def _abrir_e_coletar(self, processo, *, npj=None, preferir_fallback=False, sessao_limpa=False):
+        """Abre o processo e lê os subsídios. Retorna (npj_confirmado, dados, status).
+
+        Com `npj` abre direto por ele, sem cair para a consulta rápida (usado
+        na tentativa pelo NPJ base). Com broker, a mesma sequência roda num
+        browser do broker_rpa.py.
+        """
+        if self.broker is not None:
+            parametros = {
+                "tolerar_indisponivel": True,
+                "wait_timeout": self.monitor_table_timeout,
+                "preferir_consulta": preferir_fallback,
+                "sessao_limpa": sessao_limpa,
+            }
+            if npj:
+                parametros.update(npj=npj, permitir_fallback=False)
+            else:
+                parametros["npj"] = processo.get("npj")
+            resultado = self.broker.coletar(processo["cnj"], **parametros)
+            return resultado.get("npj"), resultado.get("dados") or [], resultado.get("status")
+
+        if sessao_limpa:
+            self.restart_browser("recoleta por ausência repetida de correspondência exata")
+            self.auth_service.ensure_authenticated()
+
+        if npj:
+            npj_confirmado = self.processo_service.abrir_processo_por_npj(npj)
+        else:
+            npj_confirmado = self._reabrir_processo_monitorado(
+                processo,
+                preferir_fallback=preferir_fallback,
+            )
+        dados_novos, status_coleta = self._coletar_subsidios_monitorados()
+        return npj_confirmado, dados_novos, status_coleta
+
     def _coletar_subsidios_monitorados(self):
         return self.processo_service.coletar_lista_subsidios(
             tolerar_indisponivel=True,
@@ -487,7 +712,10 @@ class MonitorRPARunner(PortalRPARunner):
         )
 
         try:
-            npj_confirmado = self.processo_service.abrir_processo_por_npj(npj_base)
+            npj_confirmado, dados_novos, status_coleta = self._abrir_e_coletar(
+                processo,
+                npj=npj_base,
+            )
         except (PortalElementNotFoundError, PortalNavigationError, PortalTimeoutError) as exc:
             logging.warning(
                 "⚠️ Tentativa pelo NPJ base %s falhou para %s: %s",
@@ -497,7 +725,6 @@ class MonitorRPARunner(PortalRPARunner):
             )
             return [], "indisponivel", processo_id
 
-        dados_novos, status_coleta = self._coletar_subsidios_monitorados()
         if status_coleta != "indisponivel" and npj_confirmado != processo.get("npj"):
             processo_id = database.salvar_processo(cnj, npj_confirmado) or processo_id
             processo["npj"] = npj_confirmado
@@ -584,23 +811,32 @@ class MonitorRPARunner(PortalRPARunner):
         cnj = processo["cnj"]
         logging.info("🧭 Reconciliando processo fora do monitoramento: %s", cnj)
 
-        try:
-            self._reconciliar_processo_com_retry(processo)
-        except OneLogUnavailableError:
-            raise
-        except Exception as exc:
-            logging.warning("⚠️ Não foi possível reconciliar %s nesta rodada: %s", cnj, exc)
+        with timing.tarefa(self.ROBO, cnj):
+            try:
+                with self.prazo_tarefa(cnj):
+                    self._reconciliar_processo_com_retry(processo)
+            except OneLogUnavailableError:
+                raise
+            except Exception as exc:
+                logging.warning("⚠️ Não foi possível reconciliar %s nesta rodada: %s", cnj, exc)
 
     def _reconciliar_processo_com_retry(self, processo):
+        if self.broker is not None:
+            self._reconciliar_processo_uma_vez(processo)
+            return
+
         cnj = processo["cnj"]
         last_error = None
 
         for tentativa in range(1, self.max_task_attempts + 1):
             try:
-                self.ensure_browser()
+                self.watchdog.verificar()
+                self.ensure_browser(inicio_tarefa=tentativa == 1)
                 self.auth_service.ensure_authenticated()
                 self._reconciliar_processo_uma_vez(processo)
                 return
+            except TaskDeadlineExceededError:
+                raise
             except OneLogUnavailableError as exc:
                 last_error = exc
                 logging.warning("⛔ OneLog indisponível na reconciliação de %s: %s", cnj, exc)
@@ -691,13 +927,12 @@ class MonitorRPARunner(PortalRPARunner):
         cnj = processo["cnj"]
         npj_atual = processo.get("npj")
 
-        npj_confirmado = self._reabrir_processo_monitorado(processo)
+        npj_confirmado, dados_novos, status_coleta = self._abrir_e_coletar(processo)
         if npj_confirmado and npj_confirmado != npj_atual:
             processo_id = database.salvar_processo(cnj, npj_confirmado) or processo_id
             processo["npj"] = npj_confirmado
             logging.info("🧭 NPJ reconciliado para %s no processo %s.", npj_confirmado, cnj)
 
-        dados_novos, status_coleta = self._coletar_subsidios_monitorados()
         if status_coleta == "indisponivel":
             erro = "Reconciliação com tabela de subsídios indisponível"
             logging.warning("⚠️ %s para %s.", erro, cnj)
@@ -719,7 +954,11 @@ class MonitorRPARunner(PortalRPARunner):
             database.registrar_monitoramento_falha(processo_id, erro)
             return
 
-        database.salvar_lista_subsidios(processo_id, dados_novos)
+        database.salvar_lista_subsidios(
+            processo_id,
+            dados_novos,
+            fingerprint=database.calcular_fingerprint_subsidios(dados_novos),
+        )
 
         tem_pendencia = any(
             item["estado"].upper() == "SOLICITADO"
@@ -734,87 +973,41 @@ class MonitorRPARunner(PortalRPARunner):
             )
             database.atualizar_status_monitoramento(processo_id, True)
 
+    @timing.cronometrado("notificacao.envio")
     def _enviar_notificacoes(self, notificacoes):
-        notificacoes_registradas = database.registrar_notificacoes_twotask(notificacoes)
-        if not notificacoes_registradas:
+        # Sempre via outbox: as linhas entram PENDENTE e são coalescidas em
+        # lotes com as de outros processos/ciclos. No modo síncrono o envio
+        # acontece no fim do ciclo, em `_reenviar_notificacoes_pendentes`.
+        registradas = database.registrar_notificacoes_twotask(notificacoes, status="PENDENTE")
+        if not registradas:
             logging.info("🧯 Nenhuma notificação nova para enviar ao TwoTask após deduplicação.")
             return
-
-        self._postar_notificacoes_registradas(notificacoes_registradas)
+        logging.info("📮 %s notificação(ões) enfileirada(s) no outbox TwoTask.", len(registradas))
 
     def _reenviar_notificacoes_pendentes(self):
-        notificacoes = database.buscar_lotes_notificacoes_twotask_para_reenvio(
-            limite_lotes=self.notification_retry_batch_limit,
-            max_tentativas=self.notification_max_attempts,
-            reenviar_enviando_apos_minutos=self.notification_retry_sending_after_minutes,
-        )
-        if not notificacoes:
+        if self.outbox_sender is not None:
             return
 
-        lotes = {}
-        for notificacao in notificacoes:
-            lotes.setdefault(notificacao["_batch_ref"], []).append(notificacao)
-
-        logging.info(
-            "🔁 Reenviando %s lote(s) de aviso de retorno de subsídio pendentes.",
-            len(lotes),
-        )
-        for lote in lotes.values():
-            self._postar_notificacoes_registradas(lote)
-
-    def _postar_notificacoes_registradas(self, notificacoes_registradas):
-        dedupe_keys = [item["_dedupe_key"] for item in notificacoes_registradas]
-        payload = [
-            {
-                "numero_processo": item["numero_processo"],
-                "id_responsavel": item["id_responsavel"],
-                "observacao": item["observacao"],
-            }
-            for item in notificacoes_registradas
-        ]
-        batch_key = self._batch_dedupe_key(dedupe_keys)
-
-        try:
-            try:
-                enviado = self.notifier(payload, idempotency_key=batch_key)
-            except TypeError:
-                enviado = self.notifier(payload)
-        except Exception as exc:
-            logging.exception("❌ Erro inesperado ao enviar notificações para o TwoTask.")
-            erro = str(exc)
-            if getattr(exc, "retryable", True) is False:
-                erro = f"AUTH_NON_RETRYABLE: {erro}"
-            database.marcar_notificacoes_twotask_erro(dedupe_keys, erro)
-            return
-
-        if enviado:
-            database.marcar_notificacoes_twotask_enviadas(dedupe_keys)
-            return
-
-        database.marcar_notificacoes_twotask_erro(
-            dedupe_keys,
-            "API TwoTask retornou falha no envio do lote",
+        lotes = twotask_outbox.drenar_lotes(
+            self.notifier,
+            max_tentativas=self.notification_max_attempts,
+            reenviar_enviando_apos_minutos=self.notification_retry_sending_after_minutes,
+            forcar=True,
         )
+        if lotes:
+            logging.info("📤 %s lote(s) de aviso de retorno de subsídio enviados ao TwoTask.", lotes)
 
     @classmethod
-    def _montar_notificacoes(cls, cnj, subsidios_antigos, dados_novos):
+    def _montar_notificacoes(cls, cnj, subsidios_antigos, dados_novos, *, solicitantes_por_cnj=None):
         itens_alterados = []
         chaves_itens_alterados = set()
-        correspondencias_usadas = set()
-
-        for antigo in subsidios_antigos:
-            estado_antigo = cls._normalizar_status(antigo.get("estado"))
-            if estado_antigo != "SOLICITADO":
-                continue
-
-            indice_correspondente, correspondente_novo = cls._buscar_correspondente_novo(
-                antigo,
-                dados_novos,
-                correspondencias_usadas,
-            )
 
+        for antigo, _, correspondente_novo in subsidio_matching.parear(
+            subsidios_antigos,
+            dados_novos,
+            filtro=cls._eh_solicitado,
+        ):
             if correspondente_novo is not None:
-                correspondencias_usadas.add(indice_correspondente)
                 estado_novo = cls._normalizar_status(correspondente_novo.get("estado"))
                 if cls._estado_retorno_final(estado_novo):
                     cls._adicionar_item_alterado(
@@ -839,7 +1032,10 @@ class MonitorRPARunner(PortalRPARunner):
         if not itens_alterados:
             return []
 
-        lista_interessados = database.buscar_todos_solicitantes_por_cnj(cnj)
+        if solicitantes_por_cnj is not None and cnj in solicitantes_por_cnj:
+            lista_interessados = solicitantes_por_cnj[cnj]
+        else:
+            lista_interessados = database.buscar_todos_solicitantes_por_cnj(cnj)
         observacao_str = " | ".join(itens_alterados)
 
         if not lista_interessados:
@@ -878,19 +1074,13 @@ class MonitorRPARunner(PortalRPARunner):
     @classmethod
     def _solicitados_sem_retorno(cls, subsidios_antigos, dados_novos):
         solicitados = []
-        correspondencias_usadas = set()
 
-        for antigo in subsidios_antigos:
-            if cls._normalizar_status(antigo.get("estado")) != "SOLICITADO":
-                continue
-
-            indice_correspondente, correspondente_novo = cls._buscar_correspondente_novo(
-                antigo,
-                dados_novos,
-                correspondencias_usadas,
-            )
+        for antigo, _, correspondente_novo in subsidio_matching.parear(
+            subsidios_antigos,
+            dados_novos,
+            filtro=cls._eh_solicitado,
+        ):
             if correspondente_novo is not None:
-                correspondencias_usadas.add(indice_correspondente)
                 if cls._estado_retorno_final(correspondente_novo.get("estado")):
                     continue
 
@@ -900,40 +1090,15 @@ class MonitorRPARunner(PortalRPARunner):
 
     @classmethod
     def _solicitados_sem_correspondencia(cls, subsidios_antigos, dados_novos):
-        sem_correspondencia = []
-        correspondencias_usadas = set()
-
-        for antigo in subsidios_antigos:
-            if cls._normalizar_status(antigo.get("estado")) != "SOLICITADO":
-                continue
-
-            indice_correspondente, correspondente_novo = cls._buscar_correspondente_novo(
-                antigo,
+        return [
+            antigo
+            for antigo, _, correspondente_novo in subsidio_matching.parear(
+                subsidios_antigos,
                 dados_novos,
-                correspondencias_usadas,
+                filtro=cls._eh_solicitado,
             )
-            if correspondente_novo is not None:
-                correspondencias_usadas.add(indice_correspondente)
-                continue
-
-            sem_correspondencia.append(antigo)
-
-        return sem_correspondencia
-
-    @classmethod
-    def _buscar_correspondente_novo(cls, antigo, dados_novos, indices_usados=None):
-        indices_usados = indices_usados or set()
-        for indice, item in enumerate(dados_novos):
-            if indice in indices_usados:
-                continue
-            if (
-                cls._campos_equivalentes(item.get("tipo"), antigo.get("tipo"))
-                and cls._campos_equivalentes(item.get("item"), antigo.get("item"))
-                and cls._campos_equivalentes(item.get("data_limite"), antigo.get("data_limite"))
-            ):
-                return indice, item
-
-        return None, None
+            if correspondente_novo is None
+        ]
 
     @classmethod
     def _inferir_estado_final_sem_correspondencia(cls, antigo, dados_novos):
@@ -1008,13 +1173,17 @@ class MonitorRPARunner(PortalRPARunner):
     def _normalizar_status(status):
         return MonitorRPARunner._normalizar_texto(status)
 
+    @classmethod
+    def _eh_solicitado(cls, item):
+        return cls._normalizar_status(item.get("estado")) == "SOLICITADO"
+
     @classmethod
     def _estado_retorno_final(cls, status):
         return cls._normalizar_status(status) in cls.ESTADOS_RETORNO_FINAL
 
     @staticmethod
     def _normalizar_texto(valor):
-        return " ".join(str(valor or "").split()).upper()
+        return subsidio_matching.normalizar_texto(valor)
 
     @staticmethod
     def _env_flag(name, default=False):
@@ -1022,10 +1191,3 @@ class MonitorRPARunner(PortalRPARunner):
         if value is None:
             return default
         return value.strip().lower() in {"1", "true", "yes", "on"}
-
-    @staticmethod
-    def _batch_dedupe_key(dedupe_keys):
-        import hashlib
-
-        material = "|".join(sorted(dedupe_keys))
-        return hashlib.sha256(material.encode("utf-8")).hexdigest()
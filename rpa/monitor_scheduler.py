@@ -0,0 +1,73 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+
+class MonitorScheduler:
+    """Calcula quando cada processo monitorado deve ser verificado de novo.
+
+    Três sinais definem o intervalo:
+
+    - prazo: quanto mais perto a `data_limite` do SOLICITADO mais próximo,
+      mais curto o intervalo (vencido ou vencendo hoje usa o mínimo);
+    - histórico: processos que mudaram em muitas verificações anteriores são
+      vistos com mais frequência que os que nunca mudam;
+    - falhas: tratadas pelo banco (backoff exponencial em
+      `registrar_monitoramento_falha`), não passam por aqui.
+    """
+
+    FORMATO_DATA_LIMITE = "%d/%m/%Y"
+
+    def __init__(self):
+        self.intervalo_minimo = int(os.getenv("RPA_MONITOR_MIN_INTERVAL_MINUTES", "30"))
+        self.intervalo_maximo = int(os.getenv("RPA_MONITOR_MAX_INTERVAL_MINUTES", "1440"))
+        self.intervalo_padrao = int(os.getenv("RPA_MONITOR_DEFAULT_INTERVAL_MINUTES", "240"))
+        # Fração do tempo restante até o prazo usada como intervalo: com 0.1,
+        # um prazo em 10 dias gera verificação a cada ~1 dia.
+        self.fracao_prazo = float(os.getenv("RPA_MONITOR_DEADLINE_FRACTION", "0.1"))
+        self.jitter = float(os.getenv("RPA_MONITOR_SCHEDULE_JITTER", "0.1"))
+
+    def proxima_verificacao(self, subsidios, *, verificacoes=0, mudancas=0, agora=None):
+        agora = agora or datetime.now()
+        minutos = self.intervalo_minutos(
+            subsidios,
+            verificacoes=verificacoes,
+            mudancas=mudancas,
+            agora=agora,
+        )
+        if self.jitter > 0:
+            minutos *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        # Limites depois do jitter: nunca passa do intervalo máximo.
+        minutos = min(self.intervalo_maximo, max(self.intervalo_minimo, minutos))
+        return agora + timedelta(minutes=minutos)
+
+    def intervalo_minutos(self, subsidios, *, verificacoes=0, mudancas=0, agora=None):
+        agora = agora or datetime.now()
+        prazo = self.prazo_mais_proximo(subsidios)
+
+        if prazo is None:
+            base = self.intervalo_padrao
+        else:
+            restante = (prazo - agora).total_seconds() / 60
+            if restante <= 24 * 60:
+                return self.intervalo_minimo
+            base = restante * self.fracao_prazo
+
+        # Taxa de mudança suavizada (Laplace): sem histórico vale 0.5.
+        taxa_mudanca = (mudancas + 1) / (verificacoes + 2)
+        fator = 0.25 + 0.75 * (1 - taxa_mudanca)
+        return min(self.intervalo_maximo, max(self.intervalo_minimo, base * fator))
+
+    @classmethod
+    def prazo_mais_proximo(cls, subsidios):
+        prazos = []
+        for item in subsidios or []:
+            if " ".join(str(item.get("estado") or "").split()).upper() != "SOLICITADO":
+                continue
+            try:
+                data = datetime.strptime((item.get("data_limite") or "").strip(), cls.FORMATO_DATA_LIMITE)
+            except ValueError:
+                continue
+            # Prazo vale até o fim do dia.
+            prazos.append(data + timedelta(days=1))
+        return min(prazos) if prazos else None
@@ -66,6 +66,26 @@ def is_configured():
     return bool(os.getenv("ONELOG_USERNAME")) and bool(os.getenv("ONELOG_PASSWORD"))
 
 
+def session_cache_key():
+    """Chave do cache compartilhado: uma sessão por conta OneLog."""
+    return (os.getenv("ONELOG_USERNAME") or "").strip().lower()
+
+
+def current_sector():
+    return _current_sector
+
+
+def adopt_sector(sector):
+    """Assume o setor de uma sessão reaproveitada do cache.
+
+    Sem isso o processo que só injetou cookies do cache nunca enviaria o
+    marcapasso (renew_session exige o setor do login original).
+    """
+    global _current_sector
+    if sector:
+        _current_sector = sector
+
+
 def get_session():
     _ensure_not_blocked()
     try:
@@ -0,0 +1,155 @@
+import logging
+import os
+import select
+
+import app_metrics
+from bd import database
+
+from . import timing
+from .exceptions import (
+    OneLogUnavailableError,
+    PortalElementNotFoundError,
+    PortalNavigationError,
+    PortalTimeoutError,
+)
+from .rpa_runner import PortalRPARunner
+
+
+class BrokerRPARunner(PortalRPARunner):
+    """Worker do broker de browsers: executa coletas pedidas por outros robôs.
+
+    Roda dentro do pool de workers (`rpa.worker_pool`) com seu Chrome e sua
+    sessão OneLog; em vez de tarefas do Legal One, reserva linhas de
+    `coletas_portal` (enfileiradas por `PortalBrokerClient`) e devolve o
+    resultado na própria linha. Retries, recuperação de navegação e restart
+    de browser são os mesmos do processador.
+
+    Parâmetros aceitos por coleta:
+
+    - `npj`: abre direto pelo NPJ; se falhar, cai para a consulta rápida,
+      a menos que `permitir_fallback` seja falso;
+    - `preferir_consulta`: ignora o NPJ e vai direto à consulta rápida;
+    - `tolerar_indisponivel` / `wait_timeout`: leitura tolerante do monitor,
+      que devolve também o status da tabela (`ok`, `vazio`, `indisponivel`);
+    - `sessao_limpa`: reinicia o browser antes de coletar.
+    """
+
+    ROBO = "broker"
+
+    def __init__(self, browser_factory=None, *, worker_id=None, **kwargs):
+        kwargs.setdefault("tab_pool_size", 1)
+        super().__init__(browser_factory, worker_id=worker_id, **kwargs)
+        self.claim_batch_size = int(os.getenv("RPA_BROKER_CLAIM_BATCH", "1"))
+        self.claim_lease_minutes = int(os.getenv("RPA_BROKER_CLAIM_LEASE_MINUTES", "10"))
+        self._conn_escuta = None
+
+    @staticmethod
+    def liberar_reservas_de(worker_id):
+        database.liberar_coletas_portal(worker_id)
+
+    def aguardar_trabalho(self, stop_event, segundos):
+        """Dorme até `segundos`, acordando antes com NOTIFY de coleta nova."""
+        if self._conn_escuta is None:
+            self._conn_escuta = database.abrir_conexao_escuta(database.COLETAS_FILA_CHANNEL)
+        if self._conn_escuta is None:
+            stop_event.wait(segundos)
+            return
+
+        restante = segundos
+        while restante > 0 and not stop_event.is_set():
+            try:
+                prontos, _, _ = select.select([self._conn_escuta], [], [], min(restante, 1.0))
+            except Exception as exc:
+                logging.warning("⚠️ Conexão de escuta da fila do broker caiu: %s", exc)
+                self._fechar_escuta()
+                stop_event.wait(restante)
+                return
+            if prontos:
+                self._conn_escuta.poll()
+                if self._conn_escuta.notifies:
+                    self._conn_escuta.notifies.clear()
+                    return
+            restante -= 1.0
+
+    def close(self):
+        super().close()
+        self._fechar_escuta()
+
+    def _buscar_fila(self):
+        return database.reivindicar_coletas_portal(
+            self.worker_id,
+            self.claim_batch_size,
+            self.claim_lease_minutes,
+        )
+
+    def _liberar_reservas(self):
+        database.liberar_coletas_portal(self.worker_id)
+
+    def _processar_tarefa(self, coleta):
+        coleta_id = coleta["coleta_id"]
+        cnj = coleta["processo_cnj"]
+        logging.info("⚙️ Coleta %s pedida pelo %s: CNJ %s", coleta_id, coleta["origem"], cnj)
+
+        with timing.tarefa(self.ROBO, cnj):
+            try:
+                with self.prazo_tarefa(cnj):
+                    self._processar_tarefa_com_retry(coleta)
+            except Exception as exc:
+                logging.error("❌ Falha definitiva na coleta %s (CNJ %s): %s", coleta_id, cnj, exc)
+                database.finalizar_coleta_portal(
+                    coleta_id,
+                    self.worker_id,
+                    erro_tipo=type(exc).__name__,
+                    erro=str(exc),
+                )
+                app_metrics.TAREFAS_PROCESSADAS.inc(robo=self.ROBO, resultado="erro")
+                if isinstance(exc, OneLogUnavailableError):
+                    raise
+                return
+
+        database.finalizar_coleta_portal(coleta_id, self.worker_id, resultado=coleta["_resultado"])
+        app_metrics.TAREFAS_PROCESSADAS.inc(robo=self.ROBO, resultado="concluido")
+
+    def _processar_tarefa_uma_vez(self, coleta):
+        parametros = coleta["parametros"]
+
+        if parametros.get("sessao_limpa") and not coleta.get("_sessao_limpa_feita"):
+            coleta["_sessao_limpa_feita"] = True
+            self.restart_browser("coleta com sessão limpa pedida pelo cliente")
+            self.auth_service.ensure_authenticated()
+
+        npj = self._abrir_processo(coleta["processo_cnj"], parametros)
+
+        dados, status = self.processo_service.coletar_lista_subsidios(
+            tolerar_indisponivel=bool(parametros.get("tolerar_indisponivel")),
+            wait_timeout=parametros.get("wait_timeout"),
+            incluir_status=True,
+        )
+
+        coleta["_resultado"] = {"npj": npj, "dados": dados, "status": status}
+
+    def _abrir_processo(self, cnj, parametros):
+        npj = parametros.get("npj")
+        if npj and not parametros.get("preferir_consulta"):
+            try:
+                return self.processo_service.abrir_processo_por_npj(npj)
+            except (PortalElementNotFoundError, PortalNavigationError, PortalTimeoutError) as exc:
+                if not parametros.get("permitir_fallback", True):
+                    raise
+                logging.warning(
+                    "⚠️ Abertura direta por NPJ falhou para %s. Caindo para consulta rápida. Motivo: %s",
+                    cnj,
+                    exc,
+                )
+
+        self.processo_service.acessar_processo_consulta_rapida(cnj)
+        return self.processo_service.extrair_e_acessar_npj()
+
+    def _fechar_escuta(self):
+        if self._conn_escuta is None:
+            return
+        try:
+            self._conn_escuta.close()
+        except Exception:
+            pass
+        self._conn_escuta = None
@@ -10,6 +10,7 @@ from selenium.common.exceptions import (
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 
+from . import timing
 from .exceptions import (
     PortalAccessError,
     PortalElementNotFoundError,
@@ -29,6 +30,15 @@ class PortalClient:
         timeout = timeout or self.timeout
         self.auth_service.ensure_authenticated()
 
+        with timing.span("portal.abrir_url"):
+            return self._open_url(
+                url,
+                description=description,
+                expected_url_fragment=expected_url_fragment,
+                timeout=timeout,
+            )
+
+    def _open_url(self, url, *, description, expected_url_fragment, timeout):
         logging.info("🚀 [NAVEGAÇÃO] %s", description)
         logging.info("   -> URL: %s", url)
 
@@ -12,6 +12,7 @@ from selenium.common.exceptions import (
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 
+from . import timing
 from .exceptions import PortalElementNotFoundError, PortalTimeoutError
 
 
@@ -72,7 +73,7 @@ class ProcessoService:
                 expected="CNJ com dígitos",
             )
 
-        url = self.CONSULTA_URL_TEMPLATE.format(numero=numero_limpo)
+        url = self.url_consulta_rapida(numero_limpo)
         self.portal_client.open_authenticated_url(
             url,
             description=f"Consulta rápida do processo {numero_limpo}",
@@ -85,6 +86,11 @@ class ProcessoService:
         logging.info("🔍 Buscando NPJ da consulta rápida.")
         elemento_npj, texto = self._wait_for_npj_renderizado()
 
+        npj = self.npj_de_texto(texto)
+        logging.info("✅ NPJ encontrado: %s", npj)
+        return self.abrir_processo_por_npj(npj)
+
+    def npj_de_texto(self, texto):
         numeros = self.limpar_apenas_digitos(texto)
         npj = numeros[:-3] if numeros.endswith("000") else numeros
         if len(npj) < 5:
@@ -93,9 +99,25 @@ class ProcessoService:
                 current_url=self.portal_client.safe_current_url(),
                 expected="NPJ com ao menos 5 dígitos",
             )
+        return npj
 
-        logging.info("✅ NPJ encontrado: %s", npj)
-        return self.abrir_processo_por_npj(npj)
+    def url_consulta_rapida(self, numero_processo):
+        return self.CONSULTA_URL_TEMPLATE.format(
+            numero=self.limpar_apenas_digitos(numero_processo)
+        )
+
+    def url_processo(self, npj):
+        return self.PROCESSO_URL_TEMPLATE.format(npj=self.limpar_apenas_digitos(npj))
+
+    def navegar_sem_bloquear(self, url):
+        """Dispara a navegação da aba atual sem esperar o carregamento.
+
+        Usado pelo pool de abas: enquanto esta aba carrega, o runner pode
+        consultar as outras. A verificação de sessão fica para quem acompanha
+        a aba (localizar_npj/processo_header_visivel).
+        """
+        self.driver.switch_to.default_content()
+        self.driver.execute_script("window.location.href = arguments[0];", url)
 
     def abrir_processo_por_npj(self, npj):
         npj_limpo = self.limpar_apenas_digitos(npj)
@@ -106,7 +128,7 @@ class ProcessoService:
                 expected="NPJ com dígitos",
             )
 
-        url = self.PROCESSO_URL_TEMPLATE.format(npj=npj_limpo)
+        url = self.url_processo(npj_limpo)
         self.portal_client.open_authenticated_url(
             url,
             description=f"Página detalhada do NPJ {npj_limpo}",
@@ -117,32 +139,36 @@ class ProcessoService:
         self.driver.switch_to.default_content()
         return npj_limpo
 
-    def _wait_for_npj_renderizado(self):
-        textos_vistos = []
+    def localizar_npj(self, textos_vistos=None):
+        """Uma varredura pelo NPJ na página atual; False se ainda não renderizou."""
+        if textos_vistos is None:
+            textos_vistos = []
+        textos_vistos.clear()
+        for by, value in self.NPJ_SELECTORS:
+            elementos = self.portal_client.find_elements_across_frames(by, value)
+            for elemento in elementos:
+                try:
+                    texto = (elemento.text or "").strip()
+                except (StaleElementReferenceException, NoSuchElementException):
+                    continue
 
-        def locate(_driver):
-            textos_vistos.clear()
-            for by, value in self.NPJ_SELECTORS:
-                elementos = self.portal_client.find_elements_across_frames(by, value)
-                for elemento in elementos:
-                    try:
-                        texto = (elemento.text or "").strip()
-                    except (StaleElementReferenceException, NoSuchElementException):
-                        continue
+                if not texto or "#Confidencial" in texto:
+                    continue
 
-                    if not texto or "#Confidencial" in texto:
-                        continue
+                if texto not in textos_vistos:
+                    textos_vistos.append(texto)
 
-                    if texto not in textos_vistos:
-                        textos_vistos.append(texto)
+                if self.NPJ_REGEX.search(texto):
+                    return elemento, texto
+        return False
 
-                    if self.NPJ_REGEX.search(texto):
-                        return elemento, texto
-            return False
+    @timing.cronometrado("processo.npj_renderizado")
+    def _wait_for_npj_renderizado(self):
+        textos_vistos = []
 
         try:
             return WebDriverWait(self.driver, self.search_timeout, poll_frequency=0.5).until(
-                locate
+                lambda _driver: self.localizar_npj(textos_vistos)
             )
         except TimeoutException as exc:
             exemplos = ", ".join(textos_vistos[:5]) if textos_vistos else "nenhum texto útil"
@@ -152,6 +178,7 @@ class ProcessoService:
                 expected=self.NPJ_REGEX.pattern,
             ) from exc
 
+    @timing.cronometrado("processo.coleta_subsidios")
     def coletar_lista_subsidios(
         self,
         *,
@@ -244,6 +271,7 @@ class ProcessoService:
         except (NoSuchElementException, StaleElementReferenceException):
             return None
 
+    @timing.cronometrado("processo.paginacao")
     def _ir_para_proxima_pagina(self, hash_atual):
         botao = self.portal_client.find_element_across_frames(By.XPATH, self.NEXT_PAGE_XPATH)
         if not botao:
@@ -296,21 +324,23 @@ class ProcessoService:
                 expected="mudança do conteúdo após clicar em próxima página",
             ) from exc
 
+    def processo_header_visivel(self, npj):
+        self.driver.switch_to.default_content()
+        try:
+            body = self.driver.find_element(By.TAG_NAME, "body")
+            texto = (body.text or "").strip()
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+        return self.formatar_npj_exibicao(npj) in texto
+
+    @timing.cronometrado("processo.cabecalho")
     def _wait_for_processo_header(self, npj):
         npj_limpo = self.limpar_apenas_digitos(npj)
         npj_exibicao = self.formatar_npj_exibicao(npj)
-        def header_ready(_driver):
-            self.driver.switch_to.default_content()
-            try:
-                body = self.driver.find_element(By.TAG_NAME, "body")
-                texto = (body.text or "").strip()
-            except (NoSuchElementException, StaleElementReferenceException):
-                return False
-            return npj_exibicao in texto
 
         try:
             WebDriverWait(self.driver, self.header_timeout, poll_frequency=0.5).until(
-                header_ready
+                lambda _driver: self.processo_header_visivel(npj_limpo)
             )
         except TimeoutException as exc:
             current_url = self.portal_client.safe_current_url()
@@ -328,39 +358,47 @@ class ProcessoService:
                 expected=f"NPJ {npj_exibicao} visível no corpo da página",
             ) from exc
 
-    def _wait_for_subsidios_renderizados(self, *, timeout=None):
-        state = {"last_hash": None, "stable_hits": 0}
+    @staticmethod
+    def novo_estado_grid():
+        return {"last_hash": None, "stable_hits": 0}
+
+    def subsidios_estaveis(self, state):
+        """Uma leitura da grade: True quando o snapshot repetiu por 2 leituras
+        seguidas (ou o estado vazio apareceu). `state` carrega o histórico
+        entre chamadas."""
+        if self._loading_indicator_visible():
+            state["last_hash"] = None
+            state["stable_hits"] = 0
+            return False
 
-        def grid_ready(_driver):
-            if self._loading_indicator_visible():
-                state["last_hash"] = None
-                state["stable_hits"] = 0
-                return False
+        snapshot = self._snapshot_subsidio_rows()
+        if not snapshot:
+            if self._empty_subsidios_state_visible():
+                return True
 
-            snapshot = self._snapshot_subsidio_rows()
-            if not snapshot:
-                if self._empty_subsidios_state_visible():
-                    return True
+            state["last_hash"] = None
+            state["stable_hits"] = 0
+            return False
 
-                state["last_hash"] = None
-                state["stable_hits"] = 0
-                return False
+        current_hash = hashlib.md5("||".join(snapshot).encode("utf-8")).hexdigest()
+        if current_hash == state["last_hash"]:
+            state["stable_hits"] += 1
+        else:
+            state["last_hash"] = current_hash
+            state["stable_hits"] = 0
 
-            current_hash = hashlib.md5("||".join(snapshot).encode("utf-8")).hexdigest()
-            if current_hash == state["last_hash"]:
-                state["stable_hits"] += 1
-            else:
-                state["last_hash"] = current_hash
-                state["stable_hits"] = 0
+        return state["stable_hits"] >= 2
 
-            return state["stable_hits"] >= 2
+    @timing.cronometrado("processo.grade_estavel")
+    def _wait_for_subsidios_renderizados(self, *, timeout=None):
+        state = self.novo_estado_grid()
 
         try:
             WebDriverWait(
                 self.driver,
                 timeout or (self.search_timeout + self.table_settle_timeout),
                 poll_frequency=0.5,
-            ).until(grid_ready)
+            ).until(lambda _driver: self.subsidios_estaveis(state))
         except TimeoutException as exc:
             snapshot = self._snapshot_subsidio_rows()
             if snapshot:
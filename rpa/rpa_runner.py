@@ -1,51 +1,139 @@
+import contextlib
 import logging
 import os
 import time
 
-from selenium.common.exceptions import WebDriverException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 
+import app_metrics
 from bd import database
 
+from . import timing
 from .auth_service import AuthService
 from .browser_factory import BrowserFactory
+from .browser_recycle import PoliticaReciclagem
 from .exceptions import (
+    BrowserInitializationError,
     LoginError,
     OneLogUnavailableError,
     PortalElementNotFoundError,
     PortalNavigationError,
     PortalTimeoutError,
     SessionExpiredError,
+    TaskDeadlineExceededError,
     TemporaryPortalError,
 )
 from .portal_client import PortalClient
 from .processo_service import ProcessoService
+from .tab_pool import TabPool
+from .watchdog import WatchdogTarefa
 
 
 class PortalRPARunner:
-    def __init__(self, browser_factory=None, *, max_task_attempts=3):
+    ROBO = "processador"
+
+    def __init__(
+        self,
+        browser_factory=None,
+        *,
+        max_task_attempts=3,
+        tab_pool_size=None,
+        worker_id=None,
+        broker=None,
+    ):
         self.browser_factory = browser_factory or BrowserFactory()
         self.max_task_attempts = max_task_attempts
+        self.tab_pool_size = tab_pool_size or int(os.getenv("RPA_TAB_POOL_SIZE", "1"))
+        # Com worker_id o runner roda dentro do pool de workers: reserva lotes
+        # da fila em vez de ler a fila inteira.
+        self.worker_id = worker_id
+        self.claim_batch_size = int(os.getenv("RPA_WORKER_CLAIM_BATCH", "5"))
+        self.claim_lease_minutes = int(os.getenv("RPA_WORKER_CLAIM_LEASE_MINUTES", "30"))
+        # Com broker (rpa.broker_client) as coletas rodam nos browsers do
+        # broker_rpa.py: este processo não abre Chrome nem faz login.
+        self.broker = broker
+        # Coletas por envio ao broker: o que os workers dele terminam dentro
+        # de RPA_BROKER_TIMEOUT_SECONDS (~10 processos por worker com o padrão).
+        self.broker_lote = int(
+            os.getenv("RPA_BROKER_SUBMIT_BATCH")
+            or int(os.getenv("RPA_BROKER_WORKERS", "2")) * 10
+        )
         self.driver = None
         self.auth_service = None
         self.portal_client = None
         self.processo_service = None
+        self.reciclagem = PoliticaReciclagem()
+        self.watchdog = WatchdogTarefa(
+            lambda: self.driver,
+            self.browser_factory,
+            robo=self.ROBO,
+            ao_estourar=self._descartar_browser_travado,
+        )
 
     def run_cycle(self):
+        """Processa a fila (ou um lote reservado, no modo worker).
+
+        Retorna quantas tarefas foram lidas da fila, para o pool de workers
+        decidir se busca outro lote ou aguarda.
+        """
+        inicio = time.monotonic()
+        try:
+            return self._executar_ciclo()
+        finally:
+            app_metrics.CICLO_DURACAO.observe(time.monotonic() - inicio, robo=self.ROBO)
+
+    def _executar_ciclo(self):
         logging.info("🏁 Iniciando ciclo de processamento no Portal.")
-        database.inicializar_banco()
+        if self.worker_id is None:
+            database.inicializar_banco()
 
-        fila_pendente = database.buscar_tarefas_pendentes()
+        fila_pendente = self._buscar_fila()
         if not fila_pendente:
             logging.info("✅ Nenhuma tarefa pendente no banco.")
-            return
+            return 0
 
-        logging.info("📋 Processando %s tarefas da fila.", len(fila_pendente))
+        total_lido = sum(len(self._ids_do_grupo(tarefa)) for tarefa in fila_pendente)
+        logging.info(
+            "📋 Processando %s tarefas da fila (%s CNJs distintos).",
+            total_lido,
+            len(fila_pendente),
+        )
 
         try:
             self.ensure_browser()
         except Exception as exc:
             logging.error("❌ Não foi possível preparar o browser: %s", exc)
-            return
+            self._liberar_reservas()
+            return 0
+
+        if self.broker is not None:
+            try:
+                self._processar_fila_via_broker(fila_pendente)
+            except OneLogUnavailableError as exc:
+                logging.warning(
+                    "⛔ OneLog indisponível/em backoff no broker. Interrompendo o ciclo; "
+                    "tarefas restantes ficam para o próximo agendamento: %s",
+                    exc,
+                )
+                self._liberar_reservas()
+            except (PortalTimeoutError, TemporaryPortalError) as exc:
+                logging.warning("⏳ Broker não devolveu todas as coletas do ciclo: %s", exc)
+                self._liberar_reservas()
+            timing.log_resumo_ciclo(self.ROBO)
+            logging.info("💤 Ciclo de processamento finalizado.")
+            return total_lido
+
+        if self.tab_pool_size > 1 and len(fila_pendente) > 1:
+            try:
+                fila_pendente = self._processar_fila_em_abas(fila_pendente)
+            except OneLogUnavailableError as exc:
+                logging.warning(
+                    "⛔ OneLog indisponível/em backoff. Interrompendo o ciclo; "
+                    "tarefas restantes ficam para o próximo agendamento: %s",
+                    exc,
+                )
+                self._liberar_reservas()
+                return total_lido
 
         for tarefa in fila_pendente:
             try:
@@ -56,28 +144,152 @@ class PortalRPARunner:
                     "tarefas restantes ficam para o próximo agendamento: %s",
                     exc,
                 )
+                self._liberar_reservas()
                 break
 
+        timing.log_resumo_ciclo(self.ROBO)
         logging.info("💤 Ciclo de processamento finalizado.")
+        return total_lido
+
+    def _buscar_fila(self):
+        if self.worker_id is None:
+            tarefas = database.buscar_tarefas_pendentes()
+        else:
+            tarefas = database.reivindicar_tarefas_pendentes(
+                self.worker_id,
+                self.claim_batch_size,
+                self.claim_lease_minutes,
+            )
+        return self._reaproveitar_coletas_recentes(self._agrupar_por_cnj(tarefas))
+
+    def _reaproveitar_coletas_recentes(self, fila_pendente):
+        """Conclui sem visitar o portal os CNJs coletados há pouco por qualquer robô."""
+        recentes = database.buscar_cnjs_coletados_recentemente(
+            tarefa["processo_cnj"] for tarefa in fila_pendente
+        )
+        if not recentes:
+            return fila_pendente
+
+        restantes = [tarefa for tarefa in fila_pendente if tarefa["processo_cnj"] not in recentes]
+        frescas = [tarefa for tarefa in fila_pendente if tarefa["processo_cnj"] in recentes]
+        # Quem coletou (processador ou monitor) já salvou os subsídios e
+        # ligou o monitoramento; basta fechar as tarefas ainda abertas.
+        for tarefa in self._filtrar_tarefas_abertas(frescas):
+            coletado_em = recentes[tarefa["processo_cnj"]]
+            logging.info(
+                "♻️ CNJ %s já coletado em %s (janela de frescor). Reaproveitando para %s tarefa(s).",
+                tarefa["processo_cnj"],
+                coletado_em.strftime("%d/%m/%Y %H:%M:%S"),
+                len(self._ids_do_grupo(tarefa)),
+            )
+            self._finalizar_grupo(tarefa, "CONCLUIDO")
+        return restantes
+
+    @staticmethod
+    def _agrupar_por_cnj(tarefas):
+        """Uma entrada por CNJ, na ordem da fila, com todas as tarefas em `tarefa_ids`.
+
+        Vários solicitantes do mesmo processo compartilham uma única visita
+        ao portal; a conclusão (ou o erro) vale para o grupo inteiro.
+        """
+        grupos = {}
+        for tarefa in tarefas:
+            grupo = grupos.get(tarefa["processo_cnj"])
+            if grupo is None:
+                grupo = dict(tarefa, tarefa_ids=[])
+                grupos[tarefa["processo_cnj"]] = grupo
+            grupo["tarefa_ids"].append(tarefa["tarefa_id"])
+        return list(grupos.values())
+
+    @staticmethod
+    def _ids_do_grupo(tarefa):
+        return tarefa.get("tarefa_ids") or [tarefa["tarefa_id"]]
+
+    def _finalizar_grupo(self, tarefa, status_final, erro=None):
+        """`erro` pode ser a exceção: a classe dela define o backoff do retry."""
+        tarefa_ids = self._ids_do_grupo(tarefa)
+        database.marcar_tarefas_concluidas(
+            tarefa_ids,
+            status_final,
+            str(erro) if erro is not None else None,
+            classe_erro=self._classe_erro(erro),
+        )
+        app_metrics.TAREFAS_PROCESSADAS.inc(
+            len(tarefa_ids),
+            robo=self.ROBO,
+            resultado="concluido" if status_final == "CONCLUIDO" else "erro",
+        )
+
+    @staticmethod
+    def _classe_erro(erro):
+        """Classe de retry da falha: transitória volta logo, estrutural espera mais."""
+        transitorios = (
+            PortalTimeoutError,
+            TemporaryPortalError,
+            TimeoutException,
+            BrowserInitializationError,
+            TaskDeadlineExceededError,
+        )
+        if isinstance(erro, transitorios):
+            return "transitorio"
+        if isinstance(erro, (LoginError, SessionExpiredError)):
+            return "login"
+        if isinstance(erro, PortalElementNotFoundError):
+            return "estrutural"
+        return None
+
+    def _liberar_reservas(self):
+        if self.worker_id is not None:
+            database.liberar_reservas_tarefas(self.worker_id)
+
+    @staticmethod
+    def liberar_reservas_de(worker_id):
+        """Usado pelo pool de workers para soltar o lote de um worker morto."""
+        database.liberar_reservas_tarefas(worker_id)
+
+    def aguardar_trabalho(self, stop_event, segundos):
+        """Espera do worker do pool quando a fila veio vazia."""
+        stop_event.wait(segundos)
+
+    def ensure_browser(self, *, inicio_tarefa=False):
+        """Garante um browser vivo; no início de uma tarefa aplica a política de reciclagem."""
+        if self.broker is not None:
+            return None
 
-    def ensure_browser(self):
         if self.driver is not None:
             try:
                 _ = self.driver.current_url
-                return self.driver
             except WebDriverException:
                 logging.warning("⚠️ Browser anterior ficou inválido. Será recriado.")
                 self._reset_state()
+            else:
+                motivo = self.reciclagem.avaliar(self.driver) if inicio_tarefa else None
+                if motivo is None:
+                    return self.driver
+                return self._reciclar_browser(motivo)
 
         logging.info("🌐 Inicializando browser do portal.")
         self.driver = self.browser_factory.create_browser()
         self.auth_service = AuthService(self.driver)
         self.portal_client = PortalClient(self.driver, self.auth_service)
         self.processo_service = ProcessoService(self.driver, self.portal_client)
+        self.reciclagem.reiniciar()
+        return self.driver
+
+    def _reciclar_browser(self, motivo):
+        """Troca o browser entre tarefas levando a sessão autenticada junto."""
+        logging.info("♻️ Reciclando browser preventivamente: %s.", motivo)
+        app_metrics.BROWSER_RESTARTS.inc(robo=self.ROBO, motivo="reciclagem preventiva")
+        sessao = self.auth_service.exportar_sessao() if self.auth_service else None
+        self.close()
+        self.ensure_browser()
+        if self.auth_service.restaurar_sessao(sessao):
+            logging.info("🔁 Sessão do browser anterior restaurada no novo.")
         return self.driver
 
     def restart_browser(self, reason):
         logging.warning("🔁 Reiniciando browser. Motivo: %s", reason)
+        app_metrics.BROWSER_RESTARTS.inc(robo=self.ROBO, motivo=reason)
         self.close()
         return self.ensure_browser()
 
@@ -89,26 +301,42 @@ class PortalRPARunner:
                 logging.exception("Erro ao encerrar browser.")
         self._reset_state()
 
+    def prazo_tarefa(self, referencia, segundos=None):
+        """Prazo de relógio do watchdog para uma tarefa (sem efeito com broker)."""
+        if self.broker is not None:
+            return contextlib.nullcontext()
+        return self.watchdog.prazo(referencia, segundos)
+
+    def _descartar_browser_travado(self):
+        app_metrics.BROWSER_RESTARTS.inc(robo=self.ROBO, motivo="prazo da tarefa")
+        self.close()
+
     def _processar_tarefa(self, tarefa):
         cnj = tarefa["processo_cnj"]
-        tarefa_id = tarefa["tarefa_id"]
 
-        if not database.tarefa_esta_aberta(tarefa_id):
-            logging.info("↺ Tarefa %s não está mais aberta. Pulando CNJ %s.", tarefa_id, cnj)
+        if not self._filtrar_tarefas_abertas([tarefa]):
             return
 
-        logging.info("⚙️ Processando CNJ: %s", cnj)
+        tarefa_ids = self._ids_do_grupo(tarefa)
+        if len(tarefa_ids) > 1:
+            logging.info("⚙️ Processando CNJ: %s (%s tarefas)", cnj, len(tarefa_ids))
+        else:
+            logging.info("⚙️ Processando CNJ: %s", cnj)
 
-        try:
-            self._processar_tarefa_com_retry(tarefa)
-            database.marcar_tarefa_concluida(tarefa_id, "CONCLUIDO")
-        except OneLogUnavailableError:
-            # Não marca ERRO: a tarefa permanece pendente para o próximo
-            # ciclo, quando o OneLog deve ter se recuperado.
-            raise
-        except Exception as exc:
-            logging.error("❌ Falha definitiva no CNJ %s: %s", cnj, exc)
-            database.marcar_tarefa_concluida(tarefa_id, "ERRO", str(exc))
+        with timing.tarefa(self.ROBO, cnj, tarefa_id=tarefa_ids[0]):
+            try:
+                with self.prazo_tarefa(cnj):
+                    self._processar_tarefa_com_retry(tarefa)
+                with timing.span("db.marcar_tarefa"):
+                    self._finalizar_grupo(tarefa, "CONCLUIDO")
+            except OneLogUnavailableError:
+                # Não marca ERRO: a tarefa permanece pendente para o próximo
+                # ciclo, quando o OneLog deve ter se recuperado.
+                raise
+            except Exception as exc:
+                logging.error("❌ Falha definitiva no CNJ %s: %s", cnj, exc)
+                with timing.span("db.marcar_tarefa"):
+                    self._finalizar_grupo(tarefa, "ERRO", exc)
 
     def _processar_tarefa_com_retry(self, tarefa):
         cnj = tarefa["processo_cnj"]
@@ -116,10 +344,13 @@ class PortalRPARunner:
 
         for tentativa in range(1, self.max_task_attempts + 1):
             try:
-                self.ensure_browser()
+                self.watchdog.verificar()
+                self.ensure_browser(inicio_tarefa=tentativa == 1)
                 self.auth_service.ensure_authenticated()
                 self._processar_tarefa_uma_vez(tarefa)
                 return
+            except TaskDeadlineExceededError:
+                raise
             except OneLogUnavailableError as exc:
                 # OneLog fora/backoff: não adianta repetir agora nem reiniciar
                 # o browser — cada restart custaria um Chrome novo à toa.
@@ -211,19 +442,170 @@ class PortalRPARunner:
 
         raise last_error or RuntimeError("Falha ao processar tarefa sem erro identificado")
 
+    @classmethod
+    def _filtrar_tarefas_abertas(cls, fila_pendente):
+        """Mantém só as tarefas ainda abertas de cada grupo (uma consulta para a fila toda)."""
+        ids_abertos = database.filtrar_tarefas_abertas(
+            [tarefa_id for tarefa in fila_pendente for tarefa_id in cls._ids_do_grupo(tarefa)]
+        )
+        abertas = []
+        for tarefa in fila_pendente:
+            tarefa_ids = cls._ids_do_grupo(tarefa)
+            restantes = [tarefa_id for tarefa_id in tarefa_ids if tarefa_id in ids_abertos]
+            for tarefa_id in tarefa_ids:
+                if tarefa_id not in ids_abertos:
+                    logging.info(
+                        "↺ Tarefa %s não está mais aberta. Pulando CNJ %s.",
+                        tarefa_id,
+                        tarefa["processo_cnj"],
+                    )
+            if restantes:
+                tarefa["tarefa_ids"] = restantes
+                abertas.append(tarefa)
+        return abertas
+
+    def _processar_fila_via_broker(self, fila_pendente):
+        """Envia a fila ao broker em lotes de `broker_lote` CNJs.
+
+        Um lote só sai quando o anterior voltou: uma fila grande (ex.: depois
+        de uma queda do portal) não vira milhares de coletas enfileiradas e
+        canceladas no timeout a cada ciclo. Timeout ou OneLog indisponível
+        encerram o ciclo; o que não foi enviado segue pendente.
+        """
+        for inicio in range(0, len(fila_pendente), max(1, self.broker_lote)):
+            self._processar_lote_via_broker(fila_pendente[inicio : inicio + self.broker_lote])
+
+    def _processar_lote_via_broker(self, fila_pendente):
+        """Grava cada coleta do lote conforme ela volta do broker.
+
+        O broker já fez retries e restarts: erro devolvido é falha definitiva,
+        exceto OneLog indisponível, que deixa a tarefa pendente e encerra o ciclo.
+        """
+        abertas = self._filtrar_tarefas_abertas(fila_pendente)
+        if not abertas:
+            return
+
+        coletas = self.broker.coletar_varios(
+            [{"cnj": tarefa["processo_cnj"], "preferir_consulta": True} for tarefa in abertas]
+        )
+        onelog_indisponivel = None
+        for indice, linha in coletas:
+            tarefa = abertas[indice]
+            cnj = tarefa["processo_cnj"]
+            try:
+                resultado = self.broker.desembrulhar(linha)
+                self._salvar_coleta_tarefa(cnj, resultado["npj"], resultado["dados"])
+                self._finalizar_grupo(tarefa, "CONCLUIDO")
+            except OneLogUnavailableError as exc:
+                onelog_indisponivel = exc
+            except Exception as exc:
+                logging.error("❌ Falha definitiva no CNJ %s: %s", cnj, exc)
+                self._finalizar_grupo(tarefa, "ERRO", exc)
+
+        if onelog_indisponivel is not None:
+            raise onelog_indisponivel
+
+    def _processar_fila_em_abas(self, fila_pendente):
+        """Processa a fila no pool de abas e devolve as tarefas que falharam.
+
+        As tarefas devolvidas seguem para o fluxo sequencial, que tem retries,
+        recuperação de navegação e restart de browser.
+        """
+        abertas = self._filtrar_tarefas_abertas(fila_pendente)
+
+        try:
+            self.ensure_browser(inicio_tarefa=True)
+            self.auth_service.ensure_authenticated()
+        except OneLogUnavailableError:
+            raise
+        except Exception as exc:
+            logging.warning("⚠️ Pool de abas indisponível; seguindo no fluxo sequencial: %s", exc)
+            return abertas
+
+        pool = TabPool(
+            self.driver,
+            self.portal_client,
+            self.auth_service,
+            size=self.tab_pool_size,
+        )
+        # Cada aba trata cerca de len/size tarefas em sequência: o lote tem
+        # o prazo de uma tarefa por rodada de abas.
+        rodadas = -(-len(abertas) // max(1, self.tab_pool_size))
+        try:
+            with self.prazo_tarefa(
+                f"pool de abas ({len(abertas)} tarefa(s))",
+                self.watchdog.prazo_segundos * rodadas,
+            ):
+                resultados = pool.processar(abertas)
+        except TaskDeadlineExceededError as exc:
+            # O watchdog já descartou o browser; o fluxo sequencial refaz o lote.
+            logging.warning("⏰ %s. Seguindo no fluxo sequencial.", exc)
+            return abertas
+        except WebDriverException as exc:
+            logging.warning("⚠️ Não foi possível abrir o pool de abas: %s", exc)
+            pool.fechar()
+            return abertas
+
+        falhas = []
+        for resultado in resultados:
+            tarefa = resultado["tarefa"]
+            if resultado["erro"] is not None:
+                falhas.append(tarefa)
+                continue
+
+            try:
+                self._salvar_coleta_tarefa(
+                    tarefa["processo_cnj"],
+                    resultado["npj"],
+                    resultado["dados"],
+                )
+                self._finalizar_grupo(tarefa, "CONCLUIDO")
+            except Exception as exc:
+                logging.warning(
+                    "⚠️ Falha ao gravar coleta do pool para o CNJ %s: %s",
+                    tarefa["processo_cnj"],
+                    exc,
+                )
+                falhas.append(tarefa)
+
+        if falhas:
+            logging.info(
+                "↩️ %s tarefa(s) do pool de abas seguem para o fluxo sequencial.",
+                len(falhas),
+            )
+        return falhas
+
     def _processar_tarefa_uma_vez(self, tarefa):
         cnj = tarefa["processo_cnj"]
 
         self.processo_service.acessar_processo_consulta_rapida(cnj)
         npj = self.processo_service.extrair_e_acessar_npj()
+        processo_id = self._salvar_processo_tarefa(cnj, npj)
 
-        processo_id = database.salvar_processo(cnj, npj)
+        dados = self.processo_service.coletar_lista_subsidios()
+        self._salvar_subsidios_tarefa(cnj, processo_id, dados)
+
+    def _salvar_coleta_tarefa(self, cnj, npj, dados):
+        processo_id = self._salvar_processo_tarefa(cnj, npj)
+        self._salvar_subsidios_tarefa(cnj, processo_id, dados)
+
+    @staticmethod
+    def _salvar_processo_tarefa(cnj, npj):
+        with timing.span("db.salvar_processo"):
+            processo_id = database.salvar_processo(cnj, npj)
         if not processo_id:
             raise RuntimeError(f"Não foi possível salvar o processo {cnj} / NPJ {npj}")
+        return processo_id
 
-        dados = self.processo_service.coletar_lista_subsidios()
+    @staticmethod
+    def _salvar_subsidios_tarefa(cnj, processo_id, dados):
         if dados:
-            database.salvar_lista_subsidios(processo_id, dados)
+            with timing.span("db.salvar_subsidios"):
+                database.salvar_lista_subsidios(
+                    processo_id,
+                    dados,
+                    fingerprint=database.calcular_fingerprint_subsidios(dados),
+                )
             logging.info("✅ %s subsídios salvos para %s.", len(dados), cnj)
 
             tem_solicitado = any(
@@ -236,7 +618,7 @@ class PortalRPARunner:
                     "🚨 Processo %s possui itens 'SOLICITADO'. Ativando monitoramento.",
                     cnj,
                 )
-                database.atualizar_status_monitoramento(processo_id, True)
+                database.atualizar_status_monitoramento(processo_id, True, prioritario=True)
 
     def _recuperar_navegacao(self, cnj):
         try:
@@ -264,8 +646,13 @@ class PortalRPARunner:
         base = int(os.getenv("RPA_RETRY_BACKOFF_BASE_SECONDS", "5"))
         teto = int(os.getenv("RPA_RETRY_BACKOFF_MAX_SECONDS", "60"))
         delay = min(teto, base * (2 ** (tentativa - 1)))
-        logging.info("⏲️ Aguardando %ss antes da próxima tentativa.", delay)
+        # Não dorme além do prazo da tarefa: estourado, a próxima tentativa não vem.
+        restante = self.watchdog.restante()
+        if restante is not None:
+            delay = min(delay, restante)
+        logging.info("⏲️ Aguardando %ss antes da próxima tentativa.", round(delay))
         time.sleep(delay)
+        self.watchdog.verificar()
 
     def _reset_state(self):
         self.driver = None
@@ -0,0 +1,215 @@
+import logging
+import os
+import time
+from collections import deque
+
+from selenium.common.exceptions import WebDriverException
+
+from .exceptions import PortalTimeoutError, SessionExpiredError
+from .processo_service import ProcessoService
+
+
+class _TabSlot:
+    def __init__(self, handle, tarefa, processo_service):
+        self.handle = handle
+        self.tarefa = tarefa
+        self.processo_service = processo_service
+        self.etapa = None
+        self.prazo = 0.0
+        self.npj = None
+        self.textos_vistos = []
+        self.estado_grid = None
+
+    @property
+    def cnj(self):
+        return self.tarefa["processo_cnj"]
+
+
+class TabPool:
+    """Intercala várias tarefas em abas da mesma sessão autenticada do Chrome.
+
+    Cada aba percorre a mesma máquina de estados do fluxo sequencial
+    (consulta rápida -> NPJ -> cabeçalho -> grade -> coleta), mas as esperas
+    viram verificações pontuais: enquanto o backend do portal responde a uma
+    aba, o runner avança as outras. Uma aba que falha devolve a tarefa com o
+    erro; o runner a reprocessa no fluxo sequencial, que tem retries e
+    recuperação de navegação.
+    """
+
+    def __init__(self, driver, portal_client, auth_service, *, size, timeout=None):
+        self.driver = driver
+        self.portal_client = portal_client
+        self.auth_service = auth_service
+        self.size = max(1, size)
+        self.timeout = timeout or int(os.getenv("RPA_DEFAULT_TIMEOUT", "30"))
+        self.poll_interval = float(os.getenv("RPA_TAB_POOL_POLL_SECONDS", "0.5"))
+        self._main_handle = None
+        self._handles = []
+
+    def processar(self, tarefas):
+        """Retorna uma lista de dicts {tarefa, npj, dados, erro} na ordem de conclusão."""
+        resultados = []
+        fila = deque(tarefas)
+        ativos = []
+
+        livres = deque(self._abrir_abas())
+        logging.info(
+            "🗂️ Pool de abas ativo com %s aba(s) para %s tarefa(s).",
+            len(self._handles),
+            len(fila),
+        )
+
+        try:
+            while fila or ativos:
+                while fila and livres:
+                    slot = _TabSlot(
+                        livres.popleft(),
+                        fila.popleft(),
+                        ProcessoService(self.driver, self.portal_client, timeout=self.timeout),
+                    )
+                    try:
+                        self._iniciar(slot)
+                        ativos.append(slot)
+                    except WebDriverException as exc:
+                        resultados.append(self._resultado(slot, erro=exc))
+                        livres.append(slot.handle)
+                        if not self._driver_vivo():
+                            raise
+
+                houve_avanco = False
+                for slot in list(ativos):
+                    try:
+                        etapa_anterior = slot.etapa
+                        dados = self._avancar(slot)
+                        houve_avanco = houve_avanco or slot.etapa != etapa_anterior
+                    except Exception as exc:
+                        logging.warning(
+                            "⚠️ Aba do CNJ %s falhou na etapa '%s': %s",
+                            slot.cnj,
+                            slot.etapa,
+                            exc,
+                        )
+                        ativos.remove(slot)
+                        livres.append(slot.handle)
+                        resultados.append(self._resultado(slot, erro=exc))
+                        if isinstance(exc, WebDriverException) and not self._driver_vivo():
+                            raise
+                        continue
+
+                    if dados is not None:
+                        ativos.remove(slot)
+                        livres.append(slot.handle)
+                        resultados.append(self._resultado(slot, dados=dados))
+                        houve_avanco = True
+
+                if ativos and not houve_avanco:
+                    time.sleep(self.poll_interval)
+        except WebDriverException as exc:
+            logging.error("🧨 Browser ficou inválido durante o pool de abas: %s", exc)
+            for slot in ativos:
+                resultados.append(self._resultado(slot, erro=exc))
+            for tarefa in fila:
+                resultados.append({"tarefa": tarefa, "npj": None, "dados": None, "erro": exc})
+        finally:
+            self.fechar()
+
+        return resultados
+
+    def fechar(self):
+        if not self._handles:
+            return
+        try:
+            for handle in self._handles:
+                if handle == self._main_handle:
+                    continue
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(self._main_handle)
+        except WebDriverException as exc:
+            logging.warning("⚠️ Não foi possível fechar as abas extras do pool: %s", exc)
+        self._handles = []
+
+    def _abrir_abas(self):
+        self._main_handle = self.driver.current_window_handle
+        self._handles = [self._main_handle]
+        for _ in range(self.size - 1):
+            self.driver.switch_to.new_window("tab")
+            self._handles.append(self.driver.current_window_handle)
+        return list(self._handles)
+
+    def _iniciar(self, slot):
+        logging.info("⚙️ [ABA] Processando CNJ: %s", slot.cnj)
+        self.driver.switch_to.window(slot.handle)
+        slot.processo_service.navegar_sem_bloquear(
+            slot.processo_service.url_consulta_rapida(slot.cnj)
+        )
+        self._entrar_etapa(
+            slot,
+            "npj",
+            self.timeout + slot.processo_service.search_timeout,
+        )
+
+    def _avancar(self, slot):
+        """Faz uma verificação na aba; devolve a lista coletada quando termina."""
+        self.driver.switch_to.window(slot.handle)
+        service = slot.processo_service
+
+        if self.auth_service.is_login_page():
+            raise SessionExpiredError(
+                "Portal redirecionou para login durante o pool de abas",
+                current_url=self.portal_client.safe_current_url(),
+                expected=f"sessão ativa na etapa {slot.etapa}",
+            )
+        self.portal_client.raise_if_access_error(expected=f"acesso liberado na etapa {slot.etapa}")
+
+        if slot.etapa == "npj":
+            encontrado = service.localizar_npj(slot.textos_vistos)
+            if encontrado:
+                slot.npj = service.npj_de_texto(encontrado[1])
+                logging.info("✅ [ABA] NPJ %s encontrado para %s.", slot.npj, slot.cnj)
+                service.navegar_sem_bloquear(service.url_processo(slot.npj))
+                self._entrar_etapa(slot, "cabecalho", self.timeout + service.header_timeout)
+                return None
+        elif slot.etapa == "cabecalho":
+            if service.processo_header_visivel(slot.npj):
+                slot.estado_grid = service.novo_estado_grid()
+                self._entrar_etapa(
+                    slot,
+                    "grade",
+                    service.search_timeout + service.table_settle_timeout,
+                )
+                return None
+        elif slot.etapa == "grade":
+            if service.subsidios_estaveis(slot.estado_grid):
+                # Grade estável: a leitura (e a paginação, se houver) é curta
+                # e segue no fluxo normal da aba.
+                return service.coletar_lista_subsidios()
+
+        self._verificar_prazo(slot)
+        return None
+
+    def _entrar_etapa(self, slot, etapa, duracao):
+        slot.etapa = etapa
+        slot.prazo = time.monotonic() + duracao
+
+    def _verificar_prazo(self, slot):
+        if time.monotonic() < slot.prazo:
+            return
+        exemplos = ", ".join(slot.textos_vistos[:5]) if slot.textos_vistos else ""
+        raise PortalTimeoutError(
+            f"Aba excedeu o tempo na etapa '{slot.etapa}'"
+            + (f". Exemplos vistos: {exemplos}" if exemplos and slot.etapa == "npj" else ""),
+            current_url=self.portal_client.safe_current_url(),
+            expected=f"etapa {slot.etapa} concluída para {slot.cnj}",
+        )
+
+    def _driver_vivo(self):
+        try:
+            _ = self.driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    @staticmethod
+    def _resultado(slot, *, dados=None, erro=None):
+        return {"tarefa": slot.tarefa, "npj": slot.npj, "dados": dados, "erro": erro}
@@ -0,0 +1,167 @@
+"""Medição leve de latência por etapa do pipeline do portal.
+
+Cada `span("etapa")` mede a duração de um trecho e alimenta:
+
+- o agregado do ciclo (percentis por etapa, resumidos numa linha de log no
+  fim de cada ciclo e zerados em seguida);
+- a tarefa corrente, se houver uma aberta com `tarefa(...)`: no fim da
+  tarefa os tempos são gravados em `tempos_etapas` num único INSERT;
+- os observadores registrados (ex.: histogramas do endpoint de métricas).
+"""
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+MAX_AMOSTRAS_POR_ETAPA = 5000
+
+_lock = threading.Lock()
+_amostras_ciclo = defaultdict(list)
+_observadores = []
+_contexto = threading.local()
+
+
+def _persistencia_habilitada():
+    return os.getenv("RPA_TIMING_PERSIST", "true").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def registrar_observador(callback):
+    """`callback(etapa, segundos, sucesso)` é chamado a cada span encerrado."""
+    with _lock:
+        _observadores.append(callback)
+
+
+@contextmanager
+def span(etapa):
+    inicio = time.monotonic()
+    sucesso = True
+    try:
+        yield
+    except BaseException:
+        sucesso = False
+        raise
+    finally:
+        _registrar(etapa, time.monotonic() - inicio, sucesso)
+
+
+def cronometrado(etapa):
+    """Decorator equivalente a envolver o método inteiro em `span(etapa)`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(etapa):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def tarefa(robo, referencia, *, tarefa_id=None):
+    """Agrupa os spans de uma tarefa/processo para persistência em lote."""
+    anterior = getattr(_contexto, "spans", None)
+    _contexto.spans = []
+    inicio = time.monotonic()
+    sucesso = True
+    try:
+        yield
+    except BaseException:
+        sucesso = False
+        raise
+    finally:
+        duracao = time.monotonic() - inicio
+        spans = _contexto.spans
+        _contexto.spans = anterior
+        spans.append(("tarefa.total", duracao, sucesso))
+        _registrar_no_ciclo("tarefa.total", duracao, sucesso)
+        _persistir(robo, referencia, tarefa_id, spans)
+
+
+def resumo_ciclo(reset=True):
+    with _lock:
+        amostras = {etapa: list(valores) for etapa, valores in _amostras_ciclo.items()}
+        if reset:
+            _amostras_ciclo.clear()
+
+    resumo = {}
+    for etapa, valores in amostras.items():
+        if not valores:
+            continue
+        ordenados = sorted(valores)
+        resumo[etapa] = {
+            "n": len(ordenados),
+            "p50": percentil(ordenados, 50),
+            "p90": percentil(ordenados, 90),
+            "p99": percentil(ordenados, 99),
+            "max": ordenados[-1],
+            "total": sum(ordenados),
+        }
+    return resumo
+
+
+def log_resumo_ciclo(robo, reset=True):
+    resumo = resumo_ciclo(reset=reset)
+    if not resumo:
+        return resumo
+
+    partes = [
+        f"{etapa} n={dados['n']} p50={dados['p50']:.2f}s p90={dados['p90']:.2f}s "
+        f"p99={dados['p99']:.2f}s max={dados['max']:.2f}s"
+        for etapa, dados in sorted(resumo.items(), key=lambda kv: -kv[1]["total"])
+    ]
+    logging.info("⏱️ [TEMPOS %s] %s", robo, " | ".join(partes))
+    return resumo
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    if len(valores_ordenados) == 1:
+        return valores_ordenados[0]
+    posicao = (len(valores_ordenados) - 1) * (p / 100)
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    fracao = posicao - inferior
+    return valores_ordenados[inferior] + (
+        valores_ordenados[superior] - valores_ordenados[inferior]
+    ) * fracao
+
+
+def _registrar(etapa, segundos, sucesso):
+    spans = getattr(_contexto, "spans", None)
+    if spans is not None:
+        spans.append((etapa, segundos, sucesso))
+    _registrar_no_ciclo(etapa, segundos, sucesso)
+
+
+def _registrar_no_ciclo(etapa, segundos, sucesso):
+    with _lock:
+        valores = _amostras_ciclo[etapa]
+        if len(valores) < MAX_AMOSTRAS_POR_ETAPA:
+            valores.append(segundos)
+        observadores = list(_observadores)
+
+    for callback in observadores:
+        try:
+            callback(etapa, segundos, sucesso)
+        except Exception:
+            logging.debug("Observador de tempos falhou para a etapa %s.", etapa, exc_info=True)
+
+
+def _persistir(robo, referencia, tarefa_id, spans):
+    if not spans or not _persistencia_habilitada():
+        return
+
+    try:
+        from bd import database
+
+        database.registrar_tempos_etapas(robo, referencia, tarefa_id, spans)
+    except Exception as exc:
+        logging.debug("Não foi possível gravar tempos da tarefa %s: %s", referencia, exc)
@@ -0,0 +1,181 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import app_metrics
+
+from .exceptions import TaskDeadlineExceededError
+
+
+class WatchdogTarefa:
+    """Prazo de relógio por tarefa, vigiado por um thread próprio.
+
+    Os timeouts do Selenium não limitam a tarefa inteira: `WebDriverWait`s
+    empilhados, três tentativas com backoff, a recuperação de navegação e
+    chamadas ao chromedriver que nunca retornam podem prender um CNJ por
+    muitos minutos. Estourado o prazo, o watchdog escala:
+
+    1. fecha o command executor e mata o chromedriver: a chamada HTTP
+       pendente falha e as seguintes falham na hora;
+    2. se a tarefa continuar presa após a carência, encerra o browser
+       inteiro (`BrowserFactory.close_browser`).
+
+    No thread da tarefa, `verificar()` (chamado entre tentativas) e a saída
+    de `prazo()` transformam o estouro em `TaskDeadlineExceededError`, e
+    `ao_estourar` descarta o browser para a próxima tarefa abrir outro.
+    """
+
+    def __init__(
+        self,
+        obter_driver,
+        browser_factory,
+        *,
+        robo,
+        ao_estourar=None,
+        prazo_segundos=None,
+        carencia_segundos=None,
+    ):
+        self.obter_driver = obter_driver
+        self.browser_factory = browser_factory
+        self.robo = robo
+        self.ao_estourar = ao_estourar
+        self.prazo_segundos = (
+            prazo_segundos
+            if prazo_segundos is not None
+            else float(os.getenv("RPA_TASK_DEADLINE_SECONDS", "480"))
+        )
+        self.carencia_segundos = (
+            carencia_segundos
+            if carencia_segundos is not None
+            else float(os.getenv("RPA_TASK_WATCHDOG_GRACE_SECONDS", "20"))
+        )
+        self._cond = threading.Condition()
+        self._armado = None
+        self._thread = None
+
+    @contextmanager
+    def prazo(self, referencia, segundos=None):
+        segundos = self.prazo_segundos if segundos is None else segundos
+        with self._cond:
+            # Prazo desligado ou já armado por uma tarefa externa: vale o de fora.
+            if segundos <= 0 or self._armado is not None:
+                aninhado = True
+            else:
+                aninhado = False
+                self._armado = {
+                    "referencia": referencia,
+                    "segundos": segundos,
+                    "limite": time.monotonic() + segundos,
+                    "estagio": 0,
+                }
+                self._garantir_thread()
+                self._cond.notify()
+        if aninhado:
+            yield
+            return
+
+        try:
+            yield
+        except TaskDeadlineExceededError:
+            raise
+        except Exception as exc:
+            if self._estourado():
+                raise self._erro() from exc
+            raise
+        finally:
+            with self._cond:
+                estourou = self._armado["estagio"] > 0
+                self._armado = None
+                self._cond.notify()
+            if estourou and self.ao_estourar is not None:
+                self.ao_estourar()
+
+    def verificar(self):
+        """Levanta `TaskDeadlineExceededError` se a tarefa corrente já passou do prazo."""
+        if self._estourado():
+            raise self._erro()
+
+    def restante(self):
+        """Segundos até o prazo da tarefa corrente (None sem tarefa armada)."""
+        with self._cond:
+            if self._armado is None:
+                return None
+            if self._armado["limite"] is None:
+                return 0.0
+            return max(0.0, self._armado["limite"] - time.monotonic())
+
+    def _estourado(self):
+        with self._cond:
+            return self._armado is not None and (
+                self._armado["estagio"] > 0 or time.monotonic() >= self._armado["limite"]
+            )
+
+    def _erro(self):
+        with self._cond:
+            armado = self._armado or {"referencia": "?", "segundos": self.prazo_segundos}
+        return TaskDeadlineExceededError(
+            f"Tarefa {armado['referencia']} excedeu o prazo de {armado['segundos']:.0f}s",
+            expected="tarefa concluída dentro de RPA_TASK_DEADLINE_SECONDS",
+        )
+
+    def _garantir_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._vigiar,
+            name=f"watchdog-{self.robo}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _vigiar(self):
+        while True:
+            with self._cond:
+                armado = self._armado
+                if armado is None:
+                    self._cond.wait()
+                    continue
+                if armado["limite"] is None:
+                    # Último estágio já executado: só espera a tarefa sair.
+                    self._cond.wait()
+                    continue
+                restante = armado["limite"] - time.monotonic()
+                if restante > 0:
+                    self._cond.wait(restante)
+                    continue
+                estagio = armado["estagio"]
+                armado["estagio"] += 1
+                armado["limite"] = time.monotonic() + self.carencia_segundos if estagio == 0 else None
+                referencia, segundos = armado["referencia"], armado["segundos"]
+
+            try:
+                if estagio == 0:
+                    self._abortar_comandos(referencia, segundos)
+                elif estagio == 1:
+                    self._encerrar_browser(referencia)
+            except Exception:
+                logging.exception("Falha no watchdog ao abortar a tarefa %s.", referencia)
+
+    def _abortar_comandos(self, referencia, segundos):
+        logging.error(
+            "⏰ Tarefa %s passou do prazo de %.0fs. Abortando as chamadas ao chromedriver.",
+            referencia,
+            segundos,
+        )
+        app_metrics.TAREFAS_PRAZO_ESTOURADO.inc(robo=self.robo, estagio="chromedriver")
+        driver = self.obter_driver()
+        if driver is not None:
+            self.browser_factory.abortar_comandos(driver)
+
+    def _encerrar_browser(self, referencia):
+        logging.error(
+            "🔪 Tarefa %s seguiu presa %.0fs após abortar o chromedriver. Encerrando o browser.",
+            referencia,
+            self.carencia_segundos,
+        )
+        app_metrics.TAREFAS_PRAZO_ESTOURADO.inc(robo=self.robo, estagio="browser")
+        driver = self.obter_driver()
+        if driver is not None:
+            self.browser_factory.close_browser(driver)
@@ -0,0 +1,280 @@
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from pathlib import Path
+
+import app_metrics
+from bd import database
+
+from .browser_factory import BrowserFactory
+from .exceptions import BrowserInitializationError
+from .rpa_runner import PortalRPARunner
+
+
+class BudgetedBrowserFactory(BrowserFactory):
+    """BrowserFactory que só abre Chrome com uma vaga do orçamento global.
+
+    O semáforo é compartilhado entre os processos do pool: durante restarts,
+    o Chrome novo de um worker espera a vaga do antigo ser devolvida, e o
+    host nunca passa de RPA_CHROME_BUDGET browsers vivos.
+    """
+
+    def __init__(self, budget_semaphore, holding_flag, *, acquire_timeout=300, **kwargs):
+        super().__init__(**kwargs)
+        self.budget_semaphore = budget_semaphore
+        # Flag compartilhada com o supervisor: se o worker morrer segurando a
+        # vaga, o supervisor sabe que precisa devolvê-la.
+        self.holding_flag = holding_flag
+        self.acquire_timeout = acquire_timeout
+        self._holding_slot = False
+
+    def create_browser(self):
+        if not self._holding_slot:
+            logging.info("🎟️ Aguardando vaga no orçamento global de Chrome.")
+            if not self.budget_semaphore.acquire(timeout=self.acquire_timeout):
+                raise BrowserInitializationError(
+                    "Orçamento global de Chrome esgotado",
+                    expected=f"vaga livre em até {self.acquire_timeout}s",
+                )
+            self._holding_slot = True
+            self.holding_flag.value = 1
+
+        try:
+            return super().create_browser()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def close_browser(self, driver):
+        try:
+            super().close_browser(driver)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        if self._holding_slot:
+            self._holding_slot = False
+            self.holding_flag.value = 0
+            self.budget_semaphore.release()
+
+
+def _profile_prefix(worker_id):
+    return f"onesid-rpa-{worker_id}-chrome-"
+
+
+def _executar_worker(
+    worker_id,
+    budget_semaphore,
+    holding_flag,
+    stop_event,
+    idle_seconds,
+    metrics_port=None,
+    runner_cls=PortalRPARunner,
+    service="processador",
+    profile_subdir=None,
+):
+    """Ponto de entrada de cada processo worker (contexto spawn)."""
+    logging.info("👷 Worker %s iniciado (pid %s).", worker_id, os.getpid())
+    if metrics_port:
+        # Contadores vivem na memória de cada processo: cada worker expõe os
+        # seus numa porta própria (METRICS_WORKER_PORT_BASE + índice do worker).
+        app_metrics.iniciar_servidor(service, port=metrics_port)
+    factory = BudgetedBrowserFactory(
+        budget_semaphore,
+        holding_flag,
+        temp_profile_prefix=_profile_prefix(worker_id),
+        profile_subdir=profile_subdir,
+    )
+    runner = runner_cls(browser_factory=factory, worker_id=worker_id)
+
+    try:
+        while not stop_event.is_set():
+            try:
+                lidas = runner.run_cycle()
+            except Exception:
+                logging.exception("❌ Erro inesperado no ciclo do worker %s.", worker_id)
+                runner.close()
+                lidas = 0
+
+            if not lidas:
+                runner.aguardar_trabalho(stop_event, idle_seconds)
+    finally:
+        runner.close()
+        runner_cls.liberar_reservas_de(worker_id)
+        logging.info("👋 Worker %s encerrado.", worker_id)
+
+
+class _WorkerSlot:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.holding_flag = None
+        self.restarts = 0
+        self.next_start_at = 0.0
+        self.started_at = 0.0
+
+
+class ProcessadorWorkerPool:
+    """Supervisor de N workers do processador, cada um com seu próprio Chrome.
+
+    Os workers disputam a fila via reserva (FOR UPDATE SKIP LOCKED + lease),
+    então podem drenar um backlog em paralelo no mesmo host. O supervisor
+    recria workers que morreram, com backoff exponencial por vaga para não
+    entrar em loop de crash.
+
+    Com `runner_cls=BrokerRPARunner` / `service="broker"` o mesmo pool é o
+    broker de browsers (broker_rpa.py), atendendo coletas de outros robôs.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers=None,
+        chrome_budget=None,
+        runner_cls=PortalRPARunner,
+        service="processador",
+        idle_seconds=None,
+    ):
+        self.runner_cls = runner_cls
+        self.service = service
+        self.workers = workers or int(os.getenv("RPA_WORKERS", "1"))
+        self.chrome_budget = chrome_budget or int(
+            os.getenv("RPA_CHROME_BUDGET") or self.workers
+        )
+        self.idle_seconds = idle_seconds or int(os.getenv("RPA_WORKER_IDLE_SECONDS", "60"))
+        self.supervise_interval = int(os.getenv("RPA_WORKER_SUPERVISE_SECONDS", "5"))
+        self.restart_backoff_base = int(os.getenv("RPA_WORKER_RESTART_BACKOFF_SECONDS", "10"))
+        self.restart_backoff_max = int(os.getenv("RPA_WORKER_RESTART_BACKOFF_MAX_SECONDS", "300"))
+        self.healthy_after_seconds = int(os.getenv("RPA_WORKER_HEALTHY_AFTER_SECONDS", "600"))
+        self.metrics_port = int(
+            os.getenv("METRICS_PORT") or app_metrics.DEFAULT_PORTS[service]
+        )
+        self.metrics_worker_port_base = int(
+            os.getenv("METRICS_WORKER_PORT_BASE") or app_metrics.DEFAULT_WORKER_PORT_BASES[service]
+        )
+        # spawn em todas as plataformas: fork herdaria threads de logging e
+        # conexões abertas do supervisor.
+        self._context = multiprocessing.get_context("spawn")
+        self._budget = self._context.BoundedSemaphore(self.chrome_budget)
+        self._stop_event = self._context.Event()
+        self._slots = [_WorkerSlot(index) for index in range(1, self.workers + 1)]
+        self._host = socket.gethostname()
+        # Com mais de um worker, RPA_CHROME_PROFILE_DIR vira a raiz dos perfis
+        # persistentes: cada worker usa <RPA_CHROME_PROFILE_DIR>/<worker_id>.
+        self.profile_dir = os.getenv("RPA_CHROME_PROFILE_DIR")
+        self._perfil_por_worker = bool(self.profile_dir) and self.workers > 1
+
+    def run_forever(self):
+        logging.info(
+            "🏭 Pool do %s com %s worker(s) e orçamento de %s Chrome(s).",
+            self.service,
+            self.workers,
+            self.chrome_budget,
+        )
+        if self._perfil_por_worker:
+            logging.info(
+                "🗂️ %s workers com perfil persistente: cada um usa %s/<worker_id>.",
+                self.workers,
+                self.profile_dir,
+            )
+        database.inicializar_banco()
+        app_metrics.iniciar_servidor(self.service, port=self.metrics_port)
+
+        try:
+            while not self._stop_event.is_set():
+                self._supervisionar()
+                self._stop_event.wait(self.supervise_interval)
+        finally:
+            self.stop()
+
+    def stop(self, timeout=60):
+        self._stop_event.set()
+        for slot in self._slots:
+            if slot.process is None:
+                continue
+            slot.process.join(timeout)
+            if slot.process.is_alive():
+                logging.warning(
+                    "🔪 Worker %s não encerrou em %ss. Forçando término.",
+                    self._worker_id(slot),
+                    timeout,
+                )
+                slot.process.terminate()
+                slot.process.join(10)
+                self.runner_cls.liberar_reservas_de(self._worker_id(slot))
+
+    def _supervisionar(self):
+        agora = time.monotonic()
+        for slot in self._slots:
+            if slot.process is not None and slot.process.is_alive():
+                if slot.restarts and agora - slot.started_at >= self.healthy_after_seconds:
+                    slot.restarts = 0
+                continue
+
+            if slot.process is not None:
+                self._registrar_queda(slot, agora)
+
+            if agora >= slot.next_start_at:
+                self._iniciar(slot)
+
+    def _registrar_queda(self, slot, agora):
+        exitcode = slot.process.exitcode
+        worker_id = self._worker_id(slot)
+        slot.process = None
+        slot.restarts += 1
+        delay = min(
+            self.restart_backoff_max,
+            self.restart_backoff_base * (2 ** (slot.restarts - 1)),
+        )
+        slot.next_start_at = agora + delay
+        # O worker morto pode ter deixado lote reservado, Chrome órfão e vaga
+        # presa no semáforo; nada disso pode esperar o lease expirar.
+        self.runner_cls.liberar_reservas_de(worker_id)
+        BrowserFactory._kill_chrome_tree(
+            Path(tempfile.gettempdir()) / _profile_prefix(worker_id)
+        )
+        if self._perfil_por_worker:
+            BrowserFactory._kill_chrome_tree(
+                Path(self.profile_dir).expanduser().resolve() / worker_id
+            )
+        if slot.holding_flag is not None and slot.holding_flag.value:
+            slot.holding_flag.value = 0
+            self._budget.release()
+        logging.warning(
+            "💥 Worker %s caiu (exitcode=%s). Reiniciando em %ss (queda %s).",
+            worker_id,
+            exitcode,
+            delay,
+            slot.restarts,
+        )
+
+    def _iniciar(self, slot):
+        worker_id = self._worker_id(slot)
+        slot.holding_flag = self._context.Value("b", 0)
+        slot.process = self._context.Process(
+            target=_executar_worker,
+            args=(
+                worker_id,
+                self._budget,
+                slot.holding_flag,
+                self._stop_event,
+                self.idle_seconds,
+                self.metrics_worker_port_base + slot.index,
+                self.runner_cls,
+                self.service,
+                worker_id if self._perfil_por_worker else None,
+            ),
+            name=f"{self.service}-{worker_id}",
+            daemon=False,
+        )
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        logging.info("🚀 Worker %s iniciado no pid %s.", worker_id, slot.process.pid)
+
+    def _worker_id(self, slot):
+        if self.service == "processador":
+            return f"{self._host}-w{slot.index}"
+        return f"{self._host}-{self.service}{slot.index}"
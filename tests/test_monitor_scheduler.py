@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from rpa import monitor_scheduler
+from rpa.monitor_scheduler import MonitorScheduler
+
+
+AGORA = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setenv("RPA_MONITOR_MIN_INTERVAL_MINUTES", "30")
+    monkeypatch.setenv("RPA_MONITOR_MAX_INTERVAL_MINUTES", "1440")
+    monkeypatch.setenv("RPA_MONITOR_DEFAULT_INTERVAL_MINUTES", "240")
+    monkeypatch.setenv("RPA_MONITOR_DEADLINE_FRACTION", "0.1")
+    monkeypatch.setenv("RPA_MONITOR_SCHEDULE_JITTER", "0.1")
+    return MonitorScheduler()
+
+
+def _solicitado(data_limite):
+    return {"estado": "Solicitado", "data_limite": data_limite}
+
+
+def test_sem_prazo_nem_historico_usa_padrao_suavizado(scheduler):
+    assert scheduler.intervalo_minutos([], agora=AGORA) == pytest.approx(240 * 0.625)
+
+
+def test_prazo_em_ate_um_dia_usa_minimo(scheduler):
+    assert scheduler.intervalo_minutos([_solicitado("01/01/2026")], agora=AGORA) == 30
+
+
+def test_prazo_distante_usa_fracao_do_restante(scheduler):
+    # Prazo vale até o fim de 11/01: 10,5 dias a partir de AGORA.
+    esperado = 10.5 * 24 * 60 * 0.1 * 0.625
+    assert scheduler.intervalo_minutos([_solicitado("11/01/2026")], agora=AGORA) == pytest.approx(esperado)
+
+
+def test_ignora_itens_que_nao_estao_solicitados(scheduler):
+    subsidios = [{"estado": "Enviado", "data_limite": "01/01/2026"}, _solicitado("data inválida")]
+    assert scheduler.prazo_mais_proximo(subsidios) is None
+
+
+def test_historico_de_mudancas_encurta_o_intervalo(scheduler):
+    muda_sempre = scheduler.intervalo_minutos([], verificacoes=8, mudancas=8, agora=AGORA)
+    nunca_muda = scheduler.intervalo_minutos([], verificacoes=98, mudancas=0, agora=AGORA)
+    assert muda_sempre == pytest.approx(240 * 0.325)
+    assert nunca_muda == pytest.approx(240 * 0.9925)
+
+
+def test_intervalo_respeita_o_maximo(scheduler):
+    assert scheduler.intervalo_minutos([_solicitado("01/12/2026")], agora=AGORA) == 1440
+
+
+def test_jitter_nao_ultrapassa_os_limites(scheduler, monkeypatch):
+    subsidios = [_solicitado("01/12/2026")]
+
+    monkeypatch.setattr(monitor_scheduler.random, "uniform", lambda a, b: b)
+    assert scheduler.proxima_verificacao(subsidios, agora=AGORA) == AGORA + timedelta(minutes=1440)
+
+    monkeypatch.setattr(monitor_scheduler.random, "uniform", lambda a, b: a)
+    vencido = [_solicitado("01/01/2026")]
+    assert scheduler.proxima_verificacao(vencido, agora=AGORA) == AGORA + timedelta(minutes=30)
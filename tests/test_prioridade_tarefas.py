@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+from utils import prioridade_tarefas
+from utils.prioridade_tarefas import calcular_prioridade, interpretar_data, prazo_mais_proximo
+
+
+AGORA = datetime(2026, 3, 10, 12, 0, tzinfo=timezone.utc)
+PREPOSTO = (28, 984)  # Solicitar Preposto
+PLANILHA = (28, 936)  # Apresentar Planilha
+
+
+def test_peso_do_tipo_e_padrao_para_tipo_desconhecido():
+    assert calcular_prioridade(*PREPOSTO, agora=AGORA) == 100
+    assert calcular_prioridade(*PLANILHA, agora=AGORA) == 20
+    assert calcular_prioridade(99, 999, agora=AGORA) == prioridade_tarefas.PESO_PADRAO
+
+
+def test_idade_soma_pontos_por_dia_com_teto():
+    tres_dias = calcular_prioridade(*PLANILHA, criada_em=AGORA - timedelta(days=3), agora=AGORA)
+    assert tres_dias == 20 + 3 * prioridade_tarefas.PONTOS_POR_DIA_IDADE
+
+    antiga = calcular_prioridade(*PLANILHA, criada_em=AGORA - timedelta(days=3650), agora=AGORA)
+    assert antiga == 20 + prioridade_tarefas.PONTOS_IDADE_MAX
+
+
+def test_tarefa_criada_no_futuro_nao_perde_pontos():
+    assert calcular_prioridade(*PLANILHA, criada_em=AGORA + timedelta(days=2), agora=AGORA) == 20
+
+
+def test_degraus_de_prazo():
+    def com_prazo(dias):
+        return calcular_prioridade(*PLANILHA, prazo=AGORA + timedelta(days=dias), agora=AGORA) - 20
+
+    assert com_prazo(-5) == 100
+    assert com_prazo(0) == 100
+    assert com_prazo(3) == 60
+    assert com_prazo(7) == 30
+    assert com_prazo(15) == 10
+    assert com_prazo(16) == 0
+
+
+def test_prazo_proximo_passa_na_frente_do_tipo():
+    planilha_vencendo = calcular_prioridade(*PLANILHA, prazo="10/03/2026", agora=AGORA)
+    preposto_sem_prazo = calcular_prioridade(*PREPOSTO, agora=AGORA)
+    assert planilha_vencendo > preposto_sem_prazo
+
+
+def test_interpretar_data_aceita_iso_e_formato_do_portal():
+    assert interpretar_data("2026-03-10T08:00:00Z") == datetime(2026, 3, 10, 8, 0, tzinfo=timezone.utc)
+    assert interpretar_data("10/03/2026") == datetime(2026, 3, 10, tzinfo=timezone.utc)
+    assert interpretar_data("") is None
+    assert interpretar_data("sem data") is None
+
+
+def test_prazo_mais_proximo_ignora_datas_invalidas():
+    assert prazo_mais_proximo(["20/03/2026", None, "xx", "2026-03-12"]) == datetime(
+        2026, 3, 12, tzinfo=timezone.utc
+    )
+    assert prazo_mais_proximo([None, ""]) is None
@@ -0,0 +1,53 @@
+import pytest
+
+from utils import subsidio_matching
+from utils.benchmark_subsidio_matching import gerar_processo, parear_indexado, parear_legado
+
+
+@pytest.mark.parametrize("tamanho", [0, 1, 10, 250])
+@pytest.mark.parametrize("seed", [1, 42])
+def test_pareamento_indexado_igual_a_varredura_linear(tamanho, seed):
+    antigos, novos = gerar_processo(tamanho, seed=seed)
+    assert parear_indexado(antigos, novos) == parear_legado(antigos, novos)
+
+
+def test_duplicados_consomem_candidatos_na_ordem_original():
+    antigos = [
+        {"tipo": "Doc", "item": "Contrato", "data_limite": "01/02/2026", "estado": "Solicitado"},
+        {"tipo": "Doc", "item": "Contrato", "data_limite": "01/02/2026", "estado": "Solicitado"},
+        {"tipo": "Doc", "item": "Contrato", "data_limite": "01/02/2026", "estado": "Solicitado"},
+    ]
+    novos = [
+        {"tipo": "Outro", "item": "Contrato", "data_limite": "01/02/2026"},
+        {"tipo": " doc ", "item": "CONTRATO", "data_limite": "01/02/2026"},
+        {"tipo": "Doc", "item": "contrato", "data_limite": " 01/02/2026"},
+    ]
+    assert parear_indexado(antigos, novos) == parear_legado(antigos, novos) == [1, 2, None]
+
+
+def test_filtro_ignora_antigos_nao_solicitados():
+    antigos = [
+        {"tipo": "Doc", "item": "A", "data_limite": "", "estado": "Concluído"},
+        {"tipo": "Doc", "item": "A", "data_limite": "", "estado": "Solicitado"},
+    ]
+    novos = [{"tipo": "Doc", "item": "A", "data_limite": ""}]
+    pares = list(
+        subsidio_matching.parear(
+            antigos,
+            novos,
+            filtro=lambda item: subsidio_matching.normalizar_texto(item.get("estado")) == "SOLICITADO",
+        )
+    )
+    assert pares == [(antigos[1], 0, novos[0])]
+
+
+def test_indice_com_chave_exata_nao_normaliza_caixa():
+    indice = subsidio_matching.IndiceSubsidios(
+        [{"tipo": "Doc", "item": "contrato", "data_limite": "01/02/2026"}],
+        subsidio_matching.chave_subsidio_exata,
+    )
+    assert indice.consumir_correspondente({"tipo": "Doc", "item": "Contrato", "data_limite": "01/02/2026"}) == (
+        None,
+        None,
+    )
+    assert indice.consumir_correspondente({"tipo": " Doc", "item": "contrato ", "data_limite": "01/02/2026"})[0] == 0
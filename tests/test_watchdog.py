@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from rpa.exceptions import TaskDeadlineExceededError
+from rpa.watchdog import WatchdogTarefa
+
+
+class FabricaFalsa:
+    def __init__(self):
+        self.chamadas = []
+        self.browser_fechado = threading.Event()
+
+    def abortar_comandos(self, driver):
+        self.chamadas.append(("abortar_comandos", driver))
+
+    def close_browser(self, driver):
+        self.chamadas.append(("close_browser", driver))
+        self.browser_fechado.set()
+
+
+def test_escalonamento_em_dois_estagios():
+    driver = object()
+    fabrica = FabricaFalsa()
+    estouros = []
+    watchdog = WatchdogTarefa(
+        lambda: driver,
+        fabrica,
+        robo="teste",
+        ao_estourar=lambda: estouros.append(True),
+        prazo_segundos=0.2,
+        carencia_segundos=0.2,
+    )
+
+    with pytest.raises(TaskDeadlineExceededError):
+        with watchdog.prazo("CNJ-1"):
+            assert fabrica.browser_fechado.wait(5)
+            # Depois do último estágio o thread segue vivo, esperando a tarefa sair.
+            assert watchdog._thread.is_alive()
+            assert watchdog.restante() == 0.0
+            watchdog.verificar()
+
+    assert fabrica.chamadas == [("abortar_comandos", driver), ("close_browser", driver)]
+    assert estouros == [True]
+    assert watchdog._thread.is_alive()
+
+
+def test_tarefa_dentro_do_prazo_nao_escala():
+    fabrica = FabricaFalsa()
+    watchdog = WatchdogTarefa(lambda: object(), fabrica, robo="teste", prazo_segundos=5, carencia_segundos=5)
+
+    with watchdog.prazo("CNJ-2"):
+        watchdog.verificar()
+
+    assert fabrica.chamadas == []
+    assert watchdog.restante() is None
@@ -449,14 +449,18 @@ class Chrome(selenium.webdriver.chrome.webdriver.WebDriver):
                 options.binary_location, *options.arguments
             )
         else:
+            # own session/process group: the whole browser tree can be
+            # signalled at once with killpg(browser_pid)
             browser = subprocess.Popen(
                 [options.binary_location, *options.arguments],
                 stdin=subprocess.PIPE,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 close_fds=IS_POSIX,
+                start_new_session=IS_POSIX,
             )
             self.browser_pid = browser.pid
+            self.browser_process = browser
 
 
         service = selenium.webdriver.chromium.service.ChromiumService(
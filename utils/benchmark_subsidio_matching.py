@@ -0,0 +1,132 @@
+"""Micro-benchmark do pareamento de subsídios (utils.subsidio_matching).
+
+Compara a varredura linear antiga (a mesma lógica de
+`MonitorRPARunner._buscar_correspondente_novo` antes do índice) com o
+pareamento indexado, em processos sintéticos, e confere que os dois
+produzem exatamente os mesmos pares.
+
+Uso:
+    python -m utils.benchmark_subsidio_matching
+    python -m utils.benchmark_subsidio_matching --tamanhos 1000 10000 --sem-legado-acima 5000
+"""
+
+import argparse
+import random
+import time
+
+from utils import subsidio_matching
+
+
+ESTADOS = ["Solicitado", "Concluído", "Em análise", "Excluído"]
+
+
+def gerar_processo(tamanho, *, seed=42, taxa_alteracao=0.1):
+    """Lista antiga e nova com `tamanho` itens; ~10% mudam de estado e a nova vem embaralhada."""
+    rng = random.Random(seed)
+    antigos = []
+    for indice in range(tamanho):
+        antigos.append(
+            {
+                "tipo": f"Tipo {indice % 37}",
+                "item": f"Documento  {indice % 211}",
+                "estado": "Solicitado" if indice % 3 else rng.choice(ESTADOS),
+                "data_limite": f"{1 + indice % 28:02d}/{1 + indice % 12:02d}/2026",
+            }
+        )
+
+    novos = []
+    for antigo in antigos:
+        novo = dict(antigo)
+        # Variações de caixa/espaço que a normalização precisa absorver.
+        novo["item"] = f" {antigo['item'].lower()} "
+        if rng.random() < taxa_alteracao:
+            novo["estado"] = rng.choice(ESTADOS)
+        novos.append(novo)
+    rng.shuffle(novos)
+    return antigos, novos
+
+
+def _normalizar_texto_legado(valor):
+    return " ".join(str(valor or "").split()).upper()
+
+
+def _campos_equivalentes_legado(valor_a, valor_b):
+    return _normalizar_texto_legado(valor_a) == _normalizar_texto_legado(valor_b)
+
+
+def parear_legado(antigos, novos):
+    pares = []
+    usados = set()
+    for antigo in antigos:
+        if _normalizar_texto_legado(antigo.get("estado")) != "SOLICITADO":
+            continue
+        encontrado = None
+        for indice, item in enumerate(novos):
+            if indice in usados:
+                continue
+            if (
+                _campos_equivalentes_legado(item.get("tipo"), antigo.get("tipo"))
+                and _campos_equivalentes_legado(item.get("item"), antigo.get("item"))
+                and _campos_equivalentes_legado(item.get("data_limite"), antigo.get("data_limite"))
+            ):
+                encontrado = indice
+                break
+        if encontrado is not None:
+            usados.add(encontrado)
+        pares.append(encontrado)
+    return pares
+
+
+def parear_indexado(antigos, novos):
+    return [
+        posicao
+        for _, posicao, _ in subsidio_matching.parear(
+            antigos,
+            novos,
+            filtro=lambda item: subsidio_matching.normalizar_texto(item.get("estado")) == "SOLICITADO",
+        )
+    ]
+
+
+def _cronometrar(func, *args, repeticoes=1):
+    melhor = None
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = func(*args)
+        duracao = time.perf_counter() - inicio
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    return melhor, resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument(
+        "--sem-legado-acima",
+        type=int,
+        default=10000,
+        help="não roda a varredura antiga acima deste tamanho (ela é O(n·m))",
+    )
+    args = parser.parse_args(argv)
+
+    print(f"{'itens':>8} {'legado (s)':>12} {'indexado (s)':>13} {'ganho':>8}")
+    for tamanho in args.tamanhos:
+        antigos, novos = gerar_processo(tamanho)
+        tempo_indexado, pares_indexados = _cronometrar(
+            parear_indexado, antigos, novos, repeticoes=3
+        )
+
+        if tamanho > args.sem_legado_acima:
+            print(f"{tamanho:>8} {'-':>12} {tempo_indexado:>13.4f} {'-':>8}")
+            continue
+
+        tempo_legado, pares_legado = _cronometrar(parear_legado, antigos, novos)
+        if pares_legado != pares_indexados:
+            raise SystemExit(f"❌ Pareamentos divergentes para {tamanho} itens.")
+        ganho = tempo_legado / tempo_indexado if tempo_indexado else float("inf")
+        print(f"{tamanho:>8} {tempo_legado:>12.4f} {tempo_indexado:>13.4f} {ganho:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Prioridade das tarefas do Legal One na fila do processador.
+
+Calculada uma vez, na ingestão (`apexFluxoLegalOne`), a partir de três
+componentes:
+
+- peso do tipo de tarefa (Solicitar Preposto passa na frente de Apresentar
+  Planilha);
+- idade da tarefa no Legal One (pontos por dia, com teto);
+- prazo mais próximo conhecido (`endDateTime` da tarefa ou `data_limite`
+  dos subsídios já coletados do processo): quanto mais perto, mais pontos.
+
+O banco transforma a prioridade em posição na fila (`ordem_fila`), com
+envelhecimento: cada ponto vale alguns minutos de espera, então trabalho de
+baixa prioridade continua andando.
+
+Sem dependências do Selenium nem do banco.
+"""
+
+import os
+from datetime import datetime, timezone
+
+
+PESO_PADRAO = 50
+
+# (typeId, subTypeId) -> peso. Mesmos tipos de `apexFluxoLegalOne.TIPOS_TAREFA`.
+PESOS_TIPO = {
+    (28, 984): 100,  # Solicitar Preposto
+    (15, 856): 80,  # Solicitar Subsídio
+    (13, 843): 80,  # Solicitar Subsídio
+    (20, 975): 60,  # Obrigação de Fazer Complexa
+    (20, 1139): 60,  # Obrigação de Fazer Simples
+    (26, 1131): 40,  # Solicitar Monitoramento
+    (28, 936): 20,  # Apresentar Planilha
+}
+
+PONTOS_POR_DIA_IDADE = int(os.getenv("RPA_TASK_PRIORITY_AGE_POINTS_PER_DAY", "2"))
+PONTOS_IDADE_MAX = int(os.getenv("RPA_TASK_PRIORITY_AGE_MAX_POINTS", "40"))
+
+# (dias até o prazo, pontos): o primeiro degrau que couber vale.
+DEGRAUS_PRAZO = (
+    (0, 100),  # vencido ou vence hoje
+    (3, 60),
+    (7, 30),
+    (15, 10),
+)
+
+
+def peso_tipo(type_id, sub_type_id):
+    return PESOS_TIPO.get((type_id, sub_type_id), PESO_PADRAO)
+
+
+def interpretar_data(valor):
+    """Aceita ISO 8601 (API do Legal One) ou dd/mm/aaaa (portal). Retorna datetime UTC ou None."""
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        data = valor
+    else:
+        texto = str(valor).strip()
+        data = None
+        try:
+            data = datetime.fromisoformat(texto.replace("Z", "+00:00"))
+        except ValueError:
+            try:
+                data = datetime.strptime(texto[:10], "%d/%m/%Y")
+            except ValueError:
+                return None
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data
+
+
+def prazo_mais_proximo(datas):
+    """Menor data válida entre `datas` (strings ou datetimes), ou None."""
+    validas = [data for data in map(interpretar_data, datas) if data is not None]
+    return min(validas) if validas else None
+
+
+def calcular_prioridade(type_id, sub_type_id, *, criada_em=None, prazo=None, agora=None):
+    agora = agora or datetime.now(timezone.utc)
+    prioridade = peso_tipo(type_id, sub_type_id)
+
+    criada_em = interpretar_data(criada_em)
+    if criada_em is not None:
+        dias = max(0, (agora - criada_em).days)
+        prioridade += min(PONTOS_IDADE_MAX, dias * PONTOS_POR_DIA_IDADE)
+
+    prazo = interpretar_data(prazo)
+    if prazo is not None:
+        dias_restantes = (prazo.date() - agora.date()).days
+        for limite, pontos in DEGRAUS_PRAZO:
+            if dias_restantes <= limite:
+                prioridade += pontos
+                break
+
+    return prioridade
@@ -0,0 +1,71 @@
+"""Pareamento de subsídios antigos x novos por chave normalizada.
+
+Em vez de varrer a lista nova para cada subsídio antigo (O(n·m), com
+normalização de texto a cada comparação), cada lista é indexada uma vez por
+chave e o pareamento consome os candidatos na ordem original: o resultado é
+o mesmo da varredura linear — o primeiro item ainda não usado com a mesma
+chave —, em O(n+m).
+
+Sem dependências do Selenium: usado pelo monitor (rpa) e pelo bd.
+"""
+
+from collections import defaultdict, deque
+
+
+def normalizar_texto(valor):
+    return " ".join(str(valor or "").split()).upper()
+
+
+def chave_subsidio(item):
+    """Chave de correspondência do monitor: tipo, item e data limite normalizados."""
+    return (
+        normalizar_texto(item.get("tipo")),
+        normalizar_texto(item.get("item")),
+        normalizar_texto(item.get("data_limite")),
+    )
+
+
+def chave_subsidio_exata(item):
+    """Chave usada na gravação: só `strip`, preservando caixa e espaços internos."""
+    return (
+        (item.get("tipo") or "").strip(),
+        (item.get("item") or "").strip(),
+        (item.get("data_limite") or "").strip(),
+    )
+
+
+class IndiceSubsidios:
+    """Índice consumível de uma lista de subsídios.
+
+    `consumir(chave)` devolve `(posicao, item)` do primeiro item ainda não
+    consumido com aquela chave, ou `(None, None)`.
+    """
+
+    def __init__(self, itens, chave=chave_subsidio):
+        self.chave = chave
+        self._fila_por_chave = defaultdict(deque)
+        for posicao, item in enumerate(itens):
+            self._fila_por_chave[chave(item)].append((posicao, item))
+
+    def consumir(self, chave):
+        fila = self._fila_por_chave.get(chave)
+        if not fila:
+            return None, None
+        return fila.popleft()
+
+    def consumir_correspondente(self, item):
+        return self.consumir(self.chave(item))
+
+
+def parear(antigos, novos, *, filtro=None, chave=chave_subsidio):
+    """Gera `(antigo, posicao_novo, novo)` para cada antigo aceito pelo filtro.
+
+    Cada item novo é usado no máximo uma vez; `novo` é None quando não há
+    correspondência restante.
+    """
+    indice = IndiceSubsidios(novos, chave)
+    for antigo in antigos:
+        if filtro is not None and not filtro(antigo):
+            continue
+        posicao, novo = indice.consumir(chave(antigo))
+        yield antigo, posicao, novo
@@ -0,0 +1,202 @@
+"""Envio das notificações TwoTask registradas em `twotask_notificacoes`.
+
+O monitor registra as notificações (outbox) e segue coletando; o
+`TwoTaskOutboxSender` roda num thread próprio, acorda por LISTEN/NOTIFY
+quando há linhas novas e drena os lotes com retry, backoff por linha
+(`proxima_tentativa`) e chave de idempotência por lote.
+
+Os lotes são coalescidos no banco (`reivindicar_lote_notificacoes_twotask`):
+linhas de processos e ciclos diferentes dividem o mesmo POST até
+API_NOTIFICACAO_BATCH_SIZE, esperando no máximo
+API_NOTIFICACAO_BATCH_LINGER_SECONDS pela linha mais antiga.
+"""
+
+import logging
+import os
+import select
+import threading
+import time
+
+from bd import database
+
+
+def batch_dedupe_key(dedupe_keys):
+    return database.gerar_chave_lote_twotask(dedupe_keys)
+
+
+def tamanho_lote_configurado():
+    return max(1, int(os.getenv("API_NOTIFICACAO_BATCH_SIZE", "50")))
+
+
+def linger_configurado():
+    return max(0.0, float(os.getenv("API_NOTIFICACAO_BATCH_LINGER_SECONDS", "10")))
+
+
+def drenar_lotes(
+    notifier,
+    *,
+    max_tentativas,
+    reenviar_enviando_apos_minutos,
+    forcar=False,
+    deve_parar=None,
+):
+    """Reserva e envia lotes até nada mais estar pronto. Retorna quantos POSTs saíram."""
+    enviados = 0
+    while deve_parar is None or not deve_parar():
+        lote = database.reivindicar_lote_notificacoes_twotask(
+            tamanho_lote=tamanho_lote_configurado(),
+            linger_segundos=linger_configurado(),
+            max_tentativas=max_tentativas,
+            reenviar_enviando_apos_minutos=reenviar_enviando_apos_minutos,
+            forcar=forcar,
+        )
+        if not lote:
+            break
+
+        logging.info("📤 Outbox TwoTask: enviando lote com %s notificação(ões).", len(lote))
+        postar_lote(notifier, lote)
+        enviados += 1
+    return enviados
+
+
+def postar_lote(notifier, notificacoes_registradas):
+    """POST de um lote já registrado/reservado; atualiza o status das linhas."""
+    dedupe_keys = [item["_dedupe_key"] for item in notificacoes_registradas]
+    payload = [
+        {
+            "numero_processo": item["numero_processo"],
+            "id_responsavel": item["id_responsavel"],
+            "observacao": item["observacao"],
+        }
+        for item in notificacoes_registradas
+    ]
+    batch_key = batch_dedupe_key(dedupe_keys)
+
+    try:
+        try:
+            enviado = notifier(payload, idempotency_key=batch_key)
+        except TypeError:
+            enviado = notifier(payload)
+    except Exception as exc:
+        logging.exception("❌ Erro inesperado ao enviar notificações para o TwoTask.")
+        erro = str(exc)
+        if getattr(exc, "retryable", True) is False:
+            erro = f"AUTH_NON_RETRYABLE: {erro}"
+        database.marcar_notificacoes_twotask_erro(dedupe_keys, erro)
+        return False
+
+    if enviado:
+        database.marcar_notificacoes_twotask_enviadas(dedupe_keys)
+        return True
+
+    database.marcar_notificacoes_twotask_erro(
+        dedupe_keys,
+        "API TwoTask retornou falha no envio do lote",
+    )
+    return False
+
+
+class TwoTaskOutboxSender:
+    def __init__(
+        self,
+        notifier,
+        *,
+        max_tentativas=None,
+        reenviar_enviando_apos_minutos=None,
+        intervalo_poll=None,
+    ):
+        self.notifier = notifier
+        self.max_tentativas = max_tentativas or int(os.getenv("API_NOTIFICACAO_MAX_TENTATIVAS", "5"))
+        self.reenviar_enviando_apos_minutos = reenviar_enviando_apos_minutos or int(
+            os.getenv("API_NOTIFICACAO_RETRY_ENVIANDO_MINUTES", "10")
+        )
+        # Mesmo sem NOTIFY (conexão de escuta caída, linhas com backoff
+        # vencendo, lote parcial esperando o linger) o sender revisita a
+        # tabela neste intervalo.
+        self.intervalo_poll = intervalo_poll or float(
+            os.getenv("API_NOTIFICACAO_OUTBOX_POLL_SECONDS", "30")
+        )
+        if linger_configurado() > 0:
+            self.intervalo_poll = min(self.intervalo_poll, linger_configurado())
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn_escuta = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._executar, name="twotask-outbox", daemon=True)
+        self._thread.start()
+        logging.info("📮 Sender do outbox TwoTask iniciado.")
+
+    def stop(self, timeout=30):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._fechar_escuta()
+        # Lote parcial ainda no linger sai agora, em vez de esperar o
+        # próximo processo subir.
+        try:
+            drenar_lotes(
+                self.notifier,
+                max_tentativas=self.max_tentativas,
+                reenviar_enviando_apos_minutos=self.reenviar_enviando_apos_minutos,
+                forcar=True,
+            )
+        except Exception:
+            logging.exception("❌ Falha ao drenar o outbox TwoTask no encerramento.")
+
+    def drenar(self, *, forcar=False):
+        """Envia lotes até não haver mais nada pronto. Retorna quantos lotes saíram."""
+        return drenar_lotes(
+            self.notifier,
+            max_tentativas=self.max_tentativas,
+            reenviar_enviando_apos_minutos=self.reenviar_enviando_apos_minutos,
+            forcar=forcar,
+            deve_parar=self._stop.is_set,
+        )
+
+    def _executar(self):
+        while not self._stop.is_set():
+            try:
+                self.drenar()
+            except Exception:
+                logging.exception("❌ Erro no sender do outbox TwoTask.")
+            self._aguardar_notificacao()
+
+    def _aguardar_notificacao(self):
+        if self._conn_escuta is None:
+            self._conn_escuta = database.abrir_conexao_escuta()
+
+        limite = time.monotonic() + self.intervalo_poll
+        while not self._stop.is_set():
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return
+
+            if self._conn_escuta is None:
+                self._stop.wait(min(restante, 1.0))
+                continue
+
+            try:
+                prontos, _, _ = select.select([self._conn_escuta], [], [], min(restante, 1.0))
+                if not prontos:
+                    continue
+                self._conn_escuta.poll()
+                if self._conn_escuta.notifies:
+                    self._conn_escuta.notifies.clear()
+                    return
+            except Exception as exc:
+                logging.warning("⚠️ Conexão de escuta do outbox caiu. Voltando ao polling: %s", exc)
+                self._fechar_escuta()
+
+    def _fechar_escuta(self):
+        if self._conn_escuta is None:
+            return
+        try:
+            self._conn_escuta.close()
+        except Exception:
+            pass
+        self._conn_escuta = None